@@ -3,9 +3,14 @@ Flask REST API Server for XspensesAI
 """
 
 import os
+import time
 import uuid
+import hashlib
+import zipfile
+from collections import Counter
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from typing import Optional
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from loguru import logger
@@ -30,7 +35,11 @@ load_dotenv()
 from document_reader import DocumentReader
 from ai_categorizer import AICategorizer
 from learning_system import LearningSystem
+from recategorizer import Recategorizer
 from database import XspensesDatabase
+from job_queue import JobQueue
+from document_pipeline import JOB_PROCESS_DOCUMENT
+from progress_events import DocumentEvents
 from ai_chat import AIChatService
 from ephemeral_processor import ephemeral_processor
 from ephemeral_bank_processor import ephemeral_bank_processor
@@ -41,6 +50,15 @@ from ai_insight_generator import ai_insight_generator
 from legal_compliance_system import legal_compliance_system
 
 
+def parse_id(value) -> Optional[int]:
+    """Positive integer ID from a JSON value, numeric strings included; None when it isn't one"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    return value if isinstance(value, int) and value > 0 else None
+
+
 class XspensesAPIServer:
     def __init__(self):
         self.app = Flask(__name__)
@@ -57,7 +75,25 @@ class XspensesAPIServer:
         self.ai_categorizer = AICategorizer()
         logger.info("AI categorizer initialized")
         self.learning_system = LearningSystem(self.db)
+        self.learning_system.start_compaction(int(os.getenv('LEARNING_COMPACTION_INTERVAL', 3600)))
         logger.info("Learning system initialized")
+        self.job_queue = JobQueue(
+            self.db.db_path,
+            lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', 60)),
+            max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        )
+        logger.info("Job queue initialized")
+        self.document_events = DocumentEvents(
+            self.db, self.job_queue,
+            poll_interval=float(os.getenv('PROGRESS_POLL_INTERVAL', 0.5)),
+            keepalive_seconds=float(os.getenv('PROGRESS_KEEPALIVE_SECONDS', 15))
+        )
+        self.recategorizer = Recategorizer(
+            self.learning_system,
+            batch_size=int(os.getenv('RECATEGORIZE_BATCH_SIZE', 200)),
+            throttle_seconds=float(os.getenv('RECATEGORIZE_THROTTLE_SECONDS', 0.05))
+        )
+        logger.info("Re-categorizer initialized")
         self.ai_chat = AIChatService()
         logger.info("AI chat service initialized")
         
@@ -68,6 +104,8 @@ class XspensesAPIServer:
         self.app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', './uploads')
         self.app.config['MAX_FILE_SIZE'] = int(os.getenv('MAX_FILE_SIZE', 10485760))  # 10MB
         self.app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'csv', 'xlsx', 'xls', 'jpg', 'jpeg', 'png'}
+        self.app.config['MAX_BULK_FILES'] = int(os.getenv('MAX_BULK_FILES', 50))  # documents per bulk upload
+        self.app.config['UPLOAD_WAIT_SECONDS'] = float(os.getenv('UPLOAD_WAIT_SECONDS', 60))  # ?wait=extracted limit
         
         # Create upload directory
         os.makedirs(self.app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -95,7 +133,13 @@ class XspensesAPIServer:
         
         @self.app.route('/api/documents/upload', methods=['POST'])
         def upload_document():
-            """Upload and process a document"""
+            """Upload a document and queue it for processing
+            
+            With ?wait=extracted the response is held until the transactions are
+            saved and returns them pending a category; categorization goes on in
+            the background. Uploads that take longer than UPLOAD_WAIT_SECONDS
+            get the usual 202.
+            """
             logger.info("=== DOCUMENT UPLOAD REQUEST RECEIVED ===")
             
             try:
@@ -134,114 +178,44 @@ class XspensesAPIServer:
                 file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], unique_filename)
                 
                 logger.info(f"Saving file to: {file_path}")
-                file.save(file_path)
-                logger.info("File saved successfully")
-                
-                # Save to database
-                logger.info("Saving document to database...")
-                document_id = self.db.save_document(
-                    filename=unique_filename,
-                    original_filename=filename,
-                    file_path=file_path,
-                    file_size=file_size,
-                    file_type=self.get_file_extension(filename)
-                )
-                logger.info(f"Document saved to database with ID: {document_id}")
-                
-                # Update status to processing
-                logger.info("Updating document status to 'processing'...")
-                self.db.update_document_status(document_id, 'processing')
-                
-                # Process document
-                logger.info("=== STARTING DOCUMENT PROCESSING ===")
-                try:
-                    logger.info("Calling document reader...")
-                    result = self.document_reader.read_document(file_path)
-                    logger.info(f"Document reader completed. Transactions found: {result['total_transactions']}")
-                    
-                    # Save transactions
-                    logger.info("Saving transactions to database...")
-                    self.db.save_transactions(document_id, result['transactions'])
-                    logger.info(f"Saved {len(result['transactions'])} transactions")
-                    
-                    # Update document status
-                    logger.info("Updating document status to 'completed'...")
-                    self.db.update_document_status(
-                        document_id=document_id,
-                        status='completed',
-                        total_transactions=result['total_transactions'],
-                        extraction_confidence=result['extraction_confidence']
-                    )
-                    
-                    # Categorize transactions
-                    logger.info("=== STARTING TRANSACTION CATEGORIZATION ===")
-                    transactions = self.db.get_document_transactions(document_id)
-                    logger.info(f"Retrieved {len(transactions)} transactions for categorization")
-                    
-                    user_preferences = self.learning_system.get_user_preferences()
-                    logger.info(f"Retrieved user preferences: {len(user_preferences) if user_preferences else 0} items")
-                    
-                    categorized_count = 0
-                    for i, transaction in enumerate(transactions):
-                        logger.info(f"Categorizing transaction {i+1}/{len(transactions)}: {transaction.get('description', 'Unknown')}")
-                        
-                        try:
-                            # Get AI categorization
-                            logger.info("Getting AI categorization...")
-                            categorization = self.ai_categorizer.categorize_transaction(
-                                transaction, user_preferences
-                            )
-                            logger.info(f"AI categorization result: {categorization.get('category', 'Unknown')} (confidence: {categorization.get('confidence', 0)})")
-                            
-                            # Apply learning system prediction
-                            logger.info("Applying learning system...")
-                            final_category, final_confidence = self.learning_system.predict_category(
-                                transaction, 
-                                categorization['category'], 
-                                categorization['confidence']
-                            )
-                            logger.info(f"Final categorization: {final_category} (confidence: {final_confidence})")
-                            
-                            # Update transaction with categorization
-                            logger.info("Updating transaction in database...")
-                            self.db.update_transaction_category(
-                                transaction_id=transaction['id'],
-                                ai_category=final_category,
-                                ai_confidence=final_confidence
-                            )
-                            categorized_count += 1
-                            logger.info(f"Transaction {i+1} categorized successfully")
-                            
-                        except Exception as e:
-                            logger.error(f"Error categorizing transaction {i+1}: {e}")
-                            continue
-                    
-                    logger.info(f"=== CATEGORIZATION COMPLETE: {categorized_count}/{len(transactions)} transactions processed ===")
-                    
-                    response_data = {
-                        'document_id': document_id,
-                        'filename': filename,
-                        'status': 'completed',
-                        'total_transactions': result['total_transactions'],
-                        'extraction_confidence': result['extraction_confidence'],
-                        'categorized_transactions': categorized_count,
-                        'message': 'Document processed successfully'
-                    }
-                    
-                    logger.info(f"=== DOCUMENT PROCESSING COMPLETE ===")
-                    logger.info(f"Response: {response_data}")
-                    
-                    return jsonify(response_data)
-                    
-                except Exception as e:
-                    logger.error(f"=== DOCUMENT PROCESSING FAILED ===")
-                    logger.error(f"Error processing document: {e}")
-                    logger.error(f"Exception type: {type(e).__name__}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-                    
-                    self.db.update_document_status(document_id, 'failed')
-                    return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+                upload_started = time.perf_counter()
+                content_hash = self.save_upload(file, file_path)
+                upload_seconds = time.perf_counter() - upload_started
+                logger.info(f"File saved successfully in {upload_seconds:.2f}s (sha256 {content_hash})")
+                
+                # Identical content was already processed, or is being processed: reuse it
+                existing = self.document_by_hash(content_hash)
+                if existing and existing['status'] != 'completed':
+                    os.remove(file_path)
+                    entry = self.duplicate_entry(filename, existing)
+                    if request.args.get('wait') == 'extracted':
+                        extracted = self.extracted_response(entry)
+                        if extracted:
+                            return extracted
+                    return jsonify({**entry, 'message': 'Document already being processed'}), 202
+                if existing:
+                    os.remove(file_path)
+                    logger.info(f"Duplicate upload of document {existing['id']}, skipping processing")
+                    return jsonify({
+                        'document_id': existing['id'],
+                        'filename': existing['original_filename'],
+                        'status': existing['status'],
+                        'total_transactions': existing['total_transactions'],
+                        'extraction_confidence': existing['extraction_confidence'],
+                        'duplicate': True,
+                        'transactions': self.db.get_document_transactions(existing['id']),
+                        'message': 'Document already processed'
+                    })
+                
+                # Extraction and categorization run on the worker pool
+                queued = self.queue_document(unique_filename, filename, file_path, file_size, content_hash,
+                                             upload_seconds=upload_seconds)
+                
+                if request.args.get('wait') == 'extracted':
+                    extracted = self.extracted_response(queued)
+                    if extracted:
+                        return extracted
+                return jsonify({**queued, 'message': 'Document queued for processing'}), 202
                 
             except Exception as e:
                 logger.error(f"=== UPLOAD REQUEST FAILED ===")
@@ -251,32 +225,124 @@ class XspensesAPIServer:
                 logger.error(f"Traceback: {traceback.format_exc()}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/documents/bulk-upload', methods=['POST'])
+        def bulk_upload_documents():
+            """Upload several documents, or ZIP archives of them, and queue each for processing"""
+            logger.info("=== BULK UPLOAD REQUEST RECEIVED ===")
+            
+            try:
+                files = [file for file in request.files.getlist('files') if file.filename]
+                if not files:
+                    logger.error("No files provided in bulk upload")
+                    return jsonify({'error': 'No files provided'}), 400
+                if len(files) > self.app.config['MAX_BULK_FILES']:
+                    logger.error(f"Too many files in bulk upload: {len(files)}")
+                    return jsonify({'error': f"At most {self.app.config['MAX_BULK_FILES']} files per upload"}), 400
+                
+                # One batch per request: its documents share categorizations and report progress together
+                batch_id = str(uuid.uuid4())
+                entries = []
+                queued_hashes = {}  # content hash -> document queued by this request
+                for file in files:
+                    filename = secure_filename(file.filename)
+                    if self.get_file_extension(filename) == 'zip':
+                        entries.extend(self.queue_archive(file, filename, batch_id, queued_hashes))
+                    else:
+                        entries.append(self.queue_upload(file, filename, batch_id, queued_hashes))
+                
+                queued = [entry for entry in entries if 'job_id' in entry and not entry.get('duplicate')]
+                duplicates = [entry for entry in entries if entry.get('duplicate')]
+                logger.info(f"Bulk upload {batch_id}: {len(queued)} queued, {len(duplicates)} duplicates, "
+                            f"{len(entries) - len(queued) - len(duplicates)} rejected")
+                
+                return jsonify({
+                    'batch_id': batch_id,
+                    'status_url': f"/api/batches/{batch_id}",
+                    'queued': len(queued),
+                    'duplicates': len(duplicates),
+                    'rejected': len(entries) - len(queued) - len(duplicates),
+                    'files': entries
+                }), 202
+                
+            except Exception as e:
+                logger.error(f"Error in bulk upload: {e}")
+                import traceback
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/batches/<batch_id>', methods=['GET'])
+        def get_batch(batch_id):
+            """Per-file processing progress of a bulk upload"""
+            documents = self.db.get_batch_documents(batch_id)
+            if not documents:
+                return jsonify({'error': 'Batch not found'}), 404
+            
+            jobs = self.job_queue.latest_for_documents([document['id'] for document in documents])
+            files = []
+            for document in documents:
+                job = jobs.get(document['id']) or {}
+                files.append({
+                    'document_id': document['id'],
+                    'filename': document['original_filename'],
+                    'status': document['status'],
+                    'job_id': job.get('job_id'),
+                    'stage': job.get('stage'),
+                    'progress': job.get('progress', 0.0),
+                    'details': job.get('details'),
+                    'error': job.get('error'),
+                    'total_transactions': document['total_transactions']
+                })
+            
+            counts = Counter(file['status'] for file in files)
+            finished = counts['completed'] + counts['failed']
+            return jsonify({
+                'batch_id': batch_id,
+                'status': 'completed' if finished == len(files) else 'processing',
+                'progress': sum(1.0 if file['status'] == 'completed' else file['progress'] or 0.0
+                                for file in files) / len(files),
+                'counts': dict(counts),
+                'files': files
+            })
+        
         @self.app.route('/api/documents/<int:document_id>', methods=['GET'])
         def get_document(document_id):
             """Get document details"""
             try:
-                # Get document info from database
-                with self.db.db_path as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT * FROM documents WHERE id = ?', (document_id,))
-                    document = cursor.fetchone()
-                
+                document = self.db.get_document(document_id)
                 if not document:
                     return jsonify({'error': 'Document not found'}), 404
                 
+                counts = self.db.count_document_transactions(document_id)
+                job = self.job_queue.latest_for_documents([document_id]).get(document_id) or {}
                 return jsonify({
-                    'id': document[0],
-                    'filename': document[2],  # original_filename
-                    'status': document[6],
-                    'total_transactions': document[7],
-                    'extraction_confidence': document[8],
-                    'created_at': document[9]
+                    'id': document['id'],
+                    'filename': document['original_filename'],
+                    'status': document['status'],
+                    'total_transactions': document['total_transactions'],
+                    'extraction_confidence': document['extraction_confidence'],
+                    'transactions_categorized': counts['categorized'],
+                    'transactions_pending': counts['total'] - counts['categorized'],
+                    'job_id': job.get('job_id'),
+                    'created_at': document['created_at']
                 })
                 
             except Exception as e:
                 logger.error(f"Error getting document {document_id}: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/documents/<int:document_id>/events', methods=['GET'])
+        def stream_document_events(document_id):
+            """Stream a document's processing stages, progress and transactions as server-sent events"""
+            if not self.db.get_document(document_id):
+                return jsonify({'error': 'Document not found'}), 404
+            
+            events = self.document_events.stream(document_id, request.headers.get('Last-Event-ID'))
+            return Response(
+                stream_with_context(events),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}  # no proxy buffering
+            )
+        
         @self.app.route('/api/documents/<int:document_id>/transactions', methods=['GET'])
         def get_document_transactions(document_id):
             """Get transactions for a document"""
@@ -380,45 +446,125 @@ class XspensesAPIServer:
                 if not transaction_id or not corrected_category:
                     return jsonify({'error': 'Missing transaction_id or corrected_category'}), 400
                 
-                # Get transaction details
-                with self.db.db_path as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,))
-                    transaction = cursor.fetchone()
-                
-                if not transaction:
-                    return jsonify({'error': 'Transaction not found'}), 404
+                transaction_id = parse_id(transaction_id)
+                if transaction_id is None:
+                    return jsonify({'error': 'transaction_id must be an integer'}), 400
                 
                 # Learn from correction
-                learning_result = self.learning_system.learn_from_correction(
-                    transaction={
-                        'id': transaction[0],
-                        'description': transaction[3],
-                        'amount': transaction[4],
-                        'ai_confidence': transaction[6]
-                    },
-                    original_category=transaction[5] or 'Uncategorized',
-                    corrected_category=corrected_category
-                )
+                learning_result = self.learning_system.learn_from_corrections([{
+                    'transaction_id': transaction_id,
+                    'corrected_category': corrected_category
+                }])
                 
-                # Update transaction
-                self.db.correct_transaction_category(transaction_id, corrected_category)
+                if not learning_result['corrected']:
+                    return jsonify({'error': 'Transaction not found'}), 404
+                
+                # Bring older transactions from the same merchant in line
+                job = self.recategorizer.submit(learning_result['merchant_patterns'])
                 
                 return jsonify({
                     'message': 'Categorization corrected and learned',
-                    'learning_impact': learning_result.get('impact_score', 0.0)
+                    'learning_impact': learning_result.get('impact_score', 0.0),
+                    'recategorization_job_id': job['job_id']
                 })
                 
             except Exception as e:
                 logger.error(f"Error correcting categorization: {e}")
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/categorize/correct/batch', methods=['PUT'])
+        def correct_categorization_batch():
+            """Correct many categorizations in one transaction and learn from them"""
+            try:
+                data = request.get_json()
+                corrections = data.get('corrections', [])
+                
+                if not corrections:
+                    return jsonify({'error': 'No corrections provided'}), 400
+                
+                if not all(c.get('transaction_id') and c.get('corrected_category') for c in corrections):
+                    return jsonify({'error': 'Each correction needs transaction_id and corrected_category'}), 400
+                
+                invalid = [c['transaction_id'] for c in corrections if parse_id(c['transaction_id']) is None]
+                if invalid:
+                    return jsonify({'error': 'transaction_id must be an integer', 'invalid_transaction_ids': invalid}), 400
+                corrections = [dict(c, transaction_id=parse_id(c['transaction_id'])) for c in corrections]
+                
+                learning_result = self.learning_system.learn_from_corrections(corrections)
+                
+                job = None
+                if learning_result['merchant_patterns']:
+                    job = self.recategorizer.submit(learning_result['merchant_patterns'])
+                
+                return jsonify({
+                    'message': 'Categorizations corrected and learned',
+                    'corrected': learning_result['corrected'],
+                    'patterns_updated': learning_result['patterns_updated'],
+                    'missing_transaction_ids': learning_result['missing_transaction_ids'],
+                    'learning_impact': learning_result['impact_score'],
+                    'recategorization_job_id': job['job_id'] if job else None
+                })
+                
+            except Exception as e:
+                logger.error(f"Error correcting categorizations: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/recategorize', methods=['POST'])
+        def start_recategorization():
+            """Re-apply learned preferences to historical transactions in the background"""
+            try:
+                data = request.get_json(silent=True) or {}
+                merchant_keys = data.get('merchant_keys')
+                
+                if merchant_keys is not None and not isinstance(merchant_keys, list):
+                    return jsonify({'error': 'merchant_keys must be a list'}), 400
+                
+                job = self.recategorizer.submit(merchant_keys)
+                return jsonify(job), 202
+                
+            except Exception as e:
+                logger.error(f"Error starting re-categorization: {e}")
+                return jsonify({'error': str(e)}), 500
+        
+        @self.app.route('/api/recategorize/<job_id>', methods=['GET'])
+        def get_recategorization(job_id):
+            """Get re-categorization job progress"""
+            job = self.recategorizer.get_job(job_id)
+            if not job:
+                return jsonify({'error': 'Job not found'}), 404
+            return jsonify(job)
+        
+        @self.app.route('/api/jobs/<job_id>', methods=['GET'])
+        def get_job(job_id):
+            """Get document processing job status, stage and progress"""
+            job = self.job_queue.get(job_id)
+            if not job:
+                return jsonify({'error': 'Job not found'}), 404
+            return jsonify(job)
+        
+        @self.app.route('/api/layouts', methods=['GET'])
+        def get_layouts():
+            """List registered statement layouts"""
+            templates = self.document_reader.layout_registry.list_templates()
+            return jsonify({'layouts': templates, 'total_layouts': len(templates)})
+        
+        @self.app.route('/api/layouts/<fingerprint>', methods=['DELETE'])
+        def delete_layout(fingerprint):
+            """Forget a statement layout so it is inferred again"""
+            if not self.document_reader.layout_registry.forget(fingerprint):
+                return jsonify({'error': 'Layout not found'}), 404
+            return jsonify({'message': 'Layout removed', 'fingerprint': fingerprint})
+        
         @self.app.route('/api/preferences', methods=['GET'])
         def get_preferences():
             """Get user preferences"""
             try:
                 preferences = self.learning_system.get_user_preferences()
-                return jsonify(preferences)
+                # context_features is matching state, and its open amount bounds aren't valid JSON
+                return jsonify([
+                    {key: value for key, value in pref.items() if key != 'context_features'}
+                    for pref in preferences
+                ])
                 
             except Exception as e:
                 logger.error(f"Error getting preferences: {e}")
@@ -469,31 +615,46 @@ class XspensesAPIServer:
         
         @self.app.route('/api/receipts/process', methods=['POST'])
         def process_receipt():
-            """Process receipt image and extract transaction details"""
+            """Process receipt images and extract transaction details
+
+            One image as 'file', or several as 'files', OCR'd concurrently.
+            """
+            file_paths = []
             try:
-                if 'file' not in request.files:
+                batch = 'files' in request.files
+                files = request.files.getlist('files') if batch else [request.files.get('file')]
+                if not files or files[0] is None:
                     return jsonify({'error': 'No file provided'}), 400
                 
-                file = request.files['file']
-                if file.filename == '':
-                    return jsonify({'error': 'No file selected'}), 400
-                
-                # Check file type
-                if not file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    return jsonify({'error': 'Only JPG and PNG images are supported'}), 400
-                
-                # Save file temporarily
-                filename = secure_filename(file.filename)
-                unique_filename = f"receipt_{uuid.uuid4()}_{filename}"
-                file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(file_path)
-                
-                # Process receipt
+                for file in files:
+                    if file.filename == '':
+                        return jsonify({'error': 'No file selected'}), 400
+                    
+                    # Check file type
+                    if not file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                        return jsonify({'error': 'Only JPG and PNG images are supported'}), 400
+                
+                # Save files temporarily
+                for file in files:
+                    filename = secure_filename(file.filename)
+                    unique_filename = f"receipt_{uuid.uuid4()}_{filename}"
+                    file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], unique_filename)
+                    file.save(file_path)
+                    file_paths.append(file_path)
+                
+                # Process receipts on the shared OCR workers
                 from receipt_processor import ReceiptProcessor
-                processor = ReceiptProcessor()
-                result = processor.process_receipt_image(file_path)
-                
-                if result['success']:
+                processor = ReceiptProcessor(self.document_reader.ocr_service)
+                started = time.perf_counter()
+                results = processor.process_receipt_images(file_paths)
+                elapsed = time.perf_counter() - started
+                
+                receipts = []
+                for file, result in zip(files, results):
+                    if not result['success']:
+                        receipts.append({'success': False, 'filename': file.filename, 'error': result['error']})
+                        continue
+                    
                     # Save transaction to database
                     transaction = result['transaction']
                     transaction_id = self.db.save_single_transaction(
@@ -504,25 +665,38 @@ class XspensesAPIServer:
                         confidence=transaction['confidence'],
                         source='receipt_scan'
                     )
-                    
-                    # Clean up temporary file
-                    os.remove(file_path)
-                    
-                    return jsonify({
+                    receipts.append({
                         'success': True,
+                        'filename': file.filename,
                         'transaction_id': transaction_id,
                         'transaction': transaction,
+                        'ocr_confidence': result['ocr_confidence'],
+                        'preprocessing': result['preprocessing'],
+                        'stage_seconds': result['stage_seconds'],
                         'processing_time': result['processing_time']
                     })
-                else:
+                
+                if batch:
                     return jsonify({
-                        'success': False,
-                        'error': result['error']
-                    }), 400
+                        'success': any(receipt['success'] for receipt in receipts),
+                        'receipts': receipts,
+                        'images_per_second': round(len(files) / elapsed, 2) if elapsed > 0 else None
+                    })
+                
+                receipt = receipts[0]
+                if not receipt['success']:
+                    return jsonify({'success': False, 'error': receipt['error']}), 400
+                receipt.pop('filename')
+                return jsonify(receipt)
                 
             except Exception as e:
                 logger.error(f"Error processing receipt: {e}")
                 return jsonify({'error': str(e)}), 500
+            finally:
+                # Clean up temporary files
+                for file_path in file_paths:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
 
         @self.app.route('/api/analyze-ephemeral', methods=['POST'])
         def analyze_ephemeral():
@@ -921,6 +1095,219 @@ class XspensesAPIServer:
         """Get file extension"""
         return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
 
+    def queue_document(self, stored_filename, filename, file_path, file_size, content_hash,
+                       batch_id=None, member=None, upload_seconds=None):
+        """Save a document record and queue its processing job"""
+        logger.info("Saving document to database...")
+        document_id = self.db.save_document(
+            filename=stored_filename,
+            original_filename=filename,
+            file_path=file_path,
+            file_size=file_size,
+            file_type=self.get_file_extension(filename),
+            content_hash=content_hash,
+            batch_id=batch_id
+        )
+        logger.info(f"Document saved to database with ID: {document_id}")
+        
+        payload = {'file_path': file_path}
+        if member is not None:
+            payload['member'] = member
+        if batch_id is not None:
+            payload['batch_id'] = batch_id
+        if upload_seconds is not None:
+            payload['upload_seconds'] = round(upload_seconds, 3)
+        
+        self.db.update_document_status(document_id, 'queued')
+        job = self.job_queue.enqueue(JOB_PROCESS_DOCUMENT, payload, document_id=document_id)
+        logger.info(f"Queued job {job['job_id']} for document {document_id}")
+        
+        return {
+            'document_id': document_id,
+            'job_id': job['job_id'],
+            'filename': filename,
+            'status': 'queued',
+            'status_url': f"/api/jobs/{job['job_id']}",
+            'events_url': f"/api/documents/{document_id}/events",
+            'duplicate': False
+        }
+    
+    def extracted_response(self, queued):
+        """Response with a queued upload's transactions once they're saved, None if that takes too long"""
+        document_id = queued['document_id']
+        document = self.document_events.wait_until_extracted(document_id, self.app.config['UPLOAD_WAIT_SECONDS'])
+        if document is None:
+            return None
+        
+        job = self.job_queue.latest_for_documents([document_id]).get(document_id) or {}
+        if document['status'] == 'failed':
+            return jsonify({**queued, 'status': 'failed', 'error': job.get('error')}), 422
+        
+        logger.info(f"Document {document_id} extracted, returning before categorization")
+        return jsonify({
+            **queued,
+            'job_id': job.get('job_id'),
+            'status_url': f"/api/jobs/{job.get('job_id')}",
+            'status': document['status'],
+            'total_transactions': document['total_transactions'],
+            'extraction_confidence': document['extraction_confidence'],
+            'transactions': self.db.get_document_transactions(document_id),
+            'message': 'Document extracted, categorization in progress'
+        })
+    
+    def duplicate_entry(self, filename, existing):
+        """Upload entry for a file whose content was already processed, or is queued or processing"""
+        logger.info(f"Duplicate upload of document {existing['id']}, skipping processing")
+        entry = {
+            'document_id': existing['id'],
+            'filename': filename,
+            'status': existing['status'],
+            'total_transactions': existing['total_transactions'],
+            'duplicate': True
+        }
+        if existing['status'] != 'completed':
+            # Follow the job already working on this content rather than queueing another
+            job = self.job_queue.latest_for_documents([existing['id']]).get(existing['id']) or {}
+            entry.update({
+                'job_id': job.get('job_id'),
+                'status_url': f"/api/jobs/{job.get('job_id')}",
+                'events_url': f"/api/documents/{existing['id']}/events"
+            })
+        return entry
+    
+    def document_by_hash(self, content_hash):
+        """Document with the given content that was processed or is still being processed
+
+        A document left in flight by a job that failed is marked failed and
+        passed over, so its content can be uploaded again.
+        """
+        while True:
+            existing = self.db.get_document_by_hash(content_hash)
+            if not existing or existing['status'] == 'completed':
+                return existing
+            
+            job = self.job_queue.latest_for_documents([existing['id']]).get(existing['id'])
+            if not job or job['status'] != 'failed':
+                return existing
+            logger.warning(f"Document {existing['id']} was left {existing['status']} by failed job "
+                           f"{job['job_id']}, marking it failed")
+            self.db.update_document_status(existing['id'], 'failed')
+    
+    def find_duplicate(self, content_hash, queued_hashes):
+        """Document with the same content, processed or in flight from earlier, or queued by this request"""
+        return self.document_by_hash(content_hash) or queued_hashes.get(content_hash)
+    
+    def queue_upload(self, file, filename, batch_id, queued_hashes):
+        """Save one file of a bulk upload and queue it, unless it's invalid or already processed"""
+        if not self.allowed_file(filename):
+            return {'filename': filename, 'error': 'Unsupported file type'}
+        
+        file.seek(0, 2)
+        file_size = file.tell()
+        file.seek(0)
+        if file_size > self.app.config['MAX_FILE_SIZE']:
+            return {'filename': filename, 'error': 'File too large'}
+        
+        unique_filename = f"{uuid.uuid4()}_{filename}"
+        file_path = os.path.join(self.app.config['UPLOAD_FOLDER'], unique_filename)
+        upload_started = time.perf_counter()
+        content_hash = self.save_upload(file, file_path)
+        upload_seconds = time.perf_counter() - upload_started
+        
+        existing = self.find_duplicate(content_hash, queued_hashes)
+        if existing:
+            os.remove(file_path)
+            return self.duplicate_entry(filename, existing)
+        
+        entry = self.queue_document(unique_filename, filename, file_path, file_size, content_hash, batch_id,
+                                    upload_seconds=upload_seconds)
+        queued_hashes[content_hash] = {'id': entry['document_id'], 'status': 'queued', 'total_transactions': 0}
+        return entry
+    
+    def queue_archive(self, file, filename, batch_id, queued_hashes):
+        """Save a ZIP archive of a bulk upload and queue each supported document in it
+
+        Members are hashed and later read straight from the archive, never
+        extracted to disk; the archive is kept while any of its documents is queued.
+        """
+        max_file_size = self.app.config['MAX_FILE_SIZE']
+        max_files = self.app.config['MAX_BULK_FILES']
+        
+        file.seek(0, 2)
+        archive_size = file.tell()
+        file.seek(0)
+        if archive_size > max_file_size * max_files:
+            return [{'filename': filename, 'error': 'Archive too large'}]
+        
+        archive_filename = f"{uuid.uuid4()}_{filename}"
+        archive_path = os.path.join(self.app.config['UPLOAD_FOLDER'], archive_filename)
+        self.save_upload(file, archive_path)
+        
+        entries = []
+        accepted = 0
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                members = [
+                    member for member in archive.infolist()
+                    if not member.is_dir() and not member.filename.startswith('__MACOSX/')
+                    and not os.path.basename(member.filename).startswith('.')
+                ]
+                for member in members:
+                    member_filename = secure_filename(os.path.basename(member.filename))
+                    if not self.allowed_file(member_filename):
+                        entries.append({'filename': member.filename, 'error': 'Unsupported file type'})
+                        continue
+                    if member.file_size > max_file_size:
+                        entries.append({'filename': member.filename, 'error': 'File too large'})
+                        continue
+                    if accepted >= max_files:
+                        entries.append({'filename': member.filename, 'error': 'Too many files in archive'})
+                        continue
+                    accepted += 1
+                    
+                    content_hash = self.hash_archive_member(archive, member)
+                    existing = self.find_duplicate(content_hash, queued_hashes)
+                    if existing:
+                        entries.append(self.duplicate_entry(member_filename, existing))
+                        continue
+                    
+                    entry = self.queue_document(
+                        f"{archive_filename}/{member.filename}", member_filename, archive_path,
+                        member.file_size, content_hash, batch_id, member=member.filename
+                    )
+                    queued_hashes[content_hash] = {'id': entry['document_id'], 'status': 'queued', 'total_transactions': 0}
+                    entries.append(entry)
+        
+        except zipfile.BadZipFile:
+            entries.append({'filename': filename, 'error': 'Invalid ZIP archive'})
+        
+        if not any('job_id' in entry and not entry.get('duplicate') for entry in entries):
+            os.remove(archive_path)
+        return entries
+    
+    def hash_archive_member(self, archive, member, chunk_size=1024 * 1024):
+        """SHA-256 hex digest of a ZIP member, decompressed in chunks"""
+        digest = hashlib.sha256()
+        with archive.open(member) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def save_upload(self, file, file_path, chunk_size=1024 * 1024):
+        """Stream an uploaded file to disk in chunks and return its SHA-256 hex digest"""
+        digest = hashlib.sha256()
+        with open(file_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        return digest.hexdigest()
+
     def run(self, host='0.0.0.0', port=5000, debug=True):
         """Run the Flask application"""
         logger.info(f"🚀 Starting XspensesAI API Server on {host}:{port}")
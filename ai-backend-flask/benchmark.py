@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for XspensesAI document processing hot paths
+
+Usage:
+    python benchmark.py              # run all benchmarks
+    python benchmark.py dataframe    # run a single benchmark
+"""
+
+import os
+import sys
+import time
+
+# The reader modules log to ./logs
+os.makedirs('logs', exist_ok=True)
+
+
+def _timed(func, *args, **kwargs):
+    """Run func and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _measured(func, *args):
+    """Run func and return (result, elapsed seconds, peak RSS in MB of this process)"""
+    import resource
+    result, elapsed = _timed(func, *args)
+    return result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _in_fresh_process(func, *args):
+    """_measured in a new interpreter, so the peak RSS belongs to func alone"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_measured, func, *args).result()
+
+
+def benchmark_dataframe(rows: int = 100000):
+    """Columnar DataFrame conversion against the row-by-row iterrows path"""
+    import pandas as pd
+    from document_reader import DocumentReader
+
+    print(f"=== DATAFRAME TO TRANSACTIONS ({rows} rows) ===")
+    reader = DocumentReader()
+    df = pd.DataFrame({
+        'Posted Date': [f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2023" for i in range(rows)],
+        'Description': [f"POS PURCHASE MERCHANT {i % 5000}" for i in range(rows)],
+        'Amount': [f"${(i * 37) % 90000 / 100:,.2f}" if i % 10 else f"({i % 500}.00)" for i in range(rows)],
+    })
+
+    def row_path():
+        column_mapping = reader._identify_columns(df.columns.tolist())
+        transactions = []
+        for _, row in df.iterrows():
+            transaction = reader._create_transaction_from_row(row.tolist(), column_mapping)
+            if transaction:
+                transactions.append(transaction)
+        return transactions
+
+    columnar, columnar_time = _timed(reader._parse_dataframe, df)
+    legacy, legacy_time = _timed(row_path)
+
+    print(f"iterrows:   {legacy_time * 1000:.0f} ms ({len(legacy)} transactions)")
+    print(f"Columnar:   {columnar_time * 1000:.0f} ms ({len(columnar)} transactions)")
+    print(f"Speedup:    {legacy_time / columnar_time:.1f}x")
+
+
+def benchmark_statement_text(pages: int = 200, lines_per_page: int = 50):
+    """One pass of the combined line pattern against the per-layout pattern scans"""
+    import re
+    from document_reader import DocumentReader, TRANSACTION_LINE_PATTERN
+
+    print(f"=== STATEMENT TEXT ({pages} pages x {lines_per_page} lines) ===")
+    reader = DocumentReader()
+    legacy_patterns = [
+        r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+?)\s+([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+)',
+        r'([^$]+?)\s+([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
+    ]
+
+    corpus = []
+    for page in range(pages):
+        lines = [f"FIRST BANK STATEMENT  Page {page + 1}", "Date        Description                 Amount    Balance"]
+        for i in range(page * lines_per_page, (page + 1) * lines_per_page):
+            date = f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2023"
+            amount = f"{(i * 37) % 90000 / 100:,.2f}"
+            if i % 5 == 0:
+                lines.append(f"${amount} {date} DIRECT DEPOSIT PAYROLL {i % 40}")
+            elif i % 3 == 0:
+                lines.append(f"{date}  POS PURCHASE STORE #{i % 900}  ({amount})  {(i * 91) % 500000 / 100:,.2f}")
+            else:
+                lines.append(f"{date}  CARD PURCHASE MERCHANT {i % 5000}  ${amount}")
+        lines.append("In case of errors or questions about your electronic transfers, call us.")
+        corpus.append("\n".join(lines))
+
+    def legacy_scan():
+        return sum(
+            1 for text in corpus for pattern in legacy_patterns
+            for _ in re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
+        )
+
+    def combined_scan():
+        return sum(1 for text in corpus for _ in TRANSACTION_LINE_PATTERN.finditer(text))
+
+    legacy_matches, legacy_time = _timed(legacy_scan)
+    combined_matches, combined_time = _timed(combined_scan)
+    transactions, extract_time = _timed(lambda: [t for text in corpus for t in reader._extract_from_text(text)])
+
+    print(f"Per-layout scans: {legacy_time * 1000:.0f} ms ({legacy_matches} matches)")
+    print(f"Combined pattern: {combined_time * 1000:.0f} ms ({combined_matches} matches)")
+    print(f"Speedup:          {legacy_time / combined_time:.1f}x")
+    print(f"Full extraction:  {extract_time * 1000:.0f} ms ({len(transactions)} transactions)")
+
+
+def _excel_import_baseline(path: str) -> int:
+    """Reader modules loaded and nothing read, for the RSS baseline"""
+    from document_reader import DocumentReader
+    DocumentReader()
+    return 0
+
+
+def _excel_whole_sheet(path: str) -> int:
+    """The former Excel path: one DataFrame for the whole sheet"""
+    import pandas as pd
+    from document_reader import DocumentReader
+    reader = DocumentReader()
+    return len(reader.deduplicate_transactions(reader._parse_dataframe(pd.read_excel(path))))
+
+
+def _excel_streamed(path: str) -> int:
+    """Streamed Excel path, consuming batches the way the job pipeline does"""
+    from document_reader import DocumentReader
+    return sum(len(batch) for batch in DocumentReader().iter_transactions(path))
+
+
+def _write_excel_export(path: str, rows: int, title_rows: bool):
+    """Write a bank export with openpyxl's write-only mode, optionally under a title block"""
+    from datetime import datetime
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    if title_rows:
+        sheet.append(['FIRST BANK - Account Activity'])
+        sheet.append([])
+    sheet.append(['Posted Date', 'Description', 'Amount', 'Reference'])
+    for i in range(rows):
+        sheet.append([
+            datetime(2023, i % 12 + 1, i % 28 + 1), f"POS PURCHASE MERCHANT {i % 5000}",
+            (i * 37) % 90000 / 100 * (-1 if i % 10 == 0 else 1), f"REF{i:08d}"
+        ])
+    workbook.save(path)
+
+
+def benchmark_excel(rows: int = 50000):
+    """Streamed read-only Excel rows against a whole-sheet DataFrame, time and peak memory"""
+    import tempfile
+
+    print(f"=== EXCEL EXPORT ({rows} rows) ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        # The whole-sheet path can't skip a title block, so it gets the bare table
+        export_path = os.path.join(tmp, 'export.xlsx')
+        table_path = os.path.join(tmp, 'table.xlsx')
+        _write_excel_export(export_path, rows, title_rows=True)
+        _write_excel_export(table_path, rows, title_rows=False)
+
+        _, _, baseline_rss = _in_fresh_process(_excel_import_baseline, table_path)
+        whole, whole_time, whole_rss = _in_fresh_process(_excel_whole_sheet, table_path)
+        streamed, streamed_time, streamed_rss = _in_fresh_process(_excel_streamed, export_path)
+
+    print(f"Whole sheet: {whole_time * 1000:.0f} ms, {whole_rss - baseline_rss:.0f} MB above baseline ({whole} transactions)")
+    print(f"Streamed:    {streamed_time * 1000:.0f} ms, {streamed_rss - baseline_rss:.0f} MB above baseline ({streamed} transactions)")
+
+
+def _write_statement_pdf(path: str, page_numbers, lines_per_page: int = 50):
+    """Minimal text-only statement PDF; the same page number always draws the same page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in page_numbers:
+        lines = [f"BT /F1 9 Tf 50 760 Td (FIRST BANK STATEMENT) Tj ET"]
+        for line in range(lines_per_page):
+            n = page * lines_per_page + line
+            lines.append(f"BT /F1 9 Tf 50 {740 - line * 13} Td "
+                         f"({n % 12 + 1:02d}/{n % 28 + 1:02d}/2024  PURCHASE MERCHANT {n}   ${n * 37 % 9000 / 100:.2f}) Tj ET")
+        content = '\n'.join(lines).encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b' '.join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids))
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        f.write(b''.join(b"%010d 00000 n \n" % offset for offset in offsets))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def benchmark_page_cache(pages: int = 20):
+    """PDF extraction with a cold page cache, a re-upload, and an export overlapping half its pages"""
+    import tempfile
+
+    print(f"=== PAGE CACHE ({pages}-page statement) ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['PDF_WORKERS'] = '1'  # time page extraction itself, not the fan-out
+        os.environ['PAGE_CACHE_PATH'] = os.path.join(tmp, 'page_cache.db')
+        from document_reader import DocumentReader
+        from page_cache import PageCacheStats
+        reader = DocumentReader()
+
+        statement = os.path.join(tmp, 'statement.pdf')
+        overlapping = os.path.join(tmp, 'overlapping.pdf')
+        _write_statement_pdf(statement, range(pages))
+        _write_statement_pdf(overlapping, range(pages // 2, pages + pages // 2))
+
+        for label, path in (('Cold cache', statement), ('Re-upload', statement), ('Overlapping', overlapping)):
+            stats = PageCacheStats()
+            batches, elapsed = _timed(lambda: list(reader.iter_transactions(path, cache_stats=stats)))
+            print(f"{label + ':':<13} {elapsed * 1000:6.0f} ms, {sum(map(len, batches))} transactions, "
+                  f"hit rate {stats.hit_rate:.0%}, {stats.seconds_saved * 1000:.0f} ms saved")
+
+
+def _receipt_image(number: int) -> bytes:
+    """PNG of a plain printed receipt"""
+    import io
+    from PIL import Image, ImageDraw
+
+    lines = ['CORNER MARKET', f"{number % 12 + 1:02d}/{number % 28 + 1:02d}/2024"]
+    lines += [f"ITEM {number}-{item}    {(number * 7 + item * 3) % 50 + 1}.{item * 11 % 100:02d}" for item in range(12)]
+    lines += ['SUBTOTAL    84.20', 'TAX    6.95', 'TOTAL    91.15']
+    image = Image.new('L', (600, 40 + 30 * len(lines)), 255)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((40, 20 + 30 * index), line, fill=0)
+    image = image.resize((image.width * 2, image.height * 2))  # the default bitmap font is too small to OCR
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def benchmark_ocr(images: int = 24):
+    """Throughput of OCR one image at a time in the caller against the warm worker pool"""
+    import pytesseract
+    from ocr_service import OcrService
+
+    print(f"=== OCR ({images} receipt images) ===")
+    try:
+        pytesseract.get_tesseract_version()
+    except pytesseract.TesseractNotFoundError:
+        print("Skipped: tesseract is not installed")
+        return
+    batch = [_receipt_image(number) for number in range(images)]
+
+    serial = OcrService(workers=0).recognize_batch(batch)
+    service = OcrService().start()
+    try:
+        pooled = service.recognize_batch(batch)
+    finally:
+        service.shutdown()
+    print(f"In-process:  {serial.images_per_second:5.1f} images/s")
+    print(f"Worker pool: {pooled.images_per_second:5.1f} images/s ({service.workers} workers), "
+          f"mean word confidence {sum(result.confidence for result in pooled.results) / images:.0%}")
+
+
+def _receipt_photo(path: str, noise: float = 0.0, width: int = 2268, height: int = 3024):
+    """JPEG of a receipt lying on a darker table, as a phone would photograph it"""
+    import cv2
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.integers(60, 90, (height, width)).astype(np.uint8), (31, 31), 0)
+    left, top, right, bottom = int(width * 0.28), int(height * 0.08), int(width * 0.72), int(height * 0.92)
+    image[top:bottom, left:right] = 235
+    lines = ['CORNER MARKET', '01/15/2024'] + [f"ITEM {item}      {item * 3 + 1}.{item * 7 % 100:02d}" for item in range(20)]
+    for index, line in enumerate(lines + ['TOTAL   91.15']):
+        cv2.putText(image, line, (left + 45, top + 120 + index * 100), cv2.FONT_HERSHEY_SIMPLEX, 2.0, 30, 5, cv2.LINE_AA)
+    if noise:
+        image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+
+def _fixed_preprocessing(path: str):
+    """Receipt preprocessing before it was adaptive: full-resolution denoise, threshold, close"""
+    import cv2
+    import numpy as np
+
+    gray = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2GRAY)
+    denoised = cv2.fastNlMeansDenoising(gray)
+    _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, np.ones((1, 1), np.uint8))
+
+
+def benchmark_receipt_preprocessing():
+    """Adaptive receipt preprocessing against always denoising the full-resolution photo"""
+    import tempfile
+    from document_pipeline import StageTimer
+    from receipt_processor import ReceiptProcessor
+
+    print("=== RECEIPT PREPROCESSING (2268x3024 photos) ===")
+    processor = ReceiptProcessor()
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, noise in (('Clean photo', 0.0), ('Noisy photo', 18.0)):
+            path = os.path.join(tmp, 'receipt.jpg')
+            _receipt_photo(path, noise)
+
+            _, fixed_time = _timed(_fixed_preprocessing, path)
+            timer = StageTimer()
+            (_, details), adaptive_time = _timed(processor._load_and_preprocess_image, path, timer)
+            stages = ', '.join(f"{name} {seconds * 1000:.0f}" for name, seconds in timer.seconds.items())
+            print(f"{label}: fixed {fixed_time * 1000:.0f} ms, adaptive {adaptive_time * 1000:.0f} ms "
+                  f"({fixed_time / adaptive_time:.0f}x; noise sigma {details['noise_sigma']}, "
+                  f"{'denoised' if details['denoised'] else 'not denoised'})")
+            print(f"  adaptive stages (ms): {stages}")
+
+
+BENCHMARKS = {
+    'dataframe': benchmark_dataframe,
+    'text': benchmark_statement_text,
+    'excel': benchmark_excel,
+    'page-cache': benchmark_page_cache,
+    'ocr': benchmark_ocr,
+    'receipt': benchmark_receipt_preprocessing,
+}
+
+
+def main():
+    """Run the requested benchmarks"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (available: {', '.join(BENCHMARKS)})")
+            sys.exit(1)
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()
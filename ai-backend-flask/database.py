@@ -4,11 +4,42 @@ SQLite Database for XspensesAI - Stores user preferences and learning data
 
 import sqlite3
 import json
+import re
+import hashlib
+from collections import defaultdict
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 import os
 from loguru import logger
 
+MERCHANT_PREFIX_PATTERN = re.compile(r'^(POS|PURCHASE|PAYMENT|DEBIT|CREDIT)\s+')
+MERCHANT_SUFFIX_PATTERN = re.compile(r'\s+(LLC|INC|CORP|CO|LTD)$')
+
+# Category status of a transaction: saved by extraction, or given a category since
+CATEGORY_PENDING = 'pending_category'
+CATEGORY_DONE = 'categorized'
+
+
+def extract_merchant_key(description: str) -> str:
+    """Normalized merchant key shared by stored transactions and learned preferences"""
+    if not description:
+        return ""
+    
+    # First few words as merchant pattern
+    pattern = ' '.join(description.strip().upper().split()[:3])
+    
+    # Remove common prefixes/suffixes
+    pattern = MERCHANT_PREFIX_PATTERN.sub('', pattern)
+    pattern = MERCHANT_SUFFIX_PATTERN.sub('', pattern)
+    
+    return pattern.strip()
+
+
+def transaction_row_key(transaction_date: Optional[str], description: Optional[str], amount) -> str:
+    """Key of a transaction within its document, the same fields the reader deduplicates on"""
+    key = f"{transaction_date}\x1f{(description or '').strip()}\x1f{float(amount or 0)!r}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
 
 class XspensesDatabase:
     def __init__(self, db_path: str = "./data/xspensesai.db"):
@@ -31,6 +62,7 @@ class XspensesDatabase:
                     file_path TEXT NOT NULL,
                     file_size INTEGER NOT NULL,
                     file_type TEXT NOT NULL,
+                    content_hash TEXT,
                     status TEXT DEFAULT 'uploaded',
                     total_transactions INTEGER DEFAULT 0,
                     extraction_confidence REAL DEFAULT 0.0,
@@ -45,6 +77,7 @@ class XspensesDatabase:
                     document_id INTEGER,
                     transaction_date TEXT NOT NULL,
                     description TEXT NOT NULL,
+                    merchant_key TEXT,
                     amount REAL NOT NULL,
                     ai_category TEXT,
                     ai_confidence REAL DEFAULT 0.0,
@@ -86,48 +119,233 @@ class XspensesDatabase:
                 )
             ''')
             
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_user_preferences_merchant_pattern
+                ON user_preferences (merchant_pattern)
+            ''')
+            
+            # Databases created before merchant_key was persisted
+            cursor.execute('PRAGMA table_info(transactions)')
+            if 'merchant_key' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE transactions ADD COLUMN merchant_key TEXT')
+            self._backfill_merchant_keys(cursor)
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transactions_merchant_key
+                ON transactions (merchant_key)
+            ''')
+            
+            # Progress streams page through a document's transactions by ID
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_transactions_document_id
+                ON transactions (document_id, id)
+            ''')
+            
+            # Extraction saves by row key, so a resumed job can't save a transaction twice
+            cursor.execute('PRAGMA table_info(transactions)')
+            if 'row_key' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE transactions ADD COLUMN row_key TEXT')
+            
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_row_key
+                ON transactions (document_id, row_key) WHERE row_key IS NOT NULL
+            ''')
+            self._backfill_row_keys(cursor)
+            
+            # Databases created before uploads were hashed
+            cursor.execute('PRAGMA table_info(documents)')
+            if 'content_hash' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE documents ADD COLUMN content_hash TEXT')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_documents_content_hash
+                ON documents (content_hash)
+            ''')
+            
+            # Databases created before bulk uploads
+            cursor.execute('PRAGMA table_info(documents)')
+            if 'batch_id' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute('ALTER TABLE documents ADD COLUMN batch_id TEXT')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_documents_batch_id
+                ON documents (batch_id)
+            ''')
+            
+            # AI categorizations shared by the documents of a bulk upload, one per merchant
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS batch_categorizations (
+                    batch_id TEXT NOT NULL,
+                    merchant_key TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    confidence REAL DEFAULT 0.0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (batch_id, merchant_key)
+                )
+            ''')
+            
             conn.commit()
             logger.info("Database initialized successfully")
     
+    def _backfill_merchant_keys(self, cursor, batch_size: int = 5000):
+        """Fill merchant_key for transactions stored without one"""
+        backfilled = 0
+        while True:
+            cursor.execute('''
+                SELECT id, description FROM transactions WHERE merchant_key IS NULL LIMIT ?
+            ''', (batch_size,))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            
+            cursor.executemany('''
+                UPDATE transactions SET merchant_key = ? WHERE id = ?
+            ''', [(extract_merchant_key(description), transaction_id) for transaction_id, description in rows])
+            backfilled += len(rows)
+        
+        if backfilled:
+            logger.info(f"Backfilled merchant keys for {backfilled} transactions")
+    
+    def _backfill_row_keys(self, cursor, batch_size: int = 5000):
+        """Fill row_key for document transactions stored without one
+
+        A document saved before row keys may hold the same transaction twice;
+        the copies after the first keep no key.
+        """
+        backfilled, after_id = 0, 0
+        while True:
+            cursor.execute('''
+                SELECT id, transaction_date, description, amount FROM transactions
+                WHERE row_key IS NULL AND document_id IS NOT NULL AND id > ?
+                ORDER BY id LIMIT ?
+            ''', (after_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            
+            cursor.executemany('''
+                UPDATE OR IGNORE transactions SET row_key = ? WHERE id = ?
+            ''', [(transaction_row_key(date, description, amount), transaction_id)
+                  for transaction_id, date, description, amount in rows])
+            backfilled += cursor.rowcount
+            after_id = rows[-1][0]
+        
+        if backfilled:
+            logger.info(f"Backfilled row keys for {backfilled} transactions")
+    
     def save_document(self, filename: str, original_filename: str, file_path: str, 
-                     file_size: int, file_type: str) -> int:
+                     file_size: int, file_type: str, content_hash: Optional[str] = None,
+                     batch_id: Optional[str] = None) -> int:
         """Save document record and return document ID"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO documents (filename, original_filename, file_path, file_size, file_type)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (filename, original_filename, file_path, file_size, file_type))
+                INSERT INTO documents (filename, original_filename, file_path, file_size, file_type,
+                                       content_hash, batch_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (filename, original_filename, file_path, file_size, file_type, content_hash, batch_id))
             conn.commit()
             return cursor.lastrowid
     
+    def get_document_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Document with the given content hash that was processed or is being processed
+
+        A completed document is preferred over one still in flight; failed
+        documents never match, so their content can be uploaded again.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, original_filename, file_size, file_type, status,
+                       total_transactions, extraction_confidence, created_at
+                FROM documents
+                WHERE content_hash = ?
+                  AND status IN ('queued', 'processing', 'extracted', 'categorizing', 'completed')
+                ORDER BY status = 'completed' DESC, id DESC
+                LIMIT 1
+            ''', (content_hash,))
+            
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            return {
+                'id': row[0],
+                'original_filename': row[1],
+                'file_size': row[2],
+                'file_type': row[3],
+                'status': row[4],
+                'total_transactions': row[5],
+                'extraction_confidence': row[6],
+                'created_at': row[7]
+            }
+    
+    def get_document(self, document_id: int) -> Optional[Dict[str, Any]]:
+        """Get a document's record, or None if it doesn't exist"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, original_filename, file_size, file_type, status,
+                       total_transactions, extraction_confidence, created_at, batch_id
+                FROM documents
+                WHERE id = ?
+            ''', (document_id,))
+            
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            return {
+                'id': row[0],
+                'original_filename': row[1],
+                'file_size': row[2],
+                'file_type': row[3],
+                'status': row[4],
+                'total_transactions': row[5],
+                'extraction_confidence': row[6],
+                'created_at': row[7],
+                'batch_id': row[8]
+            }
+    
     def update_document_status(self, document_id: int, status: str, 
-                             total_transactions: int = 0, extraction_confidence: float = 0.0):
-        """Update document processing status"""
+                             total_transactions: Optional[int] = None,
+                             extraction_confidence: Optional[float] = None):
+        """Update document processing status, and its extraction results when given"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE documents 
-                SET status = ?, total_transactions = ?, extraction_confidence = ?
+                SET status = ?,
+                    total_transactions = COALESCE(?, total_transactions),
+                    extraction_confidence = COALESCE(?, extraction_confidence)
                 WHERE id = ?
             ''', (status, total_transactions, extraction_confidence, document_id))
             conn.commit()
     
-    def save_transactions(self, document_id: int, transactions: List[Dict[str, Any]]):
-        """Save extracted transactions"""
+    def save_transactions(self, document_id: int, transactions: List[Dict[str, Any]]) -> List[int]:
+        """Save extracted transactions the document doesn't have yet, return the IDs saved in order"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
+            transaction_ids = []
             for transaction in transactions:
                 cursor.execute('''
-                    INSERT INTO transactions (document_id, transaction_date, description, amount)
-                    VALUES (?, ?, ?, ?)
+                    INSERT OR IGNORE INTO transactions
+                        (document_id, transaction_date, description, merchant_key, amount, row_key)
+                    VALUES (?, ?, ?, ?, ?, ?)
                 ''', (
                     document_id,
                     transaction.get('transaction_date'),
                     transaction.get('description', ''),
-                    transaction.get('amount', 0)
+                    extract_merchant_key(transaction.get('description', '')),
+                    transaction.get('amount', 0),
+                    transaction_row_key(
+                        transaction.get('transaction_date'), transaction.get('description'), transaction.get('amount')
+                    )
                 ))
+                if cursor.rowcount:
+                    transaction_ids.append(cursor.lastrowid)
             conn.commit()
+            return transaction_ids
     
     def get_document_transactions(self, document_id: int) -> List[Dict[str, Any]]:
         """Get all transactions for a document"""
@@ -153,6 +371,7 @@ class XspensesDatabase:
                     'ai_category': row[4],
                     'ai_confidence': row[5],
                     'user_category': row[6],
+                    'category_status': CATEGORY_DONE if row[4] or row[6] else CATEGORY_PENDING,
                     'is_corrected': bool(row[7]),
                     'corrected_at': row[8],
                     'created_at': row[9]
@@ -160,6 +379,116 @@ class XspensesDatabase:
             
             return transactions
     
+    def count_document_transactions(self, document_id: int) -> Dict[str, int]:
+        """Count a document's saved and categorized transactions"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*), COUNT(ai_category)
+                FROM transactions
+                WHERE document_id = ?
+            ''', (document_id,))
+            total, categorized = cursor.fetchone()
+            return {'total': total, 'categorized': categorized}
+    
+    def get_uncategorized_transactions(self, document_id: int, after_id: int = 0,
+                                       limit: int = 100) -> List[Dict[str, Any]]:
+        """Page through a document's transactions that have no AI category yet, by ID"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, transaction_date, description, amount, merchant_key
+                FROM transactions
+                WHERE document_id = ? AND ai_category IS NULL AND id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (document_id, after_id, limit))
+            
+            return [
+                {'id': row[0], 'transaction_date': row[1], 'description': row[2], 'amount': row[3],
+                 'merchant_key': row[4]}
+                for row in cursor.fetchall()
+            ]
+    
+    def get_transactions_after(self, document_id: int, after_id: int = 0, limit: int = 500,
+                               categorized: bool = False) -> List[Dict[str, Any]]:
+        """Page through a document's saved transactions by ID, only categorized ones if asked
+        
+        Transactions are saved and categorized in ID order, so the last ID seen is
+        a cursor for the ones saved (or categorized) since.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT id, transaction_date, description, amount, ai_category, ai_confidence
+                FROM transactions
+                WHERE document_id = ? AND id > ? {'AND ai_category IS NOT NULL' if categorized else ''}
+                ORDER BY id
+                LIMIT ?
+            ''', (document_id, after_id, limit))
+            
+            return [
+                {'id': row[0], 'date': row[1], 'description': row[2], 'amount': row[3],
+                 'ai_category': row[4], 'ai_confidence': row[5],
+                 'category_status': CATEGORY_DONE if row[4] else CATEGORY_PENDING}
+                for row in cursor.fetchall()
+            ]
+    
+    def get_batch_documents(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Documents uploaded together in one bulk upload, in upload order"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, original_filename, file_size, file_type, status,
+                       total_transactions, extraction_confidence, created_at
+                FROM documents
+                WHERE batch_id = ?
+                ORDER BY id
+            ''', (batch_id,))
+            
+            return [
+                {
+                    'id': row[0],
+                    'original_filename': row[1],
+                    'file_size': row[2],
+                    'file_type': row[3],
+                    'status': row[4],
+                    'total_transactions': row[5],
+                    'extraction_confidence': row[6],
+                    'created_at': row[7]
+                }
+                for row in cursor.fetchall()
+            ]
+    
+    def get_batch_categorizations(self, batch_id: str, merchant_keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """AI categorizations already made in a bulk upload, by merchant key"""
+        if not merchant_keys:
+            return {}
+        
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            placeholders = ','.join('?' * len(merchant_keys))
+            cursor.execute(f'''
+                SELECT merchant_key, category, confidence
+                FROM batch_categorizations
+                WHERE batch_id = ? AND merchant_key IN ({placeholders})
+            ''', [batch_id, *merchant_keys])
+            
+            return {
+                row[0]: {'category': row[1], 'confidence': row[2]}
+                for row in cursor.fetchall()
+            }
+    
+    def save_batch_categorization(self, batch_id: str, merchant_key: str, category: str, confidence: float):
+        """Share a merchant's AI categorization with the rest of its bulk upload; the first one wins"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO batch_categorizations (batch_id, merchant_key, category, confidence)
+                VALUES (?, ?, ?, ?)
+            ''', (batch_id, merchant_key, category, confidence))
+            conn.commit()
+    
     def get_all_documents(self) -> List[Dict[str, Any]]:
         """Get all documents from the database"""
         with sqlite3.connect(self.db_path) as conn:
@@ -190,57 +519,118 @@ class XspensesDatabase:
             
             return documents
     
-    def save_user_preference(self, merchant_pattern: str, original_category: str, 
-                           preferred_category: str, confidence_score: float = 0.0,
-                           context_data: Dict[str, Any] = None):
-        """Save user preference for learning"""
+    def get_transactions_by_ids(self, transaction_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get transactions by ID in one query"""
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
+            transactions = []
             
-            # Check if preference already exists
-            cursor.execute('''
-                SELECT id, correction_count, learning_weight FROM user_preferences 
-                WHERE merchant_pattern = ?
-            ''', (merchant_pattern,))
+            # Stay under SQLite's bound parameter limit
+            for start in range(0, len(transaction_ids), 500):
+                chunk = transaction_ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT id, transaction_date, description, amount, ai_category, ai_confidence
+                    FROM transactions 
+                    WHERE id IN ({','.join('?' * len(chunk))})
+                ''', chunk)
+                
+                for row in cursor.fetchall():
+                    transactions.append({
+                        'id': row[0],
+                        'transaction_date': row[1],
+                        'description': row[2],
+                        'amount': row[3],
+                        'ai_category': row[4],
+                        'ai_confidence': row[5]
+                    })
+            
+            return transactions
+    
+    def apply_corrections(self, transaction_categories: List[tuple], preferences: List[Dict[str, Any]]):
+        """Apply category corrections and their learned preferences in one transaction
+        
+        transaction_categories holds (transaction_id, corrected_category) pairs.
+        preferences holds one aggregated entry per merchant pattern with the
+        number of corrections it received in correction_count.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
             
-            existing = cursor.fetchone()
+            cursor.executemany('''
+                UPDATE transactions 
+                SET user_category = ?, is_corrected = TRUE, corrected_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(category, transaction_id) for transaction_id, category in transaction_categories])
             
-            if existing:
-                # Update existing preference
-                preference_id, correction_count, learning_weight = existing
-                new_count = correction_count + 1
-                new_weight = min(learning_weight * 1.1, 2.0)  # Cap at 2.0
-                
-                cursor.execute('''
-                    UPDATE user_preferences 
-                    SET preferred_category = ?, correction_count = ?, learning_weight = ?,
-                        last_corrected_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (preferred_category, new_count, new_weight, preference_id))
-            else:
-                # Create new preference
-                cursor.execute('''
-                    INSERT INTO user_preferences 
-                    (merchant_pattern, original_category, preferred_category, confidence_score, context_data)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    merchant_pattern,
-                    original_category,
-                    preferred_category,
-                    confidence_score,
-                    json.dumps(context_data) if context_data else None
-                ))
+            # Find which merchant patterns already have a preference
+            patterns = [pref['merchant_pattern'] for pref in preferences]
+            existing = {}
+            for start in range(0, len(patterns), 500):
+                chunk = patterns[start:start + 500]
+                cursor.execute(f'''
+                    SELECT merchant_pattern, id, correction_count, learning_weight FROM user_preferences 
+                    WHERE merchant_pattern IN ({','.join('?' * len(chunk))})
+                ''', chunk)
+                for merchant_pattern, preference_id, correction_count, learning_weight in cursor.fetchall():
+                    existing[merchant_pattern] = (preference_id, correction_count, learning_weight)
+            
+            updates = []
+            inserts = []
+            for pref in preferences:
+                count = pref['correction_count']
+                if pref['merchant_pattern'] in existing:
+                    preference_id, correction_count, learning_weight = existing[pref['merchant_pattern']]
+                    updates.append((
+                        pref['preferred_category'],
+                        correction_count + count,
+                        min(learning_weight * 1.1 ** count, 2.0),  # Cap at 2.0
+                        preference_id
+                    ))
+                else:
+                    inserts.append((
+                        pref['merchant_pattern'],
+                        pref.get('original_category'),
+                        pref['preferred_category'],
+                        pref.get('confidence_score', 0.0),
+                        count,
+                        min(1.1 ** (count - 1), 2.0),
+                        json.dumps(pref['context_data']) if pref.get('context_data') else None
+                    ))
+            
+            cursor.executemany('''
+                UPDATE user_preferences 
+                SET preferred_category = ?, correction_count = ?, learning_weight = ?,
+                    last_corrected_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', updates)
+            
+            cursor.executemany('''
+                INSERT INTO user_preferences 
+                (merchant_pattern, original_category, preferred_category, confidence_score,
+                 correction_count, learning_weight, context_data)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', inserts)
             
             conn.commit()
     
-    def get_user_preferences(self, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get user preferences for AI context"""
+    def get_user_preferences(self, limit: int = 50, weight_fn: Callable = None) -> List[Dict[str, Any]]:
+        """Get user preferences for AI context
+        
+        weight_fn(learning_weight, last_corrected_at) computes the effective
+        weight used for ranking; by default the stored learning weight is used.
+        """
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM user_preferences 
-                ORDER BY learning_weight DESC, last_corrected_at DESC
+            
+            effective_weight = 'learning_weight'
+            if weight_fn:
+                conn.create_function('effective_weight', 2, weight_fn)
+                effective_weight = 'effective_weight(learning_weight, last_corrected_at)'
+            
+            cursor.execute(f'''
+                SELECT *, {effective_weight} AS effective_weight FROM user_preferences 
+                ORDER BY effective_weight DESC, last_corrected_at DESC
                 LIMIT ?
             ''', (limit,))
             
@@ -251,63 +641,93 @@ class XspensesDatabase:
                     'preferred_category': row['preferred_category'],
                     'correction_count': row['correction_count'],
                     'learning_weight': row['learning_weight'],
+                    'effective_weight': row['effective_weight'],
+                    'last_corrected_at': row['last_corrected_at'],
                     'context_data': json.loads(row['context_data']) if row['context_data'] else None
                 })
             
             return preferences
     
-    def update_transaction_category(self, transaction_id: int, ai_category: str, 
-                                  ai_confidence: float, user_category: str = None):
-        """Update transaction with AI categorization"""
+    def delete_user_preferences_below(self, weight_fn: Callable, min_weight: float) -> int:
+        """Delete preferences whose effective weight is below min_weight, return count"""
         with sqlite3.connect(self.db_path) as conn:
+            conn.create_function('effective_weight', 2, weight_fn)
             cursor = conn.cursor()
             cursor.execute('''
-                UPDATE transactions 
-                SET ai_category = ?, ai_confidence = ?, user_category = ?
-                WHERE id = ?
-            ''', (ai_category, ai_confidence, user_category, transaction_id))
+                DELETE FROM user_preferences 
+                WHERE effective_weight(learning_weight, last_corrected_at) < ?
+            ''', (min_weight,))
             conn.commit()
+            return cursor.rowcount
     
-    def correct_transaction_category(self, transaction_id: int, corrected_category: str):
-        """Mark transaction as corrected and learn from it"""
+    def get_preferred_categories(self, weight_fn: Callable, min_weight: float,
+                                 merchant_keys: List[str] = None) -> Dict[str, str]:
+        """Map merchant keys to the preferred category of their strongest live preference
+        
+        Only preferences whose effective weight is at least min_weight count.
+        All merchant keys with a preference are returned when none are given.
+        """
         with sqlite3.connect(self.db_path) as conn:
+            conn.create_function('effective_weight', 2, weight_fn)
             cursor = conn.cursor()
             
-            # Get transaction details
-            cursor.execute('''
-                SELECT description, ai_category FROM transactions WHERE id = ?
-            ''', (transaction_id,))
+            query = '''
+                SELECT merchant_pattern, preferred_category FROM user_preferences 
+                WHERE effective_weight(learning_weight, last_corrected_at) >= ? {}
+                ORDER BY effective_weight(learning_weight, last_corrected_at) ASC
+            '''
+            rows = []
+            if merchant_keys is None:
+                cursor.execute(query.format(''), (min_weight,))
+                rows = cursor.fetchall()
+            else:
+                for start in range(0, len(merchant_keys), 500):
+                    chunk = merchant_keys[start:start + 500]
+                    cursor.execute(
+                        query.format(f"AND merchant_pattern IN ({','.join('?' * len(chunk))})"),
+                        (min_weight, *chunk)
+                    )
+                    rows.extend(cursor.fetchall())
             
-            transaction = cursor.fetchone()
-            if transaction:
-                description, ai_category = transaction
-                
-                # Update transaction
-                cursor.execute('''
-                    UPDATE transactions 
-                    SET user_category = ?, is_corrected = TRUE, corrected_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (corrected_category, transaction_id))
-                
-                # Save user preference for learning
-                merchant_pattern = self._extract_merchant_pattern(description)
-                self.save_user_preference(merchant_pattern, ai_category, corrected_category)
-                
-                conn.commit()
+            # Ascending weight, so the strongest preference per key is written last
+            return {merchant_key: category for merchant_key, category in rows if merchant_key}
     
-    def _extract_merchant_pattern(self, description: str) -> str:
-        """Extract merchant pattern from transaction description"""
-        if not description:
-            return ""
-        
-        # Clean and extract first few words
-        words = description.strip().upper().split()[:3]
-        pattern = ' '.join(words)
-        
-        # Remove common prefixes
-        pattern = pattern.replace('POS ', '').replace('PURCHASE ', '').replace('PAYMENT ', '')
+    def recategorize_merchants(self, merchant_categories: Dict[str, str], confidence: float) -> int:
+        """Set-wise apply preferred categories to uncorrected transactions, return rows updated"""
+        keys_by_category = defaultdict(list)
+        for merchant_key, category in merchant_categories.items():
+            keys_by_category[category].append(merchant_key)
         
-        return pattern.strip()
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            updated = 0
+            
+            for category, merchant_keys in keys_by_category.items():
+                for start in range(0, len(merchant_keys), 500):
+                    chunk = merchant_keys[start:start + 500]
+                    cursor.execute(f'''
+                        UPDATE transactions 
+                        SET ai_category = ?, ai_confidence = ?
+                        WHERE merchant_key IN ({','.join('?' * len(chunk))})
+                        AND is_corrected = FALSE
+                        AND (ai_category IS NULL OR ai_category != ?)
+                    ''', (category, confidence, *chunk, category))
+                    updated += cursor.rowcount
+            
+            conn.commit()
+            return updated
+    
+    def update_transaction_category(self, transaction_id: int, ai_category: str, 
+                                  ai_confidence: float, user_category: str = None):
+        """Update transaction with AI categorization"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE transactions 
+                SET ai_category = ?, ai_confidence = ?, user_category = ?
+                WHERE id = ?
+            ''', (ai_category, ai_confidence, user_category, transaction_id))
+            conn.commit()
     
     def get_learning_analytics(self) -> Dict[str, Any]:
         """Get learning system analytics"""
@@ -47,20 +47,35 @@ def test_file_upload():
             response = requests.post(
                 'http://localhost:5000/api/documents/upload',
                 files=files,
-                timeout=60  # 60 second timeout for processing
+                timeout=60
             )
         
         print(f"Upload Status Code: {response.status_code}")
         print(f"Upload Response: {response.text}")
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"Document ID: {result.get('document_id')}")
-            print(f"Status: {result.get('status')}")
-            print(f"Total Transactions: {result.get('total_transactions')}")
-            print(f"Categorized Transactions: {result.get('categorized_transactions')}")
+        if response.status_code != 202:
+            return response.status_code == 200  # duplicate of an already processed document
         
-        return response.status_code == 200
+        result = response.json()
+        print(f"Document ID: {result.get('document_id')}")
+        print(f"Job ID: {result.get('job_id')}")
+        
+        # Processing happens on the worker pool; poll the job until it finishes
+        job = {}
+        for _ in range(60):
+            job = requests.get(f"http://localhost:5000{result['status_url']}", timeout=10).json()
+            print(f"Job status: {job.get('status')} - stage: {job.get('stage')} - progress: {job.get('progress', 0):.0%}")
+            if job.get('status') in ('completed', 'failed'):
+                break
+            time.sleep(1)
+        
+        job_result = job.get('result') or {}
+        print(f"Total Transactions: {job_result.get('total_transactions')}")
+        print(f"Categorized Transactions: {job_result.get('categorized_transactions')}")
+        if job.get('error'):
+            print(f"Job Error: {job['error']}")
+        
+        return job.get('status') == 'completed'
         
     except Exception as e:
         print(f"Upload test failed: {e}")
@@ -0,0 +1,309 @@
+"""
+Document Pipeline - Extracts and categorizes an uploaded document as resumable jobs
+"""
+
+import io
+import os
+import math
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import Dict, Any, List, Callable, Optional
+from loguru import logger
+
+from memory_guard import MemoryGuard
+from page_cache import PageCacheStats
+
+STAGE_EXTRACTING = 'extracting'
+STAGE_CATEGORIZING = 'categorizing'
+
+# Job kinds: extraction queues categorization as a job of its own when it finishes
+JOB_PROCESS_DOCUMENT = 'process_document'
+JOB_CATEGORIZE_DOCUMENT = 'categorize_document'
+
+# Document statuses once every transaction is saved, categorized or not
+EXTRACTED_STATUSES = ('extracted', 'categorizing', 'completed')
+CATEGORIZE_PAGE_SIZE = 100  # uncategorized transactions loaded per page
+
+
+class StageTimer:
+    """Wall-clock seconds a job spends in each stage, summed over its batches
+
+    Extraction, deduplication and saving interleave batch by batch, so each is
+    timed separately to show which one a slow document is waiting on.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def snapshot(self) -> Dict[str, float]:
+        return {name: round(seconds, 3) for name, seconds in self.seconds.items()}
+
+
+class DocumentPipeline:
+    """Runs a document through extraction and categorization, checkpointed in the database
+
+    Extraction and categorization run as separate jobs: a document is
+    'extracted' with all its transactions saved, pending a category, as soon as
+    extraction finishes, and 'completed' once they are categorized.
+
+    Every saved batch and every categorized transaction is committed as it goes,
+    so a job resumed by another worker skips the transactions already saved and
+    only categorizes the ones still missing a category.
+
+    Extraction is held to memory_limit_mb of resident memory per process (0 for
+    no limit); a document that needs more fails with MemoryLimitExceeded.
+
+    Documents of one bulk upload share their AI categorizations by merchant, so
+    a merchant is sent to the model once per upload rather than once per statement.
+    """
+
+    def __init__(self, db, document_reader, ai_categorizer, learning_system, memory_limit_mb: float = 0):
+        self.db = db
+        self.document_reader = document_reader
+        self.ai_categorizer = ai_categorizer
+        self.learning_system = learning_system
+        self.memory_limit_mb = memory_limit_mb
+
+    def process(self, document_id: int, file_path: str,
+                report: Optional[Callable[[str, float, Dict[str, Any]], None]] = None,
+                member: Optional[str] = None, batch_id: Optional[str] = None) -> Dict[str, Any]:
+        """Extract and categorize a document in one go, calling report(stage, progress, details) as it advances
+
+        member names the document inside the ZIP archive at file_path; batch_id
+        is the bulk upload it belongs to.
+        """
+        result = self.extract_document(document_id, file_path, report, member=member)
+        categorized = self.categorize_document(document_id, report, batch_id=batch_id)
+        return {
+            **result,
+            'categorized_transactions': categorized['categorized_transactions'],
+            'stage_seconds': {**result['stage_seconds'], **categorized['stage_seconds']}
+        }
+
+    def extract_document(self, document_id: int, file_path: str, report: Optional[Callable] = None,
+                         member: Optional[str] = None) -> Dict[str, Any]:
+        """Save a document's transactions uncategorized and mark it extracted"""
+        report = report or (lambda stage, progress, details: None)
+
+        self.db.update_document_status(document_id, 'processing')
+        memory_guard = MemoryGuard(self.memory_limit_mb)
+        timer = StageTimer()
+        cache_stats = PageCacheStats()
+        total_transactions, extraction_confidence = self.extract(
+            document_id, file_path, report, memory_guard, member=member, timer=timer, cache_stats=cache_stats
+        )
+
+        self.db.update_document_status(
+            document_id=document_id,
+            status='extracted',
+            total_transactions=total_transactions,
+            extraction_confidence=extraction_confidence
+        )
+        logger.info(f"Document {document_id} extracted: {total_transactions} transactions, "
+                    f"peak memory {memory_guard.peak_rss_mb} MB, stage seconds {timer.snapshot()}, "
+                    f"page cache {cache_stats.as_dict()}")
+
+        return {
+            'document_id': document_id,
+            'total_transactions': total_transactions,
+            'extraction_confidence': extraction_confidence,
+            'peak_rss_mb': memory_guard.peak_rss_mb,
+            'page_cache': cache_stats.as_dict(),
+            'stage_seconds': timer.snapshot()
+        }
+
+    def categorize_document(self, document_id: int, report: Optional[Callable] = None,
+                            batch_id: Optional[str] = None) -> Dict[str, Any]:
+        """Categorize an extracted document's pending transactions and mark it completed"""
+        report = report or (lambda stage, progress, details: None)
+
+        self.db.update_document_status(document_id, 'categorizing')
+        timer = StageTimer()
+        categorized_count = self.categorize(document_id, report, batch_id=batch_id, timer=timer)
+        counts = self.db.count_document_transactions(document_id)
+
+        self.db.update_document_status(document_id, 'completed')
+        logger.info(f"Document {document_id} categorized: {counts['categorized']}/{counts['total']} transactions, "
+                    f"stage seconds {timer.snapshot()}")
+
+        return {
+            'document_id': document_id,
+            'categorized_transactions': categorized_count,
+            'pending_transactions': counts['total'] - counts['categorized'],
+            'stage_seconds': timer.snapshot()
+        }
+
+    def extract(self, document_id: int, file_path: str, report: Callable,
+                memory_guard: Optional[MemoryGuard] = None, member: Optional[str] = None,
+                timer: Optional[StageTimer] = None, cache_stats: Optional[PageCacheStats] = None) -> tuple:
+        """Save the document's transactions batch by batch, skipping ones saved by an earlier attempt
+
+        Transactions are saved by row key, so those an earlier attempt saved are
+        skipped wherever they come in this one; a resumed attempt may run on a
+        worker whose learned layouts extract rows in another order. The lease is
+        renewed before every batch is saved, so a worker that lost the job stops
+        before writing alongside its new owner. Returns the document's saved
+        transaction count and the confidence of this attempt's transactions.
+        Progress is pages extracted out of the page count for PDFs; other formats
+        stay at 0 until the reader is exhausted.
+        """
+        memory_guard = memory_guard or MemoryGuard(self.memory_limit_mb)
+        timer = timer or StageTimer()
+        cache_stats = cache_stats or PageCacheStats()
+        already_saved = self.db.count_document_transactions(document_id)['total']
+        if already_saved:
+            logger.info(f"Resuming extraction of document {document_id} after {already_saved} saved transactions")
+
+        total_transactions = 0
+        total_score, valid_transactions = 0.0, 0
+        pages = {'pages_done': 0, 'pages_total': None}
+        report(STAGE_EXTRACTING, 0.0, {'transactions_extracted': already_saved})
+
+        def on_page(pages_done, page_count):
+            pages['pages_done'], pages['pages_total'] = pages_done, page_count
+
+        with timer.stage('extract'):
+            source, file_type = self.open_document(file_path, member)
+            batches = self.document_reader.iter_transactions(
+                source, file_type, memory_guard=memory_guard, on_page=on_page, deduplicate=False,
+                cache_stats=cache_stats
+            )
+        seen = set()
+        while True:
+            with timer.stage('extract'):
+                batch = next(batches, None)
+            if batch is None:
+                break
+
+            with timer.stage('dedup'):
+                batch = self.document_reader.deduplicate_transactions(batch, seen)
+
+            total_transactions += len(batch)
+            batch_score, batch_valid = self.document_reader.score_transactions(batch)
+            total_score += batch_score
+            valid_transactions += batch_valid
+
+            # Raises LeaseLost once another worker owns the job
+            pages_total = pages['pages_total']
+            report(STAGE_EXTRACTING, pages['pages_done'] / pages_total if pages_total else 0.0, {
+                'transactions_extracted': total_transactions,
+                **pages,
+                'peak_rss_mb': memory_guard.peak_rss_mb,
+                'page_cache': cache_stats.as_dict(),
+                'stage_seconds': timer.snapshot()
+            })
+
+            with timer.stage('persist'):
+                self.db.save_transactions(document_id, batch)
+
+        extraction_confidence = self.document_reader.confidence_from_scores(
+            total_score, valid_transactions, total_transactions
+        )
+        # Rows only an earlier attempt extracted stay with the document
+        return self.db.count_document_transactions(document_id)['total'], extraction_confidence
+
+    def open_document(self, file_path: str, member: Optional[str] = None) -> tuple:
+        """Source and file type for the reader: the path itself, or an archive member read into memory
+
+        Members are at most MAX_FILE_SIZE (checked at upload) and are never
+        extracted to disk; the parsers need random access, so they're buffered.
+        """
+        if member is None:
+            return file_path, None
+        with zipfile.ZipFile(file_path) as archive:
+            buffer = io.BytesIO(archive.read(member))
+        return buffer, os.path.splitext(member)[1].lstrip('.').lower()
+
+    def categorize(self, document_id: int, report: Callable, batch_id: Optional[str] = None,
+                   timer: Optional[StageTimer] = None) -> int:
+        """Categorize the document's transactions that have no category yet, return count categorized"""
+        timer = timer or StageTimer()
+        counts = self.db.count_document_transactions(document_id)
+        total, done = counts['total'], counts['categorized']
+        batches_total = math.ceil((total - done) / CATEGORIZE_PAGE_SIZE)
+        batches_done = 0
+        user_preferences = self.learning_system.get_user_preferences()
+
+        def details():
+            return {
+                'transactions_extracted': total,
+                'transactions_categorized': done,
+                'batches_done': batches_done,
+                'batches_total': batches_total,
+                'stage_seconds': timer.snapshot()
+            }
+
+        report(STAGE_CATEGORIZING, done / total if total else 1.0, details())
+
+        shared = {}  # merchant_key -> AI categorization, for this document and its bulk upload
+        after_id = 0
+        while True:
+            with timer.stage('categorize'):
+                transactions = self.db.get_uncategorized_transactions(document_id, after_id, CATEGORIZE_PAGE_SIZE)
+                if not transactions:
+                    break
+                after_id = transactions[-1]['id']
+
+                if batch_id:
+                    unseen = {t['merchant_key'] for t in transactions if t['merchant_key']} - shared.keys()
+                    shared.update(self.db.get_batch_categorizations(batch_id, list(unseen)))
+                done += self.categorize_transactions(transactions, user_preferences, shared, batch_id)
+            batches_done += 1
+            report(STAGE_CATEGORIZING, done / total, details())
+
+        return done
+
+    def categorize_transactions(self, transactions: List[Dict[str, Any]], user_preferences,
+                                shared: Optional[Dict[str, Dict[str, Any]]] = None,
+                                batch_id: Optional[str] = None) -> int:
+        """Categorize saved transactions with AI and learned preferences, return count categorized
+
+        Merchants already in shared reuse that categorization instead of calling
+        the model; new ones are added to it, and to the bulk upload's when given.
+        """
+        shared = {} if shared is None else shared
+        categorized_count = 0
+        for transaction in transactions:
+            try:
+                merchant_key = transaction.get('merchant_key')
+                categorization = shared.get(merchant_key) if merchant_key else None
+                if categorization is None:
+                    categorization = self.ai_categorizer.categorize_transaction(
+                        transaction, user_preferences
+                    )
+                    # Failed categorizations come back with no confidence; let the next one retry
+                    if merchant_key and categorization['confidence'] > 0:
+                        shared[merchant_key] = categorization
+                        if batch_id:
+                            self.db.save_batch_categorization(
+                                batch_id, merchant_key, categorization['category'], categorization['confidence']
+                            )
+
+                # Apply learning system prediction
+                final_category, final_confidence = self.learning_system.predict_category(
+                    transaction,
+                    categorization['category'],
+                    categorization['confidence']
+                )
+
+                self.db.update_transaction_category(
+                    transaction_id=transaction['id'],
+                    ai_category=final_category,
+                    ai_confidence=final_confidence
+                )
+                categorized_count += 1
+
+            except Exception as e:
+                logger.error(f"Error categorizing transaction {transaction.get('id')}: {e}")
+                continue
+
+        return categorized_count
@@ -4,17 +4,31 @@ Smart Document Reader - Reads ANY bank statement format (PDF, CSV, images)
 
 import os
 import re
+import math
+import mmap
+import time
+import threading
+from itertools import chain, islice
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype, is_numeric_dtype
 import pdfplumber
 import PyPDF2
-from PIL import Image
-import pytesseract
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import openpyxl
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Callable
+from datetime import date, datetime
 import chardet
 from loguru import logger
 import logging
 
+from date_parser import DateParser, DATE_SAMPLE_SIZE
+from page_classifier import PageClassifier, STRATEGY_TABLE
+from layout_registry import LayoutRegistry
+from memory_guard import MemoryGuard
+from page_cache import PageCache, PageCacheStats, page_content_hash
+from ocr_service import OcrService
+
 # Configure detailed logging for document reader
 logging.basicConfig(
     level=logging.DEBUG,
@@ -25,12 +39,114 @@ logging.basicConfig(
     ]
 )
 
+# Amount notation: "(12.50)", "12.50-" and "12.50 DR" are negative, "12.50 CR" positive
+AMOUNT_NEGATIVE_PATTERN = r'(?i)^\s*\(.*\)\s*$|-\s*$|DR\s*$'
+AMOUNT_JUNK_PATTERN = r'(?i)[$,()\s]|-\s*$|[CD]R\s*$'
+
+# Statement line layouts in one line-anchored alternation, so a page is scanned once and
+# each line matches at most once; group prefixes name the layout (date/description/amount)
+DATE_TOKEN = r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'
+AMOUNT_TOKEN = r'\(?-?\$?-?(?:\d{1,3}(?:,\d{3})+|\d+)\.\d{2}\)?(?:-|[ \t]?[CD]R)?'
+TRANSACTION_LINE_PATTERN = re.compile(
+    r'^[ \t]*(?:'
+    # Date Description Amount, with an optional running balance column
+    r'(?P<dda_date>' + DATE_TOKEN + r')[ \t]+(?P<dda_description>[^\n]+?)[ \t]+'
+    r'(?P<dda_amount>' + AMOUNT_TOKEN + r')(?:[ \t]+' + AMOUNT_TOKEN + r')?'
+    # Amount Date Description
+    r'|(?P<ada_amount>' + AMOUNT_TOKEN + r')[ \t]+(?P<ada_date>' + DATE_TOKEN + r')[ \t]+'
+    r'(?P<ada_description>[^\n]+?)'
+    # Description Amount Date
+    r'|(?P<dad_description>[^\n]+?)[ \t]+(?P<dad_amount>' + AMOUNT_TOKEN + r')[ \t]+'
+    r'(?P<dad_date>' + DATE_TOKEN + r')'
+    r')[ \t\r]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# .xlsx workbooks are zip packages; anything else is read as legacy .xls
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+# Per-process reader used by PDF page workers
+_worker_reader = None
+
+
+def _extract_pdf_pages(file_path: str, start: int, end: int, date_format: Optional[str],
+                       memory_limit_mb: float = 0
+                       ) -> Tuple[List[Tuple[Any, str, float, Optional[str]]], List[int], int, Tuple[int, int, float]]:
+    """Worker: extract pages [start, end) of a PDF as compact transaction tuples plus the pages without text
+
+    Each page's parsed layout is released once it's extracted, and the worker
+    is held to memory_limit_mb; its peak resident memory and page cache
+    (hits, misses, seconds saved) are returned.
+    """
+    global _worker_reader
+    if _worker_reader is None:
+        _worker_reader = DocumentReader()
+    
+    date_parser = DateParser(date_format)
+    memory_guard = MemoryGuard(memory_limit_mb)
+    cache_stats = PageCacheStats()
+    rows = []
+    textless_pages = []
+    with _worker_reader.open_source(file_path) as (buffer, _), pdfplumber.open(buffer) as pdf:
+        for page_num, page in enumerate(pdf.pages[start:end], start):
+            try:
+                transactions, _ = _worker_reader._extract_pdf_page(page, date_parser, cache_stats)
+            finally:
+                page.close()
+            
+            if transactions is None:
+                textless_pages.append(page_num)
+                transactions = []
+            for transaction in transactions:
+                rows.append((
+                    transaction['transaction_date'],
+                    transaction['description'],
+                    transaction['amount'],
+                    transaction.get('reference_number')
+                ))
+            memory_guard.check(f"page {page_num + 1}")
+    return rows, textless_pages, memory_guard.peak_rss, cache_stats.counts()
+
+
+class MappedDocument(mmap.mmap):
+    """Read-only memory map that passes for a binary file object
+
+    pdfplumber, PyPDF2, pandas and PIL read an mmap as is; zipfile (openpyxl)
+    also probes the io capability methods.
+    """
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def writable(self) -> bool:
+        return False
+
 
 class DocumentReader:
     """Smart document reader for bank statements and financial documents"""
     
     def __init__(self):
         logger.info("Initializing DocumentReader...")
+        self.encoding_sample_size = 64 * 1024  # bytes sampled for encoding detection
+        self.csv_chunk_rows = 10000  # rows per streamed CSV and Excel batch
+        self.excel_header_scan_rows = 20  # leading sheet rows searched for the column header row
+        self.pdf_workers = int(os.getenv('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+        self.pdf_parallel_min_pages = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 8))
+        self._pdf_pool = None
+        self._pdf_pool_lock = threading.Lock()
+        self.page_classifier = PageClassifier()  # per-layout extraction strategy, shared across documents
+        self.layout_registry = LayoutRegistry(os.getenv('LAYOUT_REGISTRY_PATH', './data/layout_templates.json'))
+        self.page_cache = PageCache(  # extracted pages by content hash, shared across documents and workers
+            os.getenv('PAGE_CACHE_PATH', './data/page_cache.db'),
+            max_mb=float(os.getenv('PAGE_CACHE_MAX_MB', 256))
+        )
+        self.ocr_service = OcrService(  # warm Tesseract workers, started on the first image
+            workers=int(os.getenv('OCR_WORKERS', min(4, os.cpu_count() or 1))),
+            timeout=float(os.getenv('OCR_TIMEOUT_SECONDS', 60))
+        )
         self.supported_formats = {
             'pdf': self._read_pdf,
             'csv': self._read_csv,
@@ -42,35 +158,30 @@ class DocumentReader:
         }
         
         # Common bank statement patterns
-        self.transaction_patterns = [
-            # Date Description Amount pattern
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+?)\s+([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            # Amount Date Description pattern  
-            r'([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+)',
-            # Description Amount Date pattern
-            r'([^$]+?)\s+([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
-        ]
         logger.info("DocumentReader initialized successfully")
     
-    def read_document(self, file_path: str) -> Dict[str, Any]:
-        """Read any document and extract transactions"""
-        logger.info(f"=== STARTING DOCUMENT READING: {file_path} ===")
+    def read_document(self, source, file_type: Optional[str] = None) -> Dict[str, Any]:
+        """Read any document and extract transactions
+
+        source is a file path or a readable, seekable binary buffer; buffers
+        without a file name need file_type.
+        """
+        logger.info(f"=== STARTING DOCUMENT READING: {self._source_name(source)} ===")
         
         try:
-            file_extension = self._get_file_extension(file_path)
+            file_extension = self._source_type(source, file_type)
             logger.info(f"File extension detected: {file_extension}")
             
             if file_extension not in self.supported_formats:
                 logger.error(f"Unsupported file type: {file_extension}")
                 raise ValueError(f"Unsupported file type: {file_extension}")
             
-            logger.info(f"Reading document: {file_path}")
-            
             # Read the document
             reader_func = self.supported_formats[file_extension]
             logger.info(f"Using reader function: {reader_func.__name__}")
             
-            transactions = reader_func(file_path)
+            with self.open_source(source) as (buffer, file_path):
+                transactions = reader_func(buffer, file_path)
             logger.info(f"Extracted {len(transactions)} transactions from document")
             
             # Calculate extraction confidence
@@ -92,154 +203,586 @@ class DocumentReader:
             
         except Exception as e:
             logger.error(f"=== DOCUMENT READING FAILED ===")
-            logger.error(f"Error reading document {file_path}: {e}")
+            logger.error(f"Error reading document {self._source_name(source)}: {e}")
             logger.error(f"Exception type: {type(e).__name__}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    def _read_pdf(self, file_path: str) -> List[Dict[str, Any]]:
-        """Read PDF bank statements"""
-        logger.info(f"=== READING PDF: {file_path} ===")
-        transactions = []
+    def iter_transactions(self, source, file_type: Optional[str] = None,
+                          memory_guard: Optional[MemoryGuard] = None,
+                          on_page: Optional[Callable[[int, int], None]] = None,
+                          deduplicate: bool = True,
+                          cache_stats: Optional[PageCacheStats] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield deduplicated transactions in batches; PDF pages and CSV chunks are streamed, other formats yield one batch
+
+        memory_guard is checked after every batch and raises MemoryLimitExceeded
+        once the document needs more memory than its limit. on_page(pages_done,
+        page_count) is called as PDF pages are extracted, and cache_stats counts
+        the PDF pages served from the page cache. Callers that deduplicate
+        themselves pass deduplicate=False and get the batches as extracted.
+        """
+        file_extension = self._source_type(source, file_type)
+        if file_extension not in self.supported_formats:
+            raise ValueError(f"Unsupported file type: {file_extension}")
+        memory_guard = memory_guard or MemoryGuard()
         
+        with self.open_source(source) as (buffer, file_path):
+            if file_extension == 'pdf':
+                batches = self._iter_pdf(buffer, file_path, memory_guard, on_page, cache_stats)
+            elif file_extension == 'csv':
+                batches = self._iter_csv(buffer, file_path)
+            elif file_extension in ('xlsx', 'xls'):
+                batches = self._iter_excel(buffer, file_path)
+            else:
+                batches = iter([self.supported_formats[file_extension](buffer, file_path)])
+            
+            seen = set()
+            for batch_number, batch in enumerate(batches, 1):
+                memory_guard.check(f"batch {batch_number} of {self._source_name(source)}")
+                if deduplicate:
+                    batch = self.deduplicate_transactions(batch, seen)
+                if batch:
+                    yield batch
+    
+    @contextmanager
+    def open_source(self, source) -> Iterator[Tuple[Any, Optional[str]]]:
+        """Yield one seekable binary buffer for a document, and its path when it has one
+
+        A path is opened once and memory-mapped, so encoding detection, every
+        parser and every fallback read the same mapping instead of reopening the
+        file. Buffers (an upload stream, BytesIO, an mmap) are used as given.
+        """
+        if not isinstance(source, (str, os.PathLike)):
+            name = getattr(source, 'name', None)
+            yield source, name if isinstance(name, str) and os.path.isfile(name) else None
+            return
+        
+        file_path = os.fspath(source)
+        with open(file_path, 'rb') as f:
+            # Empty files can't be mapped; the parsers report them from the handle
+            buffer = MappedDocument(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else f
+            try:
+                yield buffer, file_path
+            finally:
+                if buffer is not f:
+                    try:
+                        buffer.close()
+                    except BufferError:
+                        # A parser still holds a view; the mapping is released with it
+                        logger.debug(f"Mapping of {file_path} still referenced, left to garbage collection")
+    
+    def _source_type(self, source, file_type: Optional[str] = None) -> str:
+        """Document type from the explicit file_type or the source's file name"""
+        if file_type:
+            return file_type.lower().lstrip('.')
+        return self._get_file_extension(self._source_name(source))
+    
+    def _source_name(self, source) -> str:
+        """Path or file name of a document source, for type detection and logs"""
+        if isinstance(source, (str, os.PathLike)):
+            return os.fspath(source)
+        name = getattr(source, 'name', None)
+        return name if isinstance(name, str) else '<buffer>'
+    
+    def _read_pdf(self, buffer, file_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Read PDF bank statements"""
         try:
-            # Try pdfplumber first (better for tables)
-            logger.info("Attempting to read PDF with pdfplumber...")
-            with pdfplumber.open(file_path) as pdf:
-                logger.info(f"PDF opened successfully. Pages: {len(pdf.pages)}")
-                
-                for page_num, page in enumerate(pdf.pages):
-                    logger.info(f"Processing PDF page {page_num + 1}")
-                    
-                    # Extract text
-                    logger.info("Extracting text from page...")
-                    text = page.extract_text()
-                    logger.info(f"Text extracted: {len(text) if text else 0} characters")
-                    
-                    if text:
-                        logger.info("Processing text for transactions...")
-                        text_transactions = self._extract_from_text(text)
-                        logger.info(f"Found {len(text_transactions)} transactions in text")
-                        transactions.extend(text_transactions)
-                    
-                    # Extract tables
-                    logger.info("Extracting tables from page...")
-                    tables = page.extract_tables()
-                    logger.info(f"Found {len(tables)} tables on page")
-                    
-                    for table_idx, table in enumerate(tables):
-                        logger.info(f"Processing table {table_idx + 1}")
-                        table_transactions = self._parse_table_data(table)
-                        logger.info(f"Found {len(table_transactions)} transactions in table")
-                        transactions.extend(table_transactions)
-            
-            # If pdfplumber didn't work well, try PyPDF2
-            if not transactions:
-                logger.info("No transactions found with pdfplumber, trying PyPDF2 as fallback...")
-                with open(file_path, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    logger.info(f"PyPDF2 opened PDF with {len(pdf_reader.pages)} pages")
-                    
-                    for page_num, page in enumerate(pdf_reader.pages):
-                        logger.info(f"Processing PyPDF2 page {page_num + 1}")
-                        text = page.extract_text()
-                        logger.info(f"PyPDF2 text extracted: {len(text) if text else 0} characters")
-                        
-                        if text:
-                            text_transactions = self._extract_from_text(text)
-                            logger.info(f"PyPDF2 found {len(text_transactions)} transactions")
-                            transactions.extend(text_transactions)
+            transactions = [transaction for batch in self._iter_pdf(buffer, file_path) for transaction in batch]
             
             # Remove duplicates
             logger.info("Removing duplicate transactions...")
             original_count = len(transactions)
-            transactions = self._deduplicate_transactions(transactions)
+            transactions = self.deduplicate_transactions(transactions)
             logger.info(f"Removed {original_count - len(transactions)} duplicate transactions")
             
             logger.info(f"=== PDF READING COMPLETE: {len(transactions)} transactions ===")
             return transactions
-            
+        
         except Exception as e:
             logger.error(f"=== PDF READING FAILED ===")
-            logger.error(f"Error reading PDF {file_path}: {e}")
+            logger.error(f"Error reading PDF {file_path or '<buffer>'}: {e}")
             logger.error(f"Exception type: {type(e).__name__}")
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    def _read_csv(self, file_path: str) -> List[Dict[str, Any]]:
+    def _iter_pdf(self, buffer, file_path: Optional[str] = None,
+                  memory_guard: Optional[MemoryGuard] = None,
+                  on_page: Optional[Callable[[int, int], None]] = None,
+                  cache_stats: Optional[PageCacheStats] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield a PDF's transactions page by page (or page range by page range), not deduplicated
+
+        pdfplumber caches every page's parsed characters, lines and layout for as
+        long as the document is open; each page is closed once extracted so a
+        long statement holds one page's objects at a time.
+        """
+        logger.info(f"=== READING PDF: {file_path or '<buffer>'} ===")
+        memory_guard = memory_guard or MemoryGuard()
+        on_page = on_page or (lambda pages_done, page_count: None)
+        cache_stats = cache_stats or PageCacheStats()
+        date_parser = DateParser()  # inferred from the first page with dates, then reused
+        textless_pages = []
+        
+        # Try pdfplumber first (better for tables)
+        logger.info("Attempting to read PDF with pdfplumber...")
+        buffer.seek(0)
+        with pdfplumber.open(buffer) as pdf:
+            page_count = len(pdf.pages)
+            logger.info(f"PDF opened successfully. Pages: {page_count}")
+            
+            # Page workers map the file themselves, so only documents on disk fan out
+            if file_path and self.pdf_workers > 1 and page_count >= self.pdf_parallel_min_pages:
+                date_parser = self._infer_pdf_date_parser(pdf)
+                for transactions, pages, pages_done in self._iter_pdf_parallel(file_path, page_count, date_parser,
+                                                                               memory_guard, cache_stats):
+                    textless_pages.extend(pages)
+                    on_page(pages_done, page_count)
+                    yield transactions
+            else:
+                for page_num, page in enumerate(pdf.pages):
+                    logger.info(f"Processing PDF page {page_num + 1}")
+                    
+                    try:
+                        page_transactions, date_parser = self._extract_pdf_page(page, date_parser, cache_stats)
+                    finally:
+                        page.close()
+                    on_page(page_num + 1, page_count)
+                    
+                    if page_transactions is None:
+                        textless_pages.append(page_num)
+                        continue
+                    logger.info(f"Found {len(page_transactions)} transactions on page {page_num + 1}")
+                    yield page_transactions
+        
+        if self.page_cache.enabled:
+            logger.info(f"Page cache: {cache_stats.hits}/{cache_stats.hits + cache_stats.misses} pages hit, "
+                        f"{cache_stats.seconds_saved:.2f}s of extraction saved")
+        
+        # PyPDF2 decodes some fonts pdfplumber can't; only retry pages that came back without text
+        if textless_pages:
+            logger.info(f"Retrying {len(textless_pages)} pages without text with PyPDF2...")
+            buffer.seek(0)
+            pdf_reader = PyPDF2.PdfReader(buffer)
+            
+            for page_num in textless_pages:
+                text = pdf_reader.pages[page_num].extract_text()
+                logger.info(f"PyPDF2 page {page_num + 1}: {len(text) if text else 0} characters")
+                
+                if text and not date_parser.date_format:
+                    date_parser = DateParser.infer_from_text(text)
+                
+                if text:
+                    text_transactions = self._extract_from_text(text, date_parser)
+                    logger.info(f"PyPDF2 found {len(text_transactions)} transactions")
+                    yield text_transactions
+    
+    def _extract_pdf_page(self, page, date_parser: DateParser,
+                          cache_stats: PageCacheStats) -> Tuple[Optional[List[Dict[str, Any]]], DateParser]:
+        """Transactions on one pdfplumber page, None when it has no text, and the document's date parser
+        
+        The date parser is inferred from the page's text while the document's
+        format is still unknown. Pages seen before, in this document or any
+        other, come from the page cache without pdfplumber's text and layout analysis.
+        """
+        started = time.perf_counter()
+        page_hash = page_content_hash(page) if self.page_cache.enabled else None
+        if page_hash:
+            if not date_parser.date_format:
+                seen, text_date_format = self.page_cache.text_date_format(page_hash)
+                if seen and text_date_format:
+                    date_parser = DateParser(text_date_format)
+            cached = self.page_cache.get(page_hash, date_parser.date_format)
+            if cached is not None:
+                cache_stats.hit(cached.extract_seconds - (time.perf_counter() - started))
+                return cached.transactions, date_parser
+        
+        text = page.extract_text()
+        text_date_format = DateParser.infer_from_text(text).date_format if text else None
+        if text and not date_parser.date_format:
+            date_parser = DateParser(text_date_format)
+        transactions = self._extract_page(page, date_parser, text) if text else None
+        
+        cache_stats.miss()
+        # A page with transaction lines that yielded none may do better on another attempt
+        if page_hash and (transactions or not self.page_classifier.has_transaction_lines(text)):
+            self.page_cache.put(page_hash, date_parser.date_format, text_date_format, transactions,
+                                time.perf_counter() - started)
+        return transactions, date_parser
+    
+    def _extract_page(self, page, date_parser: DateParser, text: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Extract transactions from one pdfplumber page with the strategy its layout calls for"""
+        if text is None:
+            text = page.extract_text()
+        
+        strategies, signature = self.page_classifier.classify(page, text)
+        if not strategies:
+            logger.debug(f"Skipping page {page.page_number}: no transaction lines")
+            return []
+        
+        for strategy in strategies:
+            if strategy == STRATEGY_TABLE:
+                transactions = []
+                for table in page.extract_tables():
+                    transactions.extend(self._parse_table_data(
+                        table, date_parser if date_parser.date_format else None
+                    ))
+            else:
+                transactions = self._extract_from_text(text, date_parser)
+            
+            if transactions:
+                # Replaces a remembered strategy that came up empty
+                self.page_classifier.record(signature, strategy)
+                logger.debug(f"Page {page.page_number}: {len(transactions)} transactions via {strategy}")
+                return transactions
+        
+        # Neither strategy worked, so this layout's remembered strategy is no guide
+        self.page_classifier.forget(signature)
+        return []
+    
+    def _infer_pdf_date_parser(self, pdf, max_pages: int = 3) -> DateParser:
+        """Infer the statement's date format from its first pages with text, cached pages' formats first"""
+        for page in pdf.pages[:max_pages]:
+            try:
+                page_hash = page_content_hash(page) if self.page_cache.enabled else None
+                seen, date_format = self.page_cache.text_date_format(page_hash) if page_hash else (False, None)
+                date_parser = DateParser(date_format) if seen else DateParser.infer_from_text(page.extract_text())
+            finally:
+                page.close()
+            if date_parser.date_format:
+                return date_parser
+        return DateParser()
+    
+    def _iter_pdf_parallel(self, file_path: str, page_count: int, date_parser: DateParser,
+                           memory_guard: MemoryGuard,
+                           cache_stats: PageCacheStats) -> Iterator[Tuple[List[Dict[str, Any]], List[int], int]]:
+        """Fan page ranges out to the worker pool, yielding each range's transactions, textless pages and end page in page order"""
+        chunk_size = max(1, math.ceil(page_count / (self.pdf_workers * 2)))
+        ranges = [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+        logger.info(f"Extracting {page_count} pages in {len(ranges)} ranges on {self.pdf_workers} workers")
+        
+        pool = self._get_pdf_pool()
+        futures = [
+            pool.submit(_extract_pdf_pages, file_path, start, end, date_parser.date_format, memory_guard.limit_mb)
+            for start, end in ranges
+        ]
+        
+        try:
+            for future, (_, end) in zip(futures, ranges):
+                rows, pages, worker_peak_rss, cache_counts = future.result()
+                memory_guard.observe(worker_peak_rss)
+                cache_stats.merge(cache_counts)
+                
+                transactions = []
+                for transaction_date, description, amount, reference in rows:
+                    transaction = {
+                        'transaction_date': transaction_date,
+                        'description': description,
+                        'amount': amount
+                    }
+                    if reference is not None:
+                        transaction['reference_number'] = reference
+                    transactions.append(transaction)
+                yield transactions, pages, end
+        finally:
+            # A failed range or an abandoned document leaves the rest of its pages unread
+            for future in futures:
+                future.cancel()
+    
+    def _get_pdf_pool(self) -> ProcessPoolExecutor:
+        """Lazily start the shared PDF page worker pool"""
+        with self._pdf_pool_lock:
+            if self._pdf_pool is None:
+                self._pdf_pool = ProcessPoolExecutor(max_workers=self.pdf_workers)
+            return self._pdf_pool
+    
+    def _read_csv(self, buffer, file_path: Optional[str] = None) -> List[Dict[str, Any]]:
         """Read CSV bank statements"""
+        transactions = [t for batch in self._iter_csv(buffer, file_path) for t in batch]
+        logger.info(f"Extracted {len(transactions)} transactions from CSV")
+        return transactions
+    
+    def _iter_csv(self, buffer, file_path: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Stream CSV bank statements in chunks of parsed transactions"""
         try:
-            # Detect encoding
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
-                detected = chardet.detect(raw_data)
-                encoding = detected['encoding']
-            
-            # Read CSV
-            df = pd.read_csv(file_path, encoding=encoding)
+            encoding = self._detect_encoding(buffer)
             
-            # Parse the dataframe
-            transactions = self._parse_dataframe(df)
-            
-            logger.info(f"Extracted {len(transactions)} transactions from CSV")
-            return transactions
+            # Undecodable bytes past the sample are replaced rather than failing the import
+            # Layout is resolved from the first chunk and kept for the whole file
+            layout = None
+            for chunk in pd.read_csv(buffer, encoding=encoding, encoding_errors='replace',
+                                     chunksize=self.csv_chunk_rows):
+                if layout is None:
+                    layout = self._dataframe_layout(chunk)
+                yield self._parse_dataframe(chunk, layout)
             
         except Exception as e:
-            logger.error(f"Error reading CSV {file_path}: {e}")
+            logger.error(f"Error reading CSV {file_path or '<buffer>'}: {e}")
             raise
     
-    def _read_excel(self, file_path: str) -> List[Dict[str, Any]]:
+    def _detect_encoding(self, buffer) -> str:
+        """Detect file encoding from a bounded prefix sample, leaving the buffer rewound"""
+        buffer.seek(0)
+        sample = buffer.read(self.encoding_sample_size)
+        buffer.seek(0)
+        
+        encoding = chardet.detect(sample)['encoding']
+        
+        # A plain ASCII prefix says nothing about the rest of the file
+        if not encoding or encoding.lower() == 'ascii':
+            return 'utf-8'
+        return encoding
+    
+    def _read_excel(self, buffer, file_path: Optional[str] = None) -> List[Dict[str, Any]]:
         """Read Excel bank statements"""
+        transactions = [t for batch in self._iter_excel(buffer, file_path) for t in batch]
+        logger.info(f"Extracted {len(transactions)} transactions from Excel")
+        return transactions
+    
+    def _iter_excel(self, buffer, file_path: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the first sheet of an Excel workbook in chunks of parsed transactions
+
+        .xlsx rows are read one at a time in openpyxl's read-only mode, so neither
+        the workbook nor the whole sheet as a DataFrame is held in memory. Legacy
+        .xls workbooks can only be loaded whole, by pandas.
+        """
         try:
-            # Read Excel file
-            df = pd.read_excel(file_path)
+            buffer.seek(0)
+            is_xlsx = buffer.read(len(ZIP_SIGNATURE)) == ZIP_SIGNATURE
+            buffer.seek(0)
             
-            # Parse the dataframe
-            transactions = self._parse_dataframe(df)
+            if not is_xlsx:
+                sheet = pd.read_excel(buffer, header=None, dtype=object)
+                sheet = sheet.where(sheet.notna(), None)
+                yield from self._iter_sheet_rows(sheet.itertuples(index=False, name=None))
+                return
             
-            logger.info(f"Extracted {len(transactions)} transactions from Excel")
-            return transactions
+            workbook = openpyxl.load_workbook(buffer, read_only=True, data_only=True)
+            try:
+                yield from self._iter_sheet_rows(workbook.worksheets[0].iter_rows(values_only=True))
+            finally:
+                workbook.close()
             
         except Exception as e:
-            logger.error(f"Error reading Excel {file_path}: {e}")
+            logger.error(f"Error reading Excel {file_path or '<buffer>'}: {e}")
             raise
     
-    def _read_image(self, file_path: str) -> List[Dict[str, Any]]:
+    def _iter_sheet_rows(self, rows: Iterator[tuple]) -> Iterator[List[Dict[str, Any]]]:
+        """Parse spreadsheet rows in DataFrame chunks, below the detected header row"""
+        rows = (row for row in rows if any(value is not None for value in row))
+        leading = list(islice(rows, self.excel_header_scan_rows))
+        if not leading:
+            return
+        
+        header_index = self._find_header_row(leading)
+        headers = [
+            f"Unnamed: {i}" if value is None else str(value).strip()
+            for i, value in enumerate(leading[header_index])
+        ]
+        width = len(headers)
+        if header_index:
+            logger.info(f"Skipped {header_index} rows above the Excel header row")
+        
+        # Layout is resolved from the first chunk and kept for the whole sheet, as for CSV
+        layout = None
+        data_rows = chain(leading[header_index + 1:], rows)
+        while True:
+            chunk_rows = [tuple(row[:width]) for row in islice(data_rows, self.csv_chunk_rows)]
+            if not chunk_rows:
+                break
+            chunk = pd.DataFrame(chunk_rows, columns=headers)
+            if layout is None:
+                layout = self._dataframe_layout(chunk)
+            yield self._parse_dataframe(chunk, layout)
+    
+    def _find_header_row(self, rows: List[tuple]) -> int:
+        """Index of the first row naming the date, description and amount columns, else 0
+
+        Exports often put the bank name, account and period above the table.
+        """
+        for index, row in enumerate(rows):
+            # Header rows are all text; data rows also hold dates and numbers
+            if not all(isinstance(value, str) for value in row if value is not None):
+                continue
+            column_mapping = self._identify_columns(['' if value is None else value for value in row])
+            if all(key in column_mapping for key in ('date', 'description', 'amount')):
+                return index
+        return 0
+    
+    def _read_image(self, buffer, file_path: Optional[str] = None) -> List[Dict[str, Any]]:
         """Read receipt images using OCR"""
         try:
-            # Open image
-            image = Image.open(file_path)
-            
-            # Extract text using OCR
-            text = pytesseract.image_to_string(image)
+            # The encoded bytes are smaller to hand to an OCR worker than a decoded image
+            buffer.seek(0)
+            ocr = self.ocr_service.recognize(buffer.read())
             
             # Extract transactions from OCR text
-            transactions = self._extract_from_text(text)
+            transactions = self._extract_from_text(ocr.text)
             
-            logger.info(f"Extracted {len(transactions)} transactions from image")
+            logger.info(f"Extracted {len(transactions)} transactions from image "
+                        f"(OCR confidence {ocr.confidence:.0%}, {ocr.seconds:.2f}s)")
             return transactions
             
         except Exception as e:
-            logger.error(f"Error reading image {file_path}: {e}")
+            logger.error(f"Error reading image {file_path or '<buffer>'}: {e}")
             raise
     
-    def _parse_dataframe(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Parse pandas DataFrame to extract transactions"""
-        transactions = []
+    def _parse_dataframe(self, df: pd.DataFrame, layout: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Parse pandas DataFrame to extract transactions, column by column"""
+        if layout is None:
+            layout = self._dataframe_layout(df)
+        column_mapping = layout['column_mapping']
+        if not all(key in column_mapping for key in ['date', 'description', 'amount']):
+            return []
         
-        # Identify columns
-        column_mapping = self._identify_columns(df.columns.tolist())
+        dates = self._parse_date_column(df.iloc[:, column_mapping['date']], DateParser(layout['date_format']))
+        descriptions = df.iloc[:, column_mapping['description']].fillna('').astype(str).str.strip()
+        amount_column = df.iloc[:, column_mapping['amount']]
+        amounts = self._parse_amount_column(amount_column, layout['amount_style'])
         
-        for _, row in df.iterrows():
-            transaction = self._create_transaction_from_row(row.tolist(), column_mapping)
-            if transaction:
-                transactions.append(transaction)
+        # Drop rows missing a required field
+        valid = dates.notna() & (descriptions != '') & amounts.notna()
         
-        return transactions
+        columns = {
+            'transaction_date': dates.dt.strftime('%Y-%m-%d')[valid].tolist(),
+            'description': descriptions[valid].tolist(),
+            'amount': amounts[valid].tolist()
+        }
+        if 'reference' in column_mapping:
+            references = df.iloc[:, column_mapping['reference']].fillna('').astype(str).str.strip()
+            columns['reference_number'] = references[valid].tolist()
+        
+        if columns['amount']:
+            self._record_layout(df.columns.tolist(), layout, amount_column)
+        
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+    
+    def _parse_date_column(self, column: pd.Series, date_parser: Optional[DateParser] = None) -> pd.Series:
+        """Parse a date column with one inferred format, falling back per value for stragglers"""
+        if is_datetime64_any_dtype(column):
+            return column
+        
+        dates = pd.Series(pd.NaT, index=column.index, dtype='datetime64[ns]')
+        is_date = self._date_cells(column)
+        if is_date.any():
+            dates[is_date] = pd.to_datetime(column[is_date], errors='coerce').values
+        
+        # Only text cells go through the inferred format; a date cell's str() never matches it
+        is_text = ~is_date & column.notna()
+        values = column[is_text].astype(str).str.strip()
+        if date_parser is None:
+            date_parser = DateParser.infer(values)
+        
+        if date_parser.date_format:
+            dates[is_text] = pd.to_datetime(values, format=date_parser.date_format, errors='coerce').values
+        
+        # Values in a different format than the rest of the column
+        stragglers = is_text & dates.isna()
+        if stragglers.any():
+            dates[stragglers] = pd.to_datetime(
+                column[stragglers].astype(str).str.strip().map(date_parser.parse), errors='coerce'
+            ).values
+        
+        return dates
+    
+    def _date_cells(self, column: pd.Series) -> pd.Series:
+        """Mask of cells already read as dates, as openpyxl does beside text cells like a 'Total' footer"""
+        if infer_dtype(column, skipna=True) in ('string', 'empty'):
+            return pd.Series(False, index=column.index)
+        return column.map(lambda value: isinstance(value, (datetime, date)) and not pd.isna(value))
+    
+    def _dataframe_layout(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Layout of a DataFrame's columns, from the registry or inferred from its values"""
+        return self._resolve_layout(
+            df.columns.tolist(), lambda index: self._date_text(df.iloc[:, index])
+        )
     
-    def _parse_table_data(self, table: List[List[str]]) -> List[Dict[str, Any]]:
+    def _date_text(self, column: pd.Series) -> pd.Series:
+        """A date column's text cells, the values a date format is inferred from"""
+        column = column.dropna()
+        return column[~self._date_cells(column)].astype(str)
+    
+    def _resolve_layout(self, headers: List[Any], date_values,
+                        date_parser: Optional[DateParser] = None) -> Dict[str, Any]:
+        """Column mapping, date format and amount style for a header row
+
+        Known layouts come from the registry, once their date format is checked
+        against the file's own date values (date_values(index)): common headers
+        are shared by banks that order dates differently. Unknown layouts are
+        inferred with the column heuristics and those date values, unless the
+        document's date format is already known.
+        """
+        template = self.layout_registry.lookup(headers)
+        if template is not None:
+            date_index = template['column_mapping'].get('date')
+            if date_index is None:
+                return template
+            sample = list(islice(date_values(date_index), DATE_SAMPLE_SIZE))
+            if DateParser(template['date_format']).fits(sample):
+                return template
+            
+            date_format = DateParser.infer(sample).date_format
+            logger.info(f"Layout {template['fingerprint']} date format {template['date_format']} "
+                        f"doesn't fit this file, re-inferred {date_format}")
+            template.update(self.layout_registry.record(
+                headers, template['column_mapping'], date_format, template['amount_style']
+            ))
+            return template
+        
+        column_mapping = self._identify_columns(headers)
+        date_format = date_parser.date_format if date_parser else None
+        if date_format is None and 'date' in column_mapping:
+            date_format = DateParser.infer(date_values(column_mapping['date'])).date_format
+        
+        return {
+            'fingerprint': None,
+            'column_mapping': column_mapping,
+            'date_format': date_format,
+            'amount_style': None
+        }
+    
+    def _record_layout(self, headers: List[Any], layout: Dict[str, Any], amount_values):
+        """Register an inferred layout once it has produced transactions"""
+        if layout['fingerprint'] is not None:
+            return
+        
+        layout.update(self.layout_registry.record(
+            headers, layout['column_mapping'], layout['date_format'], self._amount_style(amount_values)
+        ))
+        logger.info(f"Registered statement layout {layout['fingerprint']}: {layout['column_mapping']}")
+    
+    def _amount_style(self, values) -> str:
+        """'numeric' when sampled amounts are plain numbers, 'formatted' when they need cleaning"""
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        if is_numeric_dtype(values):
+            return 'numeric'
+        sample = values.dropna().astype(str).str.strip().head(DATE_SAMPLE_SIZE)
+        return 'numeric' if pd.to_numeric(sample, errors='coerce').notna().all() else 'formatted'
+    
+    def _parse_amount_column(self, column: pd.Series, amount_style: Optional[str] = None) -> pd.Series:
+        """Vectorized amount cleaning, matching _parse_amount"""
+        if is_numeric_dtype(column):
+            amounts = column.astype(float)
+        elif amount_style == 'numeric':
+            # Layout known to hold plain numbers: only values that don't convert get cleaned
+            amounts = pd.to_numeric(column.astype(str).str.strip().where(column.notna()), errors='coerce').astype(float)
+            stragglers = amounts.isna() & column.notna()
+            if stragglers.any():
+                amounts[stragglers] = self._clean_amount_column(column[stragglers])
+        else:
+            amounts = self._clean_amount_column(column)
+        
+        return amounts.where(amounts.abs() != math.inf)
+    
+    def _clean_amount_column(self, column: pd.Series) -> pd.Series:
+        """Strip currency symbols and separators and apply sign notation"""
+        raw = column.astype(str).where(column.notna(), '')
+        negative = raw.str.contains(AMOUNT_NEGATIVE_PATTERN, regex=True)
+        
+        amounts = pd.to_numeric(raw.str.replace(AMOUNT_JUNK_PATTERN, '', regex=True), errors='coerce').astype(float)
+        return amounts.where(~negative, -amounts)
+    
+    def _parse_table_data(self, table: List[List[str]], date_parser: Optional[DateParser] = None) -> List[Dict[str, Any]]:
         """Parse table data to extract transactions"""
         transactions = []
         
@@ -250,17 +793,25 @@ class DocumentReader:
         headers = table[0]
         data_rows = table[1:]
         
-        # Map common column names
-        column_mapping = self._identify_columns(headers)
+        # Known layouts skip column and date format inference
+        layout = self._resolve_layout(
+            headers, lambda index: (row[index] for row in data_rows if len(row) > index), date_parser
+        )
+        column_mapping = layout['column_mapping']
+        date_parser = DateParser(layout['date_format'])
         
         for row in data_rows:
             if len(row) < 3:  # Need at least date, description, amount
                 continue
                 
-            transaction = self._create_transaction_from_row(row, column_mapping)
+            transaction = self._create_transaction_from_row(row, column_mapping, date_parser)
             if transaction:
                 transactions.append(transaction)
         
+        if transactions:
+            amount_index = column_mapping['amount']
+            self._record_layout(headers, layout, [row[amount_index] for row in data_rows if len(row) > amount_index])
+        
         return transactions
     
     def _identify_columns(self, headers: List[str]) -> Dict[str, int]:
@@ -288,7 +839,8 @@ class DocumentReader:
         
         return column_mapping
     
-    def _create_transaction_from_row(self, row: List[str], column_mapping: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    def _create_transaction_from_row(self, row: List[str], column_mapping: Dict[str, int],
+                                     date_parser: Optional[DateParser] = None) -> Optional[Dict[str, Any]]:
         """Create transaction dictionary from row data"""
         try:
             transaction = {}
@@ -296,7 +848,7 @@ class DocumentReader:
             # Extract date
             if 'date' in column_mapping:
                 date_str = str(row[column_mapping['date']])
-                transaction['transaction_date'] = self._parse_date(date_str)
+                transaction['transaction_date'] = self._parse_date(date_str, date_parser)
             
             # Extract description
             if 'description' in column_mapping:
@@ -321,63 +873,36 @@ class DocumentReader:
             logger.warning(f"Error creating transaction from row: {e}")
             return None
     
-    def _extract_from_text(self, text: str) -> List[Dict[str, Any]]:
-        """Extract transactions from text using regex patterns"""
+    def _extract_from_text(self, text: str, date_parser: Optional[DateParser] = None) -> List[Dict[str, Any]]:
+        """Extract transactions from statement lines in one pass of the combined line pattern"""
         transactions = []
         
-        for pattern in self.transaction_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
-            for match in matches:
-                try:
-                    if len(match.groups()) == 3:
-                        if '$' in match.group(1):
-                            # Amount Date Description
-                            amount = self._parse_amount(match.group(1))
-                            date = self._parse_date(match.group(2))
-                            description = match.group(3).strip()
-                        elif '$' in match.group(2):
-                            # Date Amount Description
-                            date = self._parse_date(match.group(1))
-                            amount = self._parse_amount(match.group(2))
-                            description = match.group(3).strip()
-                        else:
-                            # Date Description Amount
-                            date = self._parse_date(match.group(1))
-                            description = match.group(2).strip()
-                            amount = self._parse_amount(match.group(3))
-                        
-                        if date and description and amount is not None:
-                            transactions.append({
-                                'transaction_date': date,
-                                'description': description,
-                                'amount': amount
-                            })
-                except Exception as e:
-                    logger.warning(f"Error parsing transaction match: {e}")
-                    continue
-        
-        return transactions
-    
-    def _parse_date(self, date_str: str) -> Optional[str]:
-        """Parse various date formats"""
-        if not date_str:
-            return None
-        
-        date_formats = [
-            '%m/%d/%Y', '%m/%d/%y', '%m-%d-%Y', '%m-%d-%y',
-            '%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d-%m-%y'
-        ]
+        if date_parser is None:
+            date_parser = DateParser.infer_from_text(text)
         
-        cleaned_date = date_str.strip()
-        
-        for fmt in date_formats:
+        for match in TRANSACTION_LINE_PATTERN.finditer(text):
             try:
-                parsed_date = datetime.strptime(cleaned_date, fmt)
-                return parsed_date.strftime('%Y-%m-%d')
-            except ValueError:
+                layout = match.lastgroup.split('_', 1)[0]
+                date = self._parse_date(match.group(f'{layout}_date'), date_parser)
+                description = match.group(f'{layout}_description').strip()
+                amount = self._parse_amount(match.group(f'{layout}_amount'))
+                
+                if date and description and amount is not None:
+                    transactions.append({
+                        'transaction_date': date,
+                        'description': description,
+                        'amount': amount
+                    })
+            except Exception as e:
+                logger.warning(f"Error parsing transaction match: {e}")
                 continue
         
-        return None
+        return transactions
+    
+    def _parse_date(self, date_str: str, date_parser: Optional[DateParser] = None) -> Optional[str]:
+        """Parse a date with the document's inferred format, trying every known format otherwise"""
+        parsed_date = (date_parser or DateParser()).parse(date_str)
+        return parsed_date.strftime('%Y-%m-%d') if parsed_date else None
     
     def _parse_amount(self, amount_str: str) -> Optional[float]:
         """Parse amount string to float"""
@@ -385,15 +910,24 @@ class DocumentReader:
             if not amount_str:
                 return None
             
-            # Remove currency symbols and commas
-            cleaned = re.sub(r'[$,]', '', amount_str.strip())
-            return float(cleaned)
+            negative = re.search(AMOUNT_NEGATIVE_PATTERN, amount_str) is not None
+            
+            # Remove currency symbols, commas and sign notation
+            amount = float(re.sub(AMOUNT_JUNK_PATTERN, '', amount_str))
+            if not math.isfinite(amount):
+                return None
+            return -amount if negative else amount
         except (ValueError, TypeError):
             return None
     
-    def _deduplicate_transactions(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Remove duplicate transactions"""
-        seen = set()
+    def deduplicate_transactions(self, transactions: List[Dict[str, Any]],
+                                 seen: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Remove duplicate transactions
+        
+        Pass the same seen set across batches to deduplicate a streamed document.
+        """
+        if seen is None:
+            seen = set()
         unique_transactions = []
         
         for transaction in transactions:
@@ -412,10 +946,11 @@ class DocumentReader:
     
     def _calculate_extraction_confidence(self, transactions: List[Dict[str, Any]]) -> float:
         """Calculate confidence score for extraction"""
-        if not transactions:
-            return 0.0
-        
-        # Simple confidence calculation based on data quality
+        total_score, valid_transactions = self.score_transactions(transactions)
+        return self.confidence_from_scores(total_score, valid_transactions, len(transactions))
+    
+    def score_transactions(self, transactions: List[Dict[str, Any]]) -> Tuple[float, int]:
+        """Sum data quality scores, return (total score, number of valid transactions)"""
         valid_transactions = 0
         total_score = 0.0
         
@@ -434,15 +969,18 @@ class DocumentReader:
             if score > 0.8:
                 valid_transactions += 1
         
-        # Calculate overall confidence
-        if len(transactions) > 0:
-            confidence = total_score / len(transactions)
-            # Boost confidence if most transactions are valid
-            if valid_transactions / len(transactions) > 0.8:
-                confidence = min(confidence * 1.2, 1.0)
-            return confidence
+        return total_score, valid_transactions
+    
+    def confidence_from_scores(self, total_score: float, valid_transactions: int, count: int) -> float:
+        """Overall extraction confidence from running score totals"""
+        if count == 0:
+            return 0.0
         
-        return 0.0
+        confidence = total_score / count
+        # Boost confidence if most transactions are valid
+        if valid_transactions / count > 0.8:
+            confidence = min(confidence * 1.2, 1.0)
+        return confidence
     
     def _get_file_extension(self, file_path: str) -> str:
         """Get file extension from path"""
@@ -0,0 +1,249 @@
+"""
+Job Queue - Durable SQLite-backed queue with leased jobs for background workers
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+from typing import Dict, Any, List, Optional
+from loguru import logger
+
+# Columns of a job as returned by get()
+JOB_COLUMNS = ('id, kind, document_id, payload, status, stage, progress, details, result, '
+               'error, attempts, max_attempts, created_at, updated_at')
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and another worker may have taken it over"""
+
+
+class JobQueue:
+    """Jobs stored in the application database and leased to one worker at a time
+
+    A worker that dies mid-job stops renewing its lease; once the lease expires
+    the job is handed to the next worker, up to max_attempts times.
+    """
+
+    def __init__(self, db_path: str = "./data/xspensesai.db", lease_seconds: float = 60,
+                 max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds  # renewed by every heartbeat
+        self.max_attempts = max_attempts
+        self._init_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Autocommit connection; claims use explicit BEGIN IMMEDIATE"""
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _init_table(self):
+        """Create the jobs table"""
+        conn = self._connect()
+        try:
+            # Readers (status polls) don't block the writers (workers)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    document_id INTEGER,
+                    payload TEXT,  -- JSON
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    stage TEXT,
+                    progress REAL DEFAULT 0.0,
+                    details TEXT,  -- JSON stage counters
+                    result TEXT,  -- JSON
+                    error TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER DEFAULT 3,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_status
+                ON jobs (status, created_at)
+            ''')
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], document_id: Optional[int] = None) -> Dict[str, Any]:
+        """Queue a job and return it"""
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO jobs (id, kind, document_id, payload, stage, max_attempts)
+                VALUES (?, ?, ?, ?, 'queued', ?)
+            ''', (job_id, kind, document_id, json.dumps(payload), self.max_attempts))
+        finally:
+            conn.close()
+        return self.get(job_id)
+
+    def lease(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Claim the oldest queued job, or a running one whose lease expired"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+
+            # Jobs that keep killing their workers are given up on, failing their
+            # documents too so uploads of the same content aren't sent to a dead job
+            conn.execute('''
+                UPDATE documents SET status = 'failed'
+                WHERE id IN (
+                    SELECT document_id FROM jobs
+                    WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts
+                )
+            ''', (now,))
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'failed', error = 'Lease expired after final attempt',
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts
+            ''', (now,))
+
+            row = conn.execute('''
+                SELECT id, status FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+                ORDER BY created_at, rowid
+                LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            job_id, previous_status = row
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'running', worker_id = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (worker_id, now + self.lease_seconds, job_id))
+            conn.execute('COMMIT')
+
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        if previous_status == 'running':
+            logger.warning(f"Job {job_id} lease expired, resuming on worker {worker_id}")
+        return self.get(job_id)
+
+    def heartbeat(self, job_id: str, worker_id: str, stage: Optional[str] = None,
+                  progress: Optional[float] = None, details: Optional[Dict[str, Any]] = None):
+        """Renew the lease and record stage progress; raises LeaseLost if the job moved on"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''
+                UPDATE jobs
+                SET lease_expires_at = ?,
+                    stage = COALESCE(?, stage),
+                    progress = COALESCE(?, progress),
+                    details = COALESCE(?, details),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ? AND status = 'running'
+            ''', (
+                time.time() + self.lease_seconds, stage, progress,
+                json.dumps(details) if details is not None else None, job_id, worker_id
+            ))
+        finally:
+            conn.close()
+
+        if cursor.rowcount != 1:
+            raise LeaseLost(f"Worker {worker_id} no longer holds job {job_id}")
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any],
+                 next_kind: Optional[str] = None, next_payload: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Mark a leased job completed, return the ID of the next_kind job queued for its document
+
+        The follow-up job is queued in the same transaction, so a worker dying
+        in between can't leave the document without it or queue it twice.
+        """
+        next_job_id = None
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.execute('''
+                UPDATE jobs
+                SET status = 'completed', stage = 'completed', progress = 1.0, result = ?,
+                    error = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ?
+            ''', (json.dumps(result), job_id, worker_id))
+
+            if next_kind and cursor.rowcount == 1:
+                next_job_id = str(uuid.uuid4())
+                conn.execute('''
+                    INSERT INTO jobs (id, kind, document_id, payload, stage, max_attempts)
+                    SELECT ?, ?, document_id, ?, 'queued', ? FROM jobs WHERE id = ?
+                ''', (next_job_id, next_kind, json.dumps(next_payload or {}), self.max_attempts, job_id))
+            conn.execute('COMMIT')
+
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        return next_job_id
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True) -> str:
+        """Record a failed attempt; the job is re-queued until it runs out of attempts, or at once without retry"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE jobs
+                SET status = CASE WHEN ? AND attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                    error = ?, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND worker_id = ?
+            ''', (retry, error, job_id, worker_id))
+            row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 'failed'
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status, stage and progress"""
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(f'''
+                SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?
+            ''', (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+        return self._decode(row) if row is not None else None
+
+    def latest_for_documents(self, document_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Most recent job of each document, by document ID"""
+        if not document_ids:
+            return {}
+
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            placeholders = ','.join('?' * len(document_ids))
+            rows = conn.execute(f'''
+                SELECT {JOB_COLUMNS} FROM jobs
+                WHERE document_id IN ({placeholders})
+                ORDER BY created_at, rowid
+            ''', list(document_ids)).fetchall()
+        finally:
+            conn.close()
+
+        # Later jobs of a document replace earlier ones
+        return {row['document_id']: self._decode(row) for row in rows}
+
+    def _decode(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Job dict from a jobs row, with its JSON fields parsed"""
+        job = dict(row)
+        job['job_id'] = job.pop('id')
+        for field in ('payload', 'details', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
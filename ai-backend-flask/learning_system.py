@@ -2,12 +2,39 @@
 Learning System - Remembers user preferences and gets smarter over time
 """
 
-import re
+import math
+import time
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from collections import defaultdict
 from loguru import logger
 
+from database import extract_merchant_key
+
+
+def _hour_mask(hours) -> int:
+    """Bitmask with one bit set per hour of the day"""
+    return sum(1 << hour for hour in hours)
+
+
+# Context buckets in precomputed form: inclusive numeric amount bounds and
+# hour-of-day bitmasks, so context matching is a few numeric comparisons
+AMOUNT_RANGE_BOUNDS = {
+    '0-50': (0.0, 50.0),
+    '50-100': (math.nextafter(50.0, math.inf), 100.0),
+    '100-500': (math.nextafter(100.0, math.inf), 500.0),
+    '500+': (math.nextafter(500.0, math.inf), math.inf)
+}
+UNKNOWN_AMOUNT_BOUNDS = (math.inf, -math.inf)  # matches nothing
+
+TIME_OF_DAY_HOUR_MASKS = {
+    'morning': _hour_mask(range(6, 12)),
+    'afternoon': _hour_mask(range(12, 17)),
+    'evening': _hour_mask(range(17, 22)),
+    'night': _hour_mask([22, 23, 0, 1, 2, 3, 4, 5])
+}
+
 
 class LearningSystem:
     """Learning system that improves categorization based on user feedback"""
@@ -17,67 +44,102 @@ class LearningSystem:
         self.min_confidence_threshold = 0.7
         self.max_learning_examples = 1000
         self.learning_decay_factor = 0.95
+        self.learning_decay_period_days = 7  # decay factor is applied once per period
+        self.min_learning_weight = 0.1  # decayed preferences below this are pruned
+        self.preference_cache_ttl = 60  # seconds
         
-        # Learning patterns cache
+        # Learning patterns cache: limit -> (loaded_at, preferences)
         self.pattern_cache = {}
         self.merchant_patterns = defaultdict(list)
         
-    def learn_from_correction(self, transaction: Dict[str, Any], 
-                             original_category: str, 
-                             corrected_category: str) -> Dict[str, Any]:
-        """Learn from user correction and update preferences"""
+    def learn_from_corrections(self, corrections: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Apply many category corrections in one database transaction and learn from them
+        
+        Each correction is {'transaction_id', 'corrected_category'}. Corrections
+        are aggregated per merchant pattern before the preferences are upserted,
+        and the preference cache is refreshed once at the end.
+        """
         try:
-            # Extract merchant pattern
-            merchant_pattern = self._extract_merchant_pattern(transaction.get('description', ''))
+            # JSON clients may send IDs as strings; the lookup below is keyed by int
+            transaction_ids = [int(correction['transaction_id']) for correction in corrections]
+            transactions = {t['id']: t for t in self.db.get_transactions_by_ids(transaction_ids)}
             
-            # Create learning entry
-            learning_entry = {
-                'merchant_pattern': merchant_pattern,
-                'original_category': original_category,
-                'preferred_category': corrected_category,
-                'confidence_score': transaction.get('ai_confidence', 0.0),
-                'amount': transaction.get('amount', 0),
-                'transaction_date': transaction.get('transaction_date'),
-                'context_data': self._extract_context_data(transaction)
-            }
+            transaction_categories = []
+            preferences = {}  # merchant_pattern -> aggregated preference
+            missing = []
+            total_impact = 0.0
             
-            # Save to database
-            self.db.save_user_preference(
-                merchant_pattern=merchant_pattern,
-                original_category=original_category,
-                preferred_category=corrected_category,
-                confidence_score=transaction.get('ai_confidence', 0.0),
-                context_data=learning_entry['context_data']
-            )
+            for transaction_id, correction in zip(transaction_ids, corrections):
+                transaction = transactions.get(transaction_id)
+                if not transaction:
+                    missing.append(transaction_id)
+                    continue
+                
+                corrected_category = correction['corrected_category']
+                original_category = transaction.get('ai_category') or 'Uncategorized'
+                confidence_score = transaction.get('ai_confidence') or 0.0
+                merchant_pattern = self._extract_merchant_pattern(transaction.get('description', ''))
+                transaction_categories.append((transaction['id'], corrected_category))
+                
+                pref = preferences.get(merchant_pattern)
+                if pref:
+                    # Latest correction wins
+                    pref['preferred_category'] = corrected_category
+                    pref['correction_count'] += 1
+                else:
+                    preferences[merchant_pattern] = {
+                        'merchant_pattern': merchant_pattern,
+                        'original_category': original_category,
+                        'preferred_category': corrected_category,
+                        'confidence_score': confidence_score,
+                        'correction_count': 1,
+                        'context_data': self._extract_context_data({'amount': transaction.get('amount', 0)})
+                    }
+                
+                total_impact += self._calculate_learning_impact({
+                    'merchant_pattern': merchant_pattern,
+                    'confidence_score': confidence_score
+                })
             
-            # Calculate learning impact
-            impact_score = self._calculate_learning_impact(learning_entry)
+            if transaction_categories:
+                self.db.apply_corrections(transaction_categories, list(preferences.values()))
+                self.pattern_cache.clear()
             
-            logger.info(f"Learned from correction: {merchant_pattern} -> {corrected_category} (impact: {impact_score:.2f})")
+            logger.info(f"Learned from {len(transaction_categories)} corrections across {len(preferences)} merchant patterns")
             
             return {
-                'learning_entry': learning_entry,
-                'impact_score': impact_score,
-                'pattern_updated': True
+                'corrected': len(transaction_categories),
+                'patterns_updated': len(preferences),
+                'merchant_patterns': list(preferences),
+                'missing_transaction_ids': missing,
+                'impact_score': total_impact / len(transaction_categories) if transaction_categories else 0.0
             }
             
         except Exception as e:
-            logger.error(f"Error learning from correction: {e}")
-            return {
-                'learning_entry': None,
-                'impact_score': 0.0,
-                'pattern_updated': False,
-                'error': str(e)
-            }
+            logger.error(f"Error learning from corrections: {e}")
+            raise
     
     def get_user_preferences(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's learning preferences for AI context"""
         try:
-            return self.db.get_user_preferences(limit)
+            cached = self.pattern_cache.get(limit)
+            if cached and time.monotonic() - cached[0] < self.preference_cache_ttl:
+                return cached[1]
+            
+            preferences = self.db.get_user_preferences(limit, weight_fn=self._decayed_weight)
+            # Matching reads these for every transaction; work them out once per load
+            for pref in preferences:
+                pref['context_features'] = self._context_features(pref.get('context_data'))
+            self.pattern_cache[limit] = (time.monotonic(), preferences)
+            return preferences
         except Exception as e:
             logger.error(f"Error getting user preferences: {e}")
             return []
     
+    def get_preferred_categories(self, merchant_keys: List[str] = None) -> Dict[str, str]:
+        """Map merchant keys to their learned category, skipping decayed preferences"""
+        return self.db.get_preferred_categories(self._decayed_weight, self.min_learning_weight, merchant_keys)
+    
     def predict_category(self, transaction: Dict[str, Any], 
                         ai_category: str, ai_confidence: float) -> Tuple[str, float]:
         """Predict category using learned patterns"""
@@ -116,23 +178,52 @@ class LearningSystem:
             logger.error(f"Error getting learning analytics: {e}")
             return {}
     
-    def _extract_merchant_pattern(self, description: str) -> str:
-        """Extract merchant pattern from transaction description"""
-        if not description:
-            return ""
+    def compact_preferences(self) -> int:
+        """Prune preferences whose decayed learning weight fell below the threshold"""
+        try:
+            pruned = self.db.delete_user_preferences_below(self._decayed_weight, self.min_learning_weight)
+            self.pattern_cache.clear()
+            if pruned:
+                logger.info(f"Pruned {pruned} decayed user preferences")
+            return pruned
+        except Exception as e:
+            logger.error(f"Error compacting user preferences: {e}")
+            return 0
+    
+    def start_compaction(self, interval: int) -> threading.Thread:
+        """Run compact_preferences every `interval` seconds on a daemon thread"""
+        stop_event = threading.Event()
         
-        # Clean description
-        cleaned = re.sub(r'\s+', ' ', description.strip().upper())
+        def compaction_loop():
+            while not stop_event.wait(interval):
+                self.compact_preferences()
         
-        # Extract first few words as merchant pattern
-        words = cleaned.split()[:3]
-        pattern = ' '.join(words)
+        thread = threading.Thread(target=compaction_loop, name="preference-compaction", daemon=True)
+        thread.stop_event = stop_event
+        thread.start()
+        return thread
+    
+    def _decayed_weight(self, learning_weight: float, last_corrected_at: Any,
+                        now: Optional[datetime] = None) -> float:
+        """Learning weight decayed by the decay factor once per period since the last correction"""
+        if learning_weight is None:
+            return 1.0
+        if not last_corrected_at:
+            return learning_weight
         
-        # Remove common prefixes/suffixes
-        pattern = re.sub(r'^(POS|PURCHASE|PAYMENT|DEBIT|CREDIT)\s+', '', pattern)
-        pattern = re.sub(r'\s+(LLC|INC|CORP|CO|LTD)$', '', pattern)
+        try:
+            if isinstance(last_corrected_at, str):
+                # SQLite CURRENT_TIMESTAMP is UTC
+                last_corrected_at = datetime.fromisoformat(last_corrected_at)
+            age_days = max(((now or datetime.utcnow()) - last_corrected_at).total_seconds(), 0) / 86400
+        except (ValueError, TypeError):
+            return learning_weight
         
-        return pattern.strip()
+        return learning_weight * self.learning_decay_factor ** (age_days / self.learning_decay_period_days)
+    
+    def _extract_merchant_pattern(self, description: str) -> str:
+        """Extract merchant pattern from transaction description"""
+        return extract_merchant_key(description)
     
     def _extract_context_data(self, transaction: Dict[str, Any]) -> Dict[str, Any]:
         """Extract context data from transaction"""
@@ -211,15 +302,14 @@ class LearningSystem:
         preference_scores = {}
         total_weight = 0
         
+        transaction_features = self._transaction_features(transaction)
         for pref in preferences:
-            weight = pref.get('learning_weight', 1.0)
+            weight = pref.get('effective_weight', pref.get('learning_weight', 1.0))
             category = pref.get('preferred_category', '')
             
             # Apply context matching
-            context_match = self._calculate_context_match(
-                transaction, 
-                pref.get('context_data', {})
-            )
+            context_features = pref.get('context_features') or self._context_features(pref.get('context_data'))
+            context_match = self._calculate_context_match(transaction_features, context_features)
             
             adjusted_weight = weight * context_match
             preference_scores[category] = preference_scores.get(category, 0) + adjusted_weight
@@ -247,86 +337,69 @@ class LearningSystem:
         
         return best_category, final_confidence
     
-    def _calculate_context_match(self, transaction: Dict[str, Any], context_data: Dict[str, Any]) -> float:
-        """Calculate how well transaction context matches preference context"""
+    def _context_features(self, context_data: Optional[Dict[str, Any]]) -> Tuple:
+        """Precompute context data as (amount_lo, amount_hi, day_of_week, hour_mask, total_factors)"""
         if not context_data:
-            return 1.0
+            return (None, None, None, 0, 0)
         
-        match_score = 0.0
+        amount_lo = amount_hi = day_of_week = None
+        hour_mask = 0
         total_factors = 0
         
-        # Amount range match
         if 'amount_range' in context_data:
-            transaction_amount = transaction.get('amount', 0)
-            pref_amount_range = context_data['amount_range']
-            
-            if self._amount_in_range(transaction_amount, pref_amount_range):
-                match_score += 1.0
+            amount_lo, amount_hi = AMOUNT_RANGE_BOUNDS.get(context_data['amount_range'], UNKNOWN_AMOUNT_BOUNDS)
             total_factors += 1
         
-        # Day of week match
         if 'day_of_week' in context_data:
-            transaction_date = transaction.get('transaction_date')
-            if transaction_date:
-                try:
-                    if isinstance(transaction_date, str):
-                        parsed_date = datetime.strptime(transaction_date, '%Y-%m-%d')
-                    else:
-                        parsed_date = transaction_date
-                    
-                    if parsed_date.weekday() == context_data['day_of_week']:
-                        match_score += 1.0
-                except:
-                    pass
+            day_of_week = context_data['day_of_week']
             total_factors += 1
         
-        # Time of day match
         if 'time_of_day' in context_data:
-            transaction_date = transaction.get('transaction_date')
-            if transaction_date:
-                try:
-                    if isinstance(transaction_date, str):
-                        parsed_date = datetime.strptime(transaction_date, '%Y-%m-%d')
-                    else:
-                        parsed_date = transaction_date
-                    
-                    hour = parsed_date.hour
-                    pref_time = context_data['time_of_day']
-                    
-                    if self._time_matches(hour, pref_time):
-                        match_score += 1.0
-                except:
-                    pass
+            hour_mask = TIME_OF_DAY_HOUR_MASKS.get(context_data['time_of_day'], 0)
             total_factors += 1
         
-        return match_score / total_factors if total_factors > 0 else 1.0
+        return (amount_lo, amount_hi, day_of_week, hour_mask, total_factors)
     
-    def _amount_in_range(self, amount: float, amount_range: str) -> bool:
-        """Check if amount falls within specified range"""
+    def _transaction_features(self, transaction: Dict[str, Any]) -> Tuple:
+        """Precompute transaction context as (amount, weekday, hour_bit) once per transaction"""
         try:
-            if amount_range == '0-50':
-                return 0 <= amount <= 50
-            elif amount_range == '50-100':
-                return 50 < amount <= 100
-            elif amount_range == '100-500':
-                return 100 < amount <= 500
-            elif amount_range == '500+':
-                return amount > 500
-        except:
-            pass
-        return False
+            amount = float(transaction.get('amount', 0))
+        except (TypeError, ValueError):
+            amount = math.nan  # compares false against every range
+        
+        transaction_date = transaction.get('transaction_date')
+        if not transaction_date:
+            return (amount, -1, 0)
+        
+        try:
+            if isinstance(transaction_date, str):
+                transaction_date = datetime.strptime(transaction_date, '%Y-%m-%d')
+            return (amount, transaction_date.weekday(), 1 << transaction_date.hour)
+        except (ValueError, AttributeError):
+            return (amount, -1, 0)
     
-    def _time_matches(self, hour: int, time_of_day: str) -> bool:
-        """Check if hour matches time of day"""
-        if time_of_day == 'morning':
-            return 6 <= hour < 12
-        elif time_of_day == 'afternoon':
-            return 12 <= hour < 17
-        elif time_of_day == 'evening':
-            return 17 <= hour < 22
-        elif time_of_day == 'night':
-            return hour >= 22 or hour < 6
-        return False
+    def _calculate_context_match(self, transaction_features: Tuple, context_features: Tuple) -> float:
+        """Calculate how well transaction context matches preference context"""
+        amount_lo, amount_hi, day_of_week, hour_mask, total_factors = context_features
+        if not total_factors:
+            return 1.0
+        
+        amount, weekday, hour_bit = transaction_features
+        match_score = 0.0
+        
+        # Amount range match
+        if amount_lo is not None and amount_lo <= amount <= amount_hi:
+            match_score += 1.0
+        
+        # Day of week match
+        if day_of_week is not None and weekday == day_of_week:
+            match_score += 1.0
+        
+        # Time of day match
+        if hour_mask & hour_bit:
+            match_score += 1.0
+        
+        return match_score / total_factors
     
     def _calculate_learning_impact(self, learning_entry: Dict[str, Any]) -> float:
         """Calculate the impact of a learning correction"""
@@ -0,0 +1,79 @@
+"""
+Memory Guard - Per-job resident memory ceiling and peak tracking
+"""
+
+import os
+import sys
+from typing import Optional
+from loguru import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+
+
+class MemoryLimitExceeded(Exception):
+    """A job grew past its memory ceiling; retrying it would hit the same ceiling"""
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, None where it can't be measured
+
+    Linux reads the current size from /proc; elsewhere the process peak from
+    getrusage is the closest available figure.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # macOS reports bytes, Linux KiB
+
+
+class MemoryGuard:
+    """Samples a process's resident memory while it works on one job
+
+    check() is called between units of work (a PDF page, a CSV chunk). It
+    records the peak and raises MemoryLimitExceeded once resident memory passes
+    limit_mb; a limit of 0 only records the peak.
+    """
+
+    def __init__(self, limit_mb: float = 0):
+        self.limit_bytes = int(limit_mb * MB) if limit_mb else 0
+        self.peak_rss = 0
+
+    def check(self, context: str = '') -> Optional[int]:
+        """Sample resident memory, raising MemoryLimitExceeded when over the limit"""
+        rss = current_rss()
+        if rss is None:
+            return None
+
+        self.observe(rss)
+        if self.limit_bytes and rss > self.limit_bytes:
+            where = f" at {context}" if context else ""
+            logger.error(f"Memory limit exceeded{where}: {rss / MB:.0f} MB resident, limit {self.limit_bytes / MB:.0f} MB")
+            raise MemoryLimitExceeded(
+                f"Document needs more than the {self.limit_bytes / MB:.0f} MB memory limit "
+                f"({rss / MB:.0f} MB resident{where})"
+            )
+        return rss
+
+    def observe(self, rss: Optional[int]):
+        """Record a resident memory sample taken elsewhere, e.g. by a page worker"""
+        if rss:
+            self.peak_rss = max(self.peak_rss, rss)
+
+    @property
+    def limit_mb(self) -> float:
+        return self.limit_bytes / MB
+
+    @property
+    def peak_rss_mb(self) -> float:
+        return round(self.peak_rss / MB, 1)
@@ -0,0 +1,160 @@
+"""
+OCR Service - Pool of warm Tesseract worker processes shared by receipts and image statements
+"""
+
+import io
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional
+from PIL import Image
+import pytesseract
+from loguru import logger
+
+WINDOWS_TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+
+def _init_worker(tesseract_cmd: Optional[str]):
+    """Worker: configure Tesseract once per process rather than per image"""
+    # Each worker runs one image at a time; Tesseract's own threads would only
+    # contend with the other workers for the same cores
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def _recognize(image, config: str = '', lang: Optional[str] = None) -> 'OcrResult':
+    """Worker: OCR one image into its text and word-level confidences
+
+    image is encoded image bytes, a path, a PIL image or a numpy array.
+    """
+    started = time.perf_counter()
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+    data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+    words = []
+    lines = {}
+    for index, text in enumerate(data['text']):
+        confidence = float(data['conf'][index])
+        # Rows for blocks, paragraphs and lines carry a confidence of -1
+        if confidence < 0 or not text.strip():
+            continue
+        words.append({
+            'text': text,
+            'confidence': round(confidence, 1),
+            'left': data['left'][index],
+            'top': data['top'][index],
+            'width': data['width'][index],
+            'height': data['height'][index]
+        })
+        line = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+        lines.setdefault(line, []).append(text)
+
+    text = '\n'.join(' '.join(line_words) for line_words in lines.values())
+    return OcrResult(text, words, time.perf_counter() - started)
+
+
+class OcrResult:
+    """Text recognized in one image, with each word's confidence (0-100) and box"""
+
+    def __init__(self, text: str, words: List[Dict[str, Any]], seconds: float):
+        self.text = text
+        self.words = words
+        self.seconds = seconds  # worker time spent on the image
+
+    @property
+    def confidence(self) -> float:
+        """Mean word confidence, 0-1"""
+        if not self.words:
+            return 0.0
+        return sum(word['confidence'] for word in self.words) / len(self.words) / 100
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'text': self.text,
+            'confidence': round(self.confidence, 3),
+            'words': self.words,
+            'seconds': round(self.seconds, 3)
+        }
+
+
+class OcrBatch:
+    """Results of a batch of images, in submission order, with its throughput"""
+
+    def __init__(self, results: List[OcrResult], seconds: float):
+        self.results = results
+        self.seconds = seconds  # wall-clock time for the whole batch
+
+    @property
+    def images_per_second(self) -> float:
+        return len(self.results) / self.seconds if self.seconds > 0 else 0.0
+
+
+class OcrService:
+    """Runs Tesseract OCR across a pool of worker processes kept warm between requests
+
+    Images are OCR'd concurrently, one per worker, so a batch scales with
+    cores instead of running image after image in the caller's thread. The
+    pool starts on first use (or start()) and lives until shutdown(); with
+    workers=0 images are OCR'd in the calling thread.
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: float = 60,
+                 tesseract_cmd: Optional[str] = None):
+        self.workers = workers if workers is not None else min(4, os.cpu_count() or 1)
+        self.timeout = timeout  # seconds to wait for one image
+        self.tesseract_cmd = tesseract_cmd or (WINDOWS_TESSERACT_CMD if os.name == 'nt' else None)
+        if self.tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def start(self) -> 'OcrService':
+        """Start every worker now, so the first images don't wait for processes to spawn"""
+        pool = self._get_pool()
+        if pool is not None:
+            for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+        return self
+
+    def recognize(self, image, config: str = '', lang: Optional[str] = None) -> OcrResult:
+        """OCR a single image on the pool"""
+        return self.recognize_batch([image], config, lang).results[0]
+
+    def recognize_batch(self, images: List[Any], config: str = '', lang: Optional[str] = None) -> OcrBatch:
+        """OCR images concurrently, results in the order given"""
+        started = time.perf_counter()
+        pool = self._get_pool()
+        if pool is None:
+            results = [_recognize(image, config, lang) for image in images]
+        else:
+            futures = [pool.submit(_recognize, image, config, lang) for image in images]
+            results = [future.result(timeout=self.timeout) for future in futures]
+
+        batch = OcrBatch(results, time.perf_counter() - started)
+        workers = f"{self.workers} workers" if pool is not None else "in-process"
+        logger.info(f"OCR'd {len(images)} images in {batch.seconds:.2f}s "
+                    f"({batch.images_per_second:.1f} images/s, {workers})")
+        return batch
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _get_pool(self) -> Optional[ProcessPoolExecutor]:
+        """The worker pool, created on first use; None when OCR runs in-process"""
+        if self.workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.tesseract_cmd,)
+                )
+            return self._pool
@@ -0,0 +1,233 @@
+"""
+Page Cache - On-disk cache of PDF page extraction results keyed by page content
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from typing import List, Dict, Any, Optional, Tuple
+from loguru import logger
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSLiteral
+
+MB = 1024 * 1024
+CACHE_VERSION = b'page-cache-1'  # bump when page extraction changes what a page yields
+HASH_MAX_DEPTH = 12  # nesting followed into a page's resources (fonts, form XObjects)
+
+
+def page_content_hash(page) -> Optional[str]:
+    """SHA-256 of a pdfplumber page's raw content streams and everything that decides its text
+
+    Content streams only draw glyphs by code, so the fonts (encodings,
+    ToUnicode maps, widths) and form XObjects they reference are hashed too,
+    along with the page geometry. Streams are hashed as stored, without
+    decompressing them. None when the page can't be hashed.
+    """
+    try:
+        page_obj = page.page_obj
+        digest = hashlib.sha256(CACHE_VERSION)
+        digest.update(repr((page_obj.mediabox, page_obj.cropbox, page_obj.rotate)).encode())
+        seen = set()
+        for stream in page_obj.contents:
+            _hash_object(digest, stream, seen, 0)
+        _hash_object(digest, page_obj.resources, seen, 0)
+        return digest.hexdigest()
+    except Exception as e:
+        logger.debug(f"Page {getattr(page, 'page_number', '?')} not cacheable: {e}")
+        return None
+
+
+def _hash_object(digest, obj, seen: set, depth: int):
+    """Feed a PDF object into the digest, following references once each"""
+    if depth > HASH_MAX_DEPTH:
+        digest.update(b'<deep>')
+        return
+
+    if isinstance(obj, PDFObjRef):
+        # Shared objects (a font used by every page) are hashed on first reference
+        if obj.objid in seen:
+            digest.update(b'R%d' % obj.objid)
+            return
+        seen.add(obj.objid)
+        obj = obj.resolve()
+
+    if isinstance(obj, PDFStream):
+        _hash_object(digest, obj.attrs, seen, depth + 1)
+        digest.update(obj.get_rawdata() or b'')
+    elif isinstance(obj, dict):
+        for key in sorted(obj):
+            digest.update(b'/' + str(key).encode())
+            _hash_object(digest, obj[key], seen, depth + 1)
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b'[')
+        for item in obj:
+            _hash_object(digest, item, seen, depth + 1)
+        digest.update(b']')
+    elif isinstance(obj, PSLiteral):
+        digest.update(b'/' + str(obj.name).encode())
+    elif isinstance(obj, bytes):
+        digest.update(obj)
+    else:
+        digest.update(repr(obj).encode())
+
+
+class CachedPage:
+    """A page's extraction as cached: transactions, or None for a page without text"""
+
+    def __init__(self, transactions: Optional[List[Dict[str, Any]]], extract_seconds: float):
+        self.transactions = transactions
+        self.extract_seconds = extract_seconds  # what extracting the page took when it was cached
+
+
+class PageCacheStats:
+    """Page cache hits and the extraction time they saved for one document"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def hit(self, seconds_saved: float):
+        self.hits += 1
+        self.seconds_saved += max(seconds_saved, 0.0)
+
+    def miss(self):
+        self.misses += 1
+
+    def merge(self, counts: Tuple[int, int, float]):
+        """Add (hits, misses, seconds_saved) counted by a page worker"""
+        hits, misses, seconds_saved = counts
+        self.hits += hits
+        self.misses += misses
+        self.seconds_saved += seconds_saved
+
+    def counts(self) -> Tuple[int, int, float]:
+        return self.hits, self.misses, self.seconds_saved
+
+    @property
+    def hit_rate(self) -> float:
+        pages = self.hits + self.misses
+        return self.hits / pages if pages else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hit_rate, 3),
+            'seconds_saved': round(self.seconds_saved, 3)
+        }
+
+
+class PageCache:
+    """Extraction results of PDF pages already seen, in a SQLite file shared by all workers
+
+    Entries are keyed by page content hash and the date format the page was
+    parsed with, and also record the date format the page's own text implies,
+    so a document whose format isn't known yet can still skip its first page.
+    Least recently used entries are evicted once the cache passes max_mb; a
+    max_mb of 0 disables the cache.
+    """
+
+    def __init__(self, path: str = "./data/page_cache.db", max_mb: float = 256):
+        self.path = path
+        self.max_bytes = int(max_mb * MB)
+        self._unchecked_bytes = 0  # written by this process since the size was last checked
+
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._init_table()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _init_table(self):
+        """Create the cache table"""
+        with self._connect() as conn:
+            # Page workers of every job process write here concurrently
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS page_cache (
+                    page_hash TEXT NOT NULL,
+                    date_format TEXT NOT NULL,  -- '' when parsed without a known format
+                    text_date_format TEXT,  -- format inferred from the page's own text
+                    has_text INTEGER NOT NULL,
+                    transactions TEXT NOT NULL,  -- JSON
+                    size INTEGER NOT NULL,
+                    extract_seconds REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (page_hash, date_format)
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_page_cache_last_used
+                ON page_cache (last_used)
+            ''')
+
+    def get(self, page_hash: str, date_format: Optional[str]) -> Optional[CachedPage]:
+        """Cached extraction of a page parsed with date_format, None on a miss"""
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT has_text, transactions, extract_seconds FROM page_cache
+                WHERE page_hash = ? AND date_format = ?
+            ''', (page_hash, date_format or '')).fetchone()
+            if row is None:
+                return None
+            conn.execute('''
+                UPDATE page_cache SET last_used = ? WHERE page_hash = ? AND date_format = ?
+            ''', (time.time(), page_hash, date_format or ''))
+
+        has_text, transactions, extract_seconds = row
+        return CachedPage(json.loads(transactions) if has_text else None, extract_seconds)
+
+    def text_date_format(self, page_hash: str) -> Tuple[bool, Optional[str]]:
+        """(seen, format) for the date format a cached page's text implies"""
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT text_date_format FROM page_cache WHERE page_hash = ? LIMIT 1
+            ''', (page_hash,)).fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    def put(self, page_hash: str, date_format: Optional[str], text_date_format: Optional[str],
+            transactions: Optional[List[Dict[str, Any]]], extract_seconds: float):
+        """Cache a page's extraction, transactions None for a page without text"""
+        payload = json.dumps(transactions or [])
+        size = len(page_hash) + len(payload) + 64  # approximate row size
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO page_cache
+                    (page_hash, date_format, text_date_format, has_text, transactions, size,
+                     extract_seconds, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (page_hash, date_format or '', text_date_format, transactions is not None, payload, size,
+                  extract_seconds, time.time()))
+
+        # Summing the table on every page would cost more than the cache saves
+        self._unchecked_bytes += size
+        if self._unchecked_bytes >= self.max_bytes // 20:
+            self._unchecked_bytes = 0
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache is within max_mb, return count dropped"""
+        with self._connect() as conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM page_cache').fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            # Make room for a while rather than evicting on every insert
+            cursor = conn.execute('''
+                DELETE FROM page_cache WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, SUM(size) OVER (ORDER BY last_used DESC, rowid DESC) AS kept
+                        FROM page_cache
+                    ) WHERE kept > ?
+                )
+            ''', (int(self.max_bytes * 0.9),))
+            evicted = cursor.rowcount
+        logger.info(f"Page cache evicted {evicted} pages: {total / MB:.1f} MB cached, limit {self.max_bytes / MB:g} MB")
+        return evicted
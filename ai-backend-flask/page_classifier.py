@@ -0,0 +1,95 @@
+"""
+Page Classifier - Picks one extraction strategy per PDF page from cheap layout features
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from date_parser import DATE_TOKEN_PATTERN
+
+STRATEGY_TABLE = 'table'  # ruled transaction table: pdfplumber table extraction
+STRATEGY_TEXT = 'text'  # free-flowing statement lines: line regex extraction
+
+HEADER_KEYWORDS = (
+    'date', 'description', 'details', 'amount', 'debit', 'credit',
+    'withdrawal', 'deposit', 'balance', 'reference', 'payee', 'memo'
+)
+AMOUNT_TOKEN_PATTERN = re.compile(r'\d\.\d{2}\b')
+MIN_RULING_EDGES = 2  # horizontal and vertical rules each needed for a ruled table
+
+
+class PageClassifier:
+    """Classifies pdfplumber pages and remembers the strategy that worked per layout
+
+    Pages without a line holding both a date and an amount (cover, summary and
+    legal pages) get no strategy and are skipped.
+    """
+
+    def __init__(self, max_layouts: int = 256):
+        self.max_layouts = max_layouts
+        self.decisions = OrderedDict()  # layout signature -> strategy
+        self._lock = threading.Lock()
+
+    def classify(self, page, text: Optional[str]) -> Tuple[List[str], tuple]:
+        """Return the strategies to try in order and the page's layout signature
+
+        A layout seen before gets the strategy that worked for it first; a new
+        layout gets its likely strategy first. The signature is coarse and
+        shared by every document a process reads, so the other strategy always
+        stays as a fallback, except on unruled new layouts, which have no table.
+        """
+        if not self.has_transaction_lines(text):
+            return [], ()
+
+        lines = text.splitlines()
+
+        header = self._probe_header(lines)
+        ruled = (len(page.horizontal_edges) >= MIN_RULING_EDGES
+                 and len(page.vertical_edges) >= MIN_RULING_EDGES)
+
+        # Statement pages from one template share geometry, ruling and header columns
+        signature = (round(page.width), round(page.height), ruled, header)
+
+        with self._lock:
+            strategy = self.decisions.get(signature)
+            if strategy is not None:
+                self.decisions.move_to_end(signature)
+                fallback = STRATEGY_TEXT if strategy == STRATEGY_TABLE else STRATEGY_TABLE
+                return [strategy, fallback], signature
+
+        if ruled and header:
+            return [STRATEGY_TABLE, STRATEGY_TEXT], signature
+        if ruled:
+            return [STRATEGY_TEXT, STRATEGY_TABLE], signature
+        return [STRATEGY_TEXT], signature
+
+    def record(self, signature: tuple, strategy: str):
+        """Remember the strategy that produced transactions for a layout"""
+        with self._lock:
+            self.decisions[signature] = strategy
+            self.decisions.move_to_end(signature)
+            while len(self.decisions) > self.max_layouts:
+                self.decisions.popitem(last=False)
+
+    def forget(self, signature: tuple):
+        """Drop a layout's strategy once it stops producing transactions"""
+        with self._lock:
+            self.decisions.pop(signature, None)
+
+    def has_transaction_lines(self, text: Optional[str]) -> bool:
+        """Whether any line of a page's text holds both a date and an amount"""
+        return bool(text) and any(
+            DATE_TOKEN_PATTERN.search(line) and AMOUNT_TOKEN_PATTERN.search(line)
+            for line in text.splitlines()
+        )
+
+    def _probe_header(self, lines) -> Tuple[str, ...]:
+        """Header keywords of the first line naming at least two statement columns"""
+        for line in lines:
+            lowered = line.lower()
+            keywords = tuple(keyword for keyword in HEADER_KEYWORDS if keyword in lowered)
+            if len(keywords) >= 2:
+                return keywords
+        return ()
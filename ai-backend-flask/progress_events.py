@@ -0,0 +1,161 @@
+"""
+Progress Events - Server-sent event stream of a document's processing progress
+"""
+
+import json
+import time
+from typing import Dict, Any, Iterator, Optional, Tuple
+from loguru import logger
+
+from document_pipeline import EXTRACTED_STATUSES
+
+FINAL_JOB_STATUSES = ('completed', 'failed')
+
+
+def format_event(event: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """One server-sent event"""
+    lines = [f"id: {event_id}"] if event_id else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class DocumentEvents:
+    """Streams what changed in a document's processing job as server-sent events
+
+    Workers run in other processes, so the stream polls the job row and the
+    transactions table rather than being pushed to. Events, in order:
+
+      upload        the stored document, sent first
+      stage         the job moved to another stage (queued, extracting, categorizing)
+      progress      the job's progress, counters or stage timings changed
+      transactions  transactions saved since the previous one
+      categorized   transactions categorized since the previous one
+      extracted     every transaction is saved; categorization continues as its own job
+      complete      categorization finished; failed when a job gave up. The stream ends after either
+
+    transactions and categorized events carry an id of the last saved and last
+    categorized transaction IDs sent; a client reconnecting with Last-Event-ID
+    gets only the rows after them.
+    """
+
+    def __init__(self, db, job_queue, poll_interval: float = 0.5, keepalive_seconds: float = 15,
+                 page_size: int = 500):
+        self.db = db
+        self.job_queue = job_queue
+        self.poll_interval = poll_interval
+        self.keepalive_seconds = keepalive_seconds  # comment line sent when nothing else was
+        self.page_size = page_size  # transactions per event
+
+    def stream(self, document_id: int, last_event_id: Optional[str] = None) -> Iterator[str]:
+        """Yield the document's events until it is categorized or its processing fails"""
+        saved_after, categorized_after = self.parse_event_id(last_event_id)
+        document = self.db.get_document(document_id)
+        job = self.job_queue.latest_for_documents([document_id]).get(document_id)
+
+        yield format_event('upload', {
+            'document_id': document_id,
+            'filename': document['original_filename'],
+            'file_size': document['file_size'],
+            'file_type': document['file_type'],
+            'batch_id': document['batch_id'],
+            'created_at': document['created_at'],
+            'upload_seconds': ((job or {}).get('payload') or {}).get('upload_seconds')
+        })
+        last_sent = time.monotonic()
+        stage, state = None, None
+        extracted = False
+
+        while True:
+            # Read the job and document before the rows, so every row saved before they moved on is sent
+            job = self.job_queue.latest_for_documents([document_id]).get(document_id)
+            document = self.db.get_document(document_id)
+            events = []
+
+            if job:
+                if job['stage'] != stage:
+                    stage = job['stage']
+                    events.append(format_event('stage', {'job_id': job['job_id'], 'stage': stage}))
+                job_state = {key: job[key] for key in ('job_id', 'status', 'stage', 'progress', 'details', 'error')}
+                if job_state != state:
+                    state = job_state
+                    events.append(format_event('progress', job_state))
+
+            for categorized in (False, True):
+                while True:
+                    after = categorized_after if categorized else saved_after
+                    transactions = self.db.get_transactions_after(document_id, after, self.page_size, categorized)
+                    if not transactions:
+                        break
+                    if categorized:
+                        categorized_after = transactions[-1]['id']
+                    else:
+                        saved_after = transactions[-1]['id']
+                    events.append(format_event(
+                        'categorized' if categorized else 'transactions',
+                        {'document_id': document_id, 'transactions': transactions},
+                        f"{saved_after}:{categorized_after}"
+                    ))
+                    if len(transactions) < self.page_size:
+                        break
+
+            if not extracted and document['status'] in EXTRACTED_STATUSES:
+                extracted = True
+                events.append(format_event('extracted', {
+                    'document_id': document_id,
+                    'total_transactions': document['total_transactions'],
+                    'extraction_confidence': document['extraction_confidence']
+                }))
+
+            yield from events
+            if events:
+                last_sent = time.monotonic()
+
+            # Documents processed before the job queue have no job to wait for. A
+            # finished extraction has already queued categorization as the latest job
+            if job is None or job['status'] in FINAL_JOB_STATUSES:
+                yield self.final_event(document_id, job)
+                return
+
+            if time.monotonic() - last_sent >= self.keepalive_seconds:
+                yield ': keep-alive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(self.poll_interval)
+
+    def wait_until_extracted(self, document_id: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """Poll until the document's transactions are all saved or it failed, None after timeout seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            document = self.db.get_document(document_id)
+            if document['status'] in EXTRACTED_STATUSES + ('failed',):
+                return document
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def final_event(self, document_id: int, job: Optional[Dict[str, Any]]) -> str:
+        """complete or failed event closing a document's stream"""
+        document = self.db.get_document(document_id)
+        if (job and job['status'] == 'failed') or document['status'] == 'failed':
+            return format_event('failed', {
+                'document_id': document_id,
+                'error': job['error'] if job else None
+            })
+        return format_event('complete', {
+            'document_id': document_id,
+            'status': document['status'],
+            'total_transactions': document['total_transactions'],
+            'extraction_confidence': document['extraction_confidence'],
+            'result': job['result'] if job else None
+        })
+
+    def parse_event_id(self, last_event_id: Optional[str]) -> Tuple[int, int]:
+        """Last saved and last categorized transaction IDs a reconnecting client has seen"""
+        if not last_event_id:
+            return 0, 0
+        try:
+            saved_after, categorized_after = (int(part) for part in last_event_id.split(':'))
+            return saved_after, categorized_after
+        except ValueError:
+            logger.warning(f"Ignoring malformed Last-Event-ID {last_event_id!r}")
+            return 0, 0
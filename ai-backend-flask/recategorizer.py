@@ -0,0 +1,116 @@
+"""
+Re-categorization Jobs - Applies learned preferences to historical transactions
+"""
+
+import time
+import uuid
+import queue
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from loguru import logger
+
+
+class Recategorizer:
+    """Background jobs that apply learned preferences to stored transactions set-wise"""
+
+    def __init__(self, learning_system, batch_size: int = 200,
+                 throttle_seconds: float = 0.05, confidence: float = 0.95):
+        self.learning_system = learning_system
+        self.db = learning_system.db
+        self.batch_size = batch_size  # merchant keys per UPDATE batch
+        self.throttle_seconds = throttle_seconds  # pause between batches
+        self.confidence = confidence  # confidence recorded for re-categorized rows
+        self.max_jobs = 100  # finished jobs kept for status lookups
+
+        self.jobs = OrderedDict()
+        self.jobs_lock = threading.Lock()
+        self.job_queue = queue.Queue()
+
+        # One worker keeps re-categorization writes serialized
+        self.worker = threading.Thread(target=self._worker_loop, name="recategorizer", daemon=True)
+        self.worker.start()
+
+    def submit(self, merchant_keys: List[str] = None) -> Dict[str, Any]:
+        """Queue a re-categorization job, for all learned merchants when no keys are given"""
+        job_id = str(uuid.uuid4())
+        job = {
+            'job_id': job_id,
+            'status': 'queued',
+            'merchant_keys': len(merchant_keys) if merchant_keys is not None else None,
+            'total_merchants': 0,
+            'processed_merchants': 0,
+            'updated_transactions': 0,
+            'progress': 0.0,
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'completed_at': None
+        }
+
+        with self.jobs_lock:
+            self.jobs[job_id] = job
+            while len(self.jobs) > self.max_jobs:
+                oldest_id, oldest = next(iter(self.jobs.items()))
+                if oldest['status'] in ('queued', 'running'):
+                    break
+                del self.jobs[oldest_id]
+            snapshot = dict(job)
+
+        self.job_queue.put((job_id, list(merchant_keys) if merchant_keys is not None else None))
+        return snapshot
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a snapshot of a job's status and progress"""
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update_job(self, job_id: str, **fields):
+        """Update job fields under the lock"""
+        with self.jobs_lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields)
+
+    def _worker_loop(self):
+        """Run queued jobs one at a time"""
+        while True:
+            job_id, merchant_keys = self.job_queue.get()
+            try:
+                self._run_job(job_id, merchant_keys)
+            finally:
+                self.job_queue.task_done()
+
+    def _run_job(self, job_id: str, merchant_keys: Optional[List[str]]):
+        """Apply preferred categories batch by batch, reporting progress"""
+        self._update_job(job_id, status='running', started_at=datetime.now().isoformat())
+
+        try:
+            merchant_categories = self.learning_system.get_preferred_categories(merchant_keys)
+            keys = sorted(merchant_categories)
+            self._update_job(job_id, total_merchants=len(keys))
+
+            updated = 0
+            for start in range(0, len(keys), self.batch_size):
+                batch = {key: merchant_categories[key] for key in keys[start:start + self.batch_size]}
+                updated += self.db.recategorize_merchants(batch, self.confidence)
+
+                processed = start + len(batch)
+                self._update_job(
+                    job_id,
+                    processed_merchants=processed,
+                    updated_transactions=updated,
+                    progress=processed / len(keys)
+                )
+
+                # Throttle so uploads and categorization keep getting the database
+                if processed < len(keys):
+                    time.sleep(self.throttle_seconds)
+
+            self._update_job(job_id, status='completed', progress=1.0, completed_at=datetime.now().isoformat())
+            logger.info(f"Re-categorization job {job_id} updated {updated} transactions across {len(keys)} merchants")
+
+        except Exception as e:
+            logger.error(f"Error in re-categorization job {job_id}: {e}")
+            self._update_job(job_id, status='failed', error=str(e), completed_at=datetime.now().isoformat())
@@ -5,20 +5,32 @@ Handles receipt image analysis and transaction extraction
 """
 
 import cv2
+import math
 import numpy as np
-import pytesseract
-from PIL import Image
 import re
 import json
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Any
 import os
 
+from ocr_service import OcrService
+from document_pipeline import StageTimer
+
+# Fast noise estimate (Immerkaer): flat regions and straight edges cancel out, noise doesn't
+NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
 class ReceiptProcessor:
-    def __init__(self):
-        # Configure pytesseract path for Windows
-        if os.name == 'nt':  # Windows
-            pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+    def __init__(self, ocr_service: Optional[OcrService] = None):
+        # Shared warm worker pool when given (the API server's); otherwise OCR in-process
+        self.ocr_service = ocr_service or OcrService(workers=0)
+        
+        # Adaptive preprocessing: Tesseract reads best at about 300 DPI, and a
+        # receipt's paper is about 80 mm (3.15 in) wide
+        self.ocr_dpi = 300
+        self.receipt_width_inches = 3.15
+        self.noise_threshold = 3.0  # estimated noise sigma above which an image is denoised
+        self.region_detect_side = 600  # long side of the thumbnail searched for the receipt
+        self.ocr_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz\s\.\,\$\-\/\(\)'
         
         self.merchant_patterns = [
             r'([A-Z][A-Z\s&]+(?:STORE|MARKET|SHOP|RESTAURANT|CAFE|PIZZA|BURGER|GAS|STATION))',
@@ -46,67 +58,163 @@ class ReceiptProcessor:
         """
         Process a receipt image and extract transaction details
         """
-        try:
-            # Load and preprocess image
-            image = self._load_and_preprocess_image(image_path)
-            
-            # Extract text from image
-            text = self._extract_text(image)
-            
-            # Parse receipt data
-            receipt_data = self._parse_receipt_text(text)
-            
-            # Create transaction object
-            transaction = self._create_transaction(receipt_data)
-            
-            return {
-                'success': True,
-                'transaction': transaction,
-                'raw_text': text,
-                'confidence': self._calculate_confidence(receipt_data),
-                'processing_time': datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e),
-                'processing_time': datetime.now().isoformat()
-            }
+        return self.process_receipt_images([image_path])[0]
     
-    def _load_and_preprocess_image(self, image_path: str) -> np.ndarray:
+    def process_receipt_images(self, image_paths: List[str]) -> List[Dict]:
         """
-        Load and preprocess image for better OCR
+        Process receipt images, OCR'ing them concurrently; one result per path, in order
         """
-        # Load image
-        image = cv2.imread(image_path)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply noise reduction
-        denoised = cv2.fastNlMeansDenoising(gray)
-        
-        # Apply threshold to get binary image
-        _, binary = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Apply morphological operations to clean up
-        kernel = np.ones((1, 1), np.uint8)
-        cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        
-        return cleaned
+        results = [None] * len(image_paths)
+        images = {}
+        timers = [StageTimer() for _ in image_paths]
+        preprocessing = {}
+        for index, image_path in enumerate(image_paths):
+            try:
+                images[index], preprocessing[index] = self._load_and_preprocess_image(image_path, timers[index])
+            except Exception as e:
+                results[index] = self._failed_result(e)
+        
+        if images:
+            try:
+                batch = self.ocr_service.recognize_batch(list(images.values()), self.ocr_config)
+            except Exception as e:
+                for index in images:
+                    results[index] = self._failed_result(e)
+            else:
+                for index, ocr in zip(images, batch.results):
+                    try:
+                        timers[index].seconds['ocr'] = ocr.seconds
+                        results[index] = self._receipt_result(ocr, timers[index], preprocessing[index])
+                    except Exception as e:
+                        results[index] = self._failed_result(e)
+        
+        return results
     
-    def _extract_text(self, image: np.ndarray) -> str:
+    def _receipt_result(self, ocr, timer: StageTimer, preprocessing: Dict[str, Any]) -> Dict:
         """
-        Extract text from preprocessed image using OCR
+        Parse an image's OCR result into a receipt transaction
         """
-        # Configure OCR parameters
-        custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz\s\.\,\$\-\/\(\)'
-        
-        # Extract text
-        text = pytesseract.image_to_string(image, config=custom_config)
+        text = ocr.text.upper()
+        
+        # Parse receipt data
+        receipt_data = self._parse_receipt_text(text)
+        
+        # Create transaction object
+        transaction = self._create_transaction(receipt_data)
+        
+        return {
+            'success': True,
+            'transaction': transaction,
+            'raw_text': text,
+            'confidence': self._calculate_confidence(receipt_data),
+            'ocr_confidence': round(ocr.confidence, 3),
+            'ocr_words': ocr.words,
+            'preprocessing': preprocessing,
+            'stage_seconds': timer.snapshot(),
+            'processing_time': datetime.now().isoformat()
+        }
+    
+    def _failed_result(self, error: Exception) -> Dict:
+        return {
+            'success': False,
+            'error': str(error),
+            'processing_time': datetime.now().isoformat()
+        }
+    
+    def _load_and_preprocess_image(self, image_path: str, timer: Optional[StageTimer] = None
+                                   ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Load and preprocess image for better OCR, only doing the work an image needs
+
+        The receipt is cropped out of the photo and scaled down to about
+        ocr_dpi before anything else, so the later stages work on a fraction
+        of the pixels, and denoising (the costliest stage) only runs when the
+        estimated noise calls for it. Returns the binary image and what was
+        done to it; each stage's time is added to timer.
+        """
+        timer = timer or StageTimer()
         
-        return text.upper()
+        # Load image
+        with timer.stage('load'):
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                raise ValueError(f"Could not read image {os.path.basename(image_path)}")
+        height, width = gray.shape
+        
+        # Crop to the receipt when it stands out from the background
+        with timer.stage('crop'):
+            region = self._find_receipt_region(gray)
+            if region:
+                x, y, w, h = region
+                gray = gray[y:y + h, x:x + w]
+        
+        # Scale the receipt's width down to ocr_dpi
+        with timer.stage('downscale'):
+            target_width = int(self.receipt_width_inches * self.ocr_dpi)
+            scale = min(1.0, target_width / gray.shape[1])
+            if scale < 1.0:
+                gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        
+        # Apply noise reduction only to noisy images
+        with timer.stage('noise_estimate'):
+            noise_sigma = self._estimate_noise(gray)
+        denoised = noise_sigma > self.noise_threshold
+        if denoised:
+            with timer.stage('denoise'):
+                gray = cv2.fastNlMeansDenoising(gray, h=min(noise_sigma, 15.0))
+        
+        with timer.stage('threshold'):
+            # Apply threshold to get binary image
+            _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            
+            # Apply morphological operations to clean up
+            kernel = np.ones((1, 1), np.uint8)
+            cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        
+        return cleaned, {
+            'original_size': [width, height],
+            'cropped': region is not None,
+            'scale': round(scale, 3),
+            'noise_sigma': round(noise_sigma, 2),
+            'denoised': denoised
+        }
+    
+    def _find_receipt_region(self, gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Bounding box (x, y, w, h) of the bright paper in a photo, None when there's no distinct receipt
+        """
+        height, width = gray.shape
+        scale = min(1.0, self.region_detect_side / max(height, width))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        
+        # Paper is brighter than the table behind it; closing fills in the printed text
+        blurred = cv2.GaussianBlur(small, (5, 5), 0)
+        _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        
+        x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        # A scan fills the frame, and a small bright patch isn't the receipt
+        coverage = (w * h) / (small.shape[0] * small.shape[1])
+        if coverage < 0.15 or coverage > 0.9:
+            return None
+        
+        # Stay just inside the paper's edge; dark borders read as text to Tesseract
+        inset = int(0.01 * min(w, h)) + 1
+        x, y, w, h = x + inset, y + inset, max(1, w - 2 * inset), max(1, h - 2 * inset)
+        return int(x / scale), int(y / scale), int(w / scale), int(h / scale)
+    
+    def _estimate_noise(self, gray: np.ndarray) -> float:
+        """
+        Standard deviation of the image's noise, estimated in one filter pass
+        """
+        height, width = gray.shape
+        if height < 3 or width < 3:
+            return 0.0
+        response = cv2.filter2D(gray, cv2.CV_32F, NOISE_KERNEL)
+        return float(np.abs(response).sum()) * math.sqrt(math.pi / 2) / (6 * (width - 2) * (height - 2))
     
     def _parse_receipt_text(self, text: str) -> Dict:
         """
@@ -7,6 +7,7 @@ import os
 import sys
 from dotenv import load_dotenv
 from api_server import XspensesAPIServer
+from worker import WorkerPool
 from loguru import logger
 
 def main():
@@ -29,14 +30,26 @@ def main():
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    job_workers = int(os.getenv('JOB_WORKERS', 2))
     
+    worker_pool = None
     try:
         # Create and start server
         server = XspensesAPIServer()
         
+        # The debug reloader re-runs this script in a child process; only the first run owns the workers
+        if job_workers > 0 and os.getenv('WERKZEUG_RUN_MAIN') != 'true':
+            worker_pool = WorkerPool(
+                workers=job_workers,
+                db_path=server.db.db_path,
+                poll_interval=float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+            ).start()
+        
         print("🚀 Starting XspensesAI Flask Backend...")
         print(f"📍 Server will be available at: http://{host}:{port}")
         print(f"🔧 Debug mode: {'Enabled' if debug else 'Disabled'}")
+        if worker_pool:
+            print(f"👷 Document job workers: {job_workers}")
         print("📚 API Documentation: http://localhost:5000/api/health")
         print("\nPress Ctrl+C to stop the server")
         print("-" * 50)
@@ -50,6 +63,9 @@ def main():
         logger.error(f"Failed to start server: {e}")
         print(f"❌ Error starting server: {e}")
         sys.exit(1)
+    finally:
+        if worker_pool:
+            worker_pool.stop()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
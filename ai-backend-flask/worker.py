@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Worker - Process pool that leases document jobs from the SQLite job queue
+"""
+
+import os
+import time
+import signal
+import socket
+import threading
+import multiprocessing
+from typing import List
+from dotenv import load_dotenv
+from loguru import logger
+
+from job_queue import JobQueue, LeaseLost
+from memory_guard import MemoryLimitExceeded
+from document_pipeline import JOB_CATEGORIZE_DOCUMENT
+
+DEFAULT_DB_PATH = "./data/xspensesai.db"
+
+
+def process_job(queue: JobQueue, pipeline, job: dict, worker_id: str):
+    """Run one leased job, keeping its lease alive until it completes or fails"""
+    job_id = job['job_id']
+    lease_lost = threading.Event()
+    finished = threading.Event()
+
+    # Long extractions yield nothing for minutes; renew the lease independently of progress
+    def keep_alive():
+        while not finished.wait(queue.lease_seconds / 3):
+            try:
+                queue.heartbeat(job_id, worker_id)
+            except LeaseLost:
+                lease_lost.set()
+                return
+            except Exception as e:
+                logger.error(f"Error renewing lease of job {job_id}: {e}")
+
+    def report(stage, progress, details):
+        if lease_lost.is_set():
+            raise LeaseLost(f"Worker {worker_id} no longer holds job {job_id}")
+        queue.heartbeat(job_id, worker_id, stage, progress, details)
+
+    keeper = threading.Thread(target=keep_alive, name=f"lease-{job_id}", daemon=True)
+    keeper.start()
+    logger.info(f"Worker {worker_id} processing job {job_id} (attempt {job['attempts']}/{job['max_attempts']})")
+
+    try:
+        payload = job['payload']
+        if job['kind'] == JOB_CATEGORIZE_DOCUMENT:
+            result = pipeline.categorize_document(job['document_id'], report, batch_id=payload.get('batch_id'))
+            queue.complete(job_id, worker_id, result)
+        else:
+            result = pipeline.extract_document(
+                job['document_id'], payload['file_path'], report, member=payload.get('member')
+            )
+            # Queued behind extractions already waiting, so every upload's transactions come first
+            queue.complete(job_id, worker_id, result, next_kind=JOB_CATEGORIZE_DOCUMENT, next_payload=payload)
+        logger.info(f"Job {job_id} completed: {result}")
+
+    except LeaseLost as e:
+        # Another worker owns the job now; its checkpoints make our partial work safe
+        logger.warning(f"Abandoning job {job_id}: {e}")
+
+    except MemoryLimitExceeded as e:
+        # Deterministic for the document, so another attempt would only hit the ceiling again
+        logger.error(f"Job {job_id} failed: {e}")
+        queue.fail(job_id, worker_id, str(e), retry=False)
+        pipeline.db.update_document_status(job['document_id'], 'failed')
+
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}")
+        if queue.fail(job_id, worker_id, str(e)) == 'failed':
+            pipeline.db.update_document_status(job['document_id'], 'failed')
+
+    finally:
+        finished.set()
+        keeper.join()
+
+
+def run_worker(worker_id: str, db_path: str = DEFAULT_DB_PATH, poll_interval: float = 1.0,
+               stop_event=None):
+    """Lease and process jobs until stop_event is set"""
+    load_dotenv()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent stops workers via stop_event
+
+    # Imported here so each worker process builds its own components
+    from database import XspensesDatabase
+    from document_reader import DocumentReader
+    from ai_categorizer import AICategorizer
+    from learning_system import LearningSystem
+    from document_pipeline import DocumentPipeline
+
+    db = XspensesDatabase(db_path)
+    queue = JobQueue(
+        db_path,
+        lease_seconds=float(os.getenv('JOB_LEASE_SECONDS', 60)),
+        max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+    )
+    pipeline = DocumentPipeline(
+        db, DocumentReader(), AICategorizer(), LearningSystem(db),
+        memory_limit_mb=float(os.getenv('JOB_MEMORY_LIMIT_MB', 0))
+    )
+    stop_event = stop_event or multiprocessing.Event()
+    logger.info(f"Worker {worker_id} started")
+
+    while not stop_event.is_set():
+        try:
+            job = queue.lease(worker_id)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} could not lease a job: {e}")
+            job = None
+
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        process_job(queue, pipeline, job, worker_id)
+
+    logger.info(f"Worker {worker_id} stopped")
+
+
+class WorkerPool:
+    """Worker processes sharing one job queue"""
+
+    def __init__(self, workers: int = 2, db_path: str = DEFAULT_DB_PATH, poll_interval: float = 1.0):
+        self.workers = workers
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.stop_event = multiprocessing.Event()
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self) -> 'WorkerPool':
+        """Start the worker processes"""
+        host = socket.gethostname()
+        for index in range(self.workers):
+            worker_id = f"{host}-{os.getpid()}-{index}"
+            # Not daemonic: workers start their own PDF extraction processes
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(worker_id, self.db_path, self.poll_interval, self.stop_event),
+                name=f"job-worker-{index}"
+            )
+            process.start()
+            self.processes.append(process)
+        logger.info(f"Started {self.workers} job workers")
+        return self
+
+    def stop(self, timeout: float = 30):
+        """Ask workers to finish their current job, terminating any that don't in time"""
+        self.stop_event.set()
+        deadline = time.time() + timeout
+        for process in self.processes:
+            process.join(max(deadline - time.time(), 0))
+            if process.is_alive():
+                # Its job's lease expires and another worker resumes it
+                process.terminate()
+                process.join()
+        self.processes = []
+
+
+def main():
+    """Run the worker pool in the foreground"""
+    load_dotenv()
+    pool = WorkerPool(
+        workers=int(os.getenv('JOB_WORKERS', 2)),
+        poll_interval=float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    ).start()
+
+    print(f"👷 Processing document jobs with {pool.workers} workers")
+    print("Press Ctrl+C to stop")
+    try:
+        for process in pool.processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers...")
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
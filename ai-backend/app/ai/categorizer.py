@@ -93,7 +93,7 @@ class ExpenseCategorizer:
             response = await self._get_ai_response(prompt)
             
             # Parse batch response
-            results = self._parse_batch_response(response, transactions)
+            results = await self._parse_batch_response(response, transactions)
             
             logger.info(f"Categorized {len(results)} transactions in batch")
             
@@ -316,7 +316,7 @@ Respond in JSON format:
                 "transaction_id": transaction.get('id')
             }
     
-    def _parse_batch_response(self, response: str, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def _parse_batch_response(self, response: str, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Parse AI response for batch transactions"""
         try:
             # Extract JSON from response
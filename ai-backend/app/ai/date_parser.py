@@ -0,0 +1,140 @@
+"""
+Date format inference: one format per document, parsed with a specialized pattern
+"""
+
+import re
+import calendar
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+
+DATE_FORMATS = [
+    '%m/%d/%Y', '%m/%d/%y', '%m-%d-%Y', '%m-%d-%y',
+    '%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d-%m-%y'
+]
+DATE_SAMPLE_SIZE = 500  # date values sampled to infer a document's format
+
+DATE_TOKEN_PATTERN = re.compile(r'\b(\d{1,4})([/-])(\d{1,2})\2(\d{2,4})\b')
+DIRECTIVE_PATTERNS = {'%Y': r'(\d{4})', '%y': r'(\d{2})', '%m': r'(\d{1,2})', '%d': r'(\d{1,2})'}
+
+
+def _expand_year(year: int) -> int:
+    """Two-digit years follow strptime's %y pivot"""
+    return year + (2000 if year < 69 else 1900)
+
+
+class DateParser:
+    """Parses dates in one inferred format, falling back to trying every known format"""
+
+    def __init__(self, date_format: Optional[str] = None):
+        self.date_format = date_format
+        self._pattern = None
+        self._directives = None
+
+        if date_format:
+            directives = re.findall(r'%[Ymdy]', date_format)
+            separator = date_format[2]
+            self._pattern = re.compile(
+                r'\s*' + re.escape(separator).join(DIRECTIVE_PATTERNS[d] for d in directives) + r'\s*'
+            )
+            self._directives = directives
+
+    @classmethod
+    def infer(cls, values: Iterable[str]) -> 'DateParser':
+        """Infer the format shared by sampled date strings
+
+        Day/month order is decided by values that only fit one order (a first
+        field above 12 means day-first); fully ambiguous samples stay month-first.
+        """
+        layouts = Counter()
+        day_first = Counter()
+        month_first = Counter()
+
+        sampled = 0
+        for value in values:
+            if sampled >= DATE_SAMPLE_SIZE:
+                break
+            match = DATE_TOKEN_PATTERN.fullmatch(str(value).strip())
+            if not match:
+                continue
+            sampled += 1
+
+            first, separator, second, last = match.groups()
+            if len(first) == 4:
+                if len(last) <= 2:
+                    layouts[f'%Y{separator}%m{separator}%d'] += 1
+                continue
+            if len(last) not in (2, 4):
+                continue
+
+            layout = (separator, '%Y' if len(last) == 4 else '%y')
+            layouts[layout] += 1
+            if int(first) > 12:
+                day_first[layout] += 1
+            elif int(second) > 12:
+                month_first[layout] += 1
+
+        if not layouts:
+            return cls()
+
+        layout = layouts.most_common(1)[0][0]
+        if isinstance(layout, str):
+            date_format = layout
+        else:
+            separator, year = layout
+            order = ('%d', '%m') if day_first[layout] > month_first[layout] else ('%m', '%d')
+            date_format = separator.join(order + (year,))
+
+        return cls(date_format if date_format in DATE_FORMATS else None)
+
+    @classmethod
+    def infer_from_text(cls, text: str) -> 'DateParser':
+        """Infer the format from date-like tokens in a block of text"""
+        return cls.infer(match.group(0) for match in DATE_TOKEN_PATTERN.finditer(text or ''))
+
+    def fits(self, values: Iterable[str]) -> bool:
+        """Whether every sampled date-like value parses in this format, without the trial loop"""
+        sampled = 0
+        for value in values:
+            if sampled >= DATE_SAMPLE_SIZE:
+                break
+            value = str(value).strip()
+            if not DATE_TOKEN_PATTERN.fullmatch(value):
+                continue
+            sampled += 1
+            if self._parse_format(value) is None:
+                return False
+        return True
+
+    def parse(self, value: str) -> Optional[datetime]:
+        """Parse a date string, using the inferred format before the trial loop"""
+        if not value:
+            return None
+
+        parsed = self._parse_format(value)
+        if parsed is not None:
+            return parsed
+
+        # Values in another format than the rest of the document
+        cleaned = value.strip()
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(cleaned, fmt)
+            except ValueError:
+                continue
+
+        return None
+
+    def _parse_format(self, value: str) -> Optional[datetime]:
+        """Parse a date string in the inferred format only"""
+        if not self._pattern:
+            return None
+        match = self._pattern.fullmatch(value)
+        if not match:
+            return None
+        fields = dict(zip(self._directives, map(int, match.groups())))
+        year = fields['%Y'] if '%Y' in fields else _expand_year(fields['%y'])
+        month, day = fields['%m'], fields['%d']
+        if year >= 1 and 1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1]:
+            return datetime(year, month, day)
+        return None
@@ -4,27 +4,156 @@ Smart document processor for extracting transactions from various file formats
 
 import os
 import re
+import math
+import asyncio
+import threading
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype, is_numeric_dtype
 import pdfplumber
+import openpyxl
 import pytesseract
 from PIL import Image
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterator, Tuple
+from datetime import date, datetime
 import chardet
 from loguru import logger
 
 from ..config import settings
+from .date_parser import DateParser, DATE_SAMPLE_SIZE
+from .page_classifier import PageClassifier, STRATEGY_TABLE
+from .layout_registry import LayoutRegistry
+
+# Amount notation: "(12.50)", "12.50-" and "12.50 DR" are negative, "12.50 CR" positive
+AMOUNT_NEGATIVE_PATTERN = r'(?i)^\s*\(.*\)\s*$|-\s*$|DR\s*$'
+AMOUNT_JUNK_PATTERN = r'(?i)[$,()\s]|-\s*$|[CD]R\s*$'
+
+# Statement line layouts in one line-anchored alternation, so a page is scanned once and
+# each line matches at most once; group prefixes name the layout (date/description/amount)
+DATE_TOKEN = r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}'
+AMOUNT_TOKEN = r'\(?-?\$?-?(?:\d{1,3}(?:,\d{3})+|\d+)\.\d{2}\)?(?:-|[ \t]?[CD]R)?'
+TRANSACTION_LINE_PATTERN = re.compile(
+    r'^[ \t]*(?:'
+    # Date Description Amount, with an optional running balance column
+    r'(?P<dda_date>' + DATE_TOKEN + r')[ \t]+(?P<dda_description>[^\n]+?)[ \t]+'
+    r'(?P<dda_amount>' + AMOUNT_TOKEN + r')(?:[ \t]+' + AMOUNT_TOKEN + r')?'
+    # Amount Date Description
+    r'|(?P<ada_amount>' + AMOUNT_TOKEN + r')[ \t]+(?P<ada_date>' + DATE_TOKEN + r')[ \t]+'
+    r'(?P<ada_description>[^\n]+?)'
+    r')[ \t\r]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# .xlsx workbooks are zip packages; anything else is read as legacy .xls
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+# Shared extraction worker pool and the per-process processor its workers use
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+_worker_processor = None
+
+
+def _get_extraction_pool() -> ProcessPoolExecutor:
+    """Lazily start the shared extraction worker pool"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(max_workers=settings.PDF_WORKERS)
+        return _extraction_pool
+
+
+def shutdown_extraction_pool():
+    """Stop the extraction workers, e.g. on application shutdown"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(cancel_futures=True)
+            _extraction_pool = None
+
+
+async def _run_extraction(func, *args):
+    """Run a CPU-bound extraction function on the worker pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_extraction_pool(), func, *args)
+
+
+def _get_worker_processor() -> 'DocumentProcessor':
+    """Processor reused by every task a worker process runs"""
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = DocumentProcessor()
+    return _worker_processor
+
+
+def _probe_pdf(file_path: str) -> Tuple[int, Optional[str]]:
+    """Worker: page count, and the date format when the PDF is large enough to split"""
+    with pdfplumber.open(file_path) as pdf:
+        page_count = len(pdf.pages)
+        date_format = None
+        if settings.PDF_WORKERS > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+            date_format = _get_worker_processor()._infer_pdf_date_parser(pdf).date_format
+    return page_count, date_format
+
+
+def _extract_pdf_pages(file_path: str, start: int, end: int,
+                       date_format: Optional[str]) -> List[Tuple[Any, str, float, Optional[str]]]:
+    """Worker: extract pages [start, end) of a PDF as compact transaction tuples
+
+    Without a date format the first page with dates decides it for the rest.
+    """
+    processor = _get_worker_processor()
+    date_parser = DateParser(date_format)
+    rows = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages[start:end]:
+            text = page.extract_text()
+            if text and not date_parser.date_format:
+                date_parser = DateParser.infer_from_text(text)
+            
+            for transaction in processor._extract_page(page, date_parser, text):
+                rows.append((
+                    transaction['transaction_date'],
+                    transaction['description'],
+                    transaction['amount'],
+                    transaction.get('reference_number')
+                ))
+    return rows
+
+
+def _extract_excel_rows(file_path: str) -> List[Tuple[Any, str, float, Optional[str]]]:
+    """Worker: stream an Excel workbook's first sheet into compact transaction tuples"""
+    return [
+        (
+            transaction['transaction_date'],
+            transaction['description'],
+            transaction['amount'],
+            transaction.get('reference_number')
+        )
+        for batch in _get_worker_processor()._iter_excel(file_path)
+        for transaction in batch
+    ]
+
+
+def _extract_file(file_path: str, file_type: str) -> List[Dict[str, Any]]:
+    """Worker: extract a whole Excel workbook or receipt image"""
+    processor = _get_worker_processor()
+    if file_type in ('xlsx', 'xls'):
+        return processor._read_excel(file_path)
+    return processor._read_image(file_path)
 
 
 class DocumentProcessor:
     """Smart document processor for extracting financial transactions"""
     
     def __init__(self):
+        self.page_classifier = PageClassifier()  # per-layout extraction strategy, shared across documents
+        self.layout_registry = LayoutRegistry(settings.LAYOUT_REGISTRY_PATH)
         self.supported_formats = {
             'pdf': self._process_pdf,
             'csv': self._process_csv,
-            'xlsx': self._process_excel',
-            'xls': self._process_excel',
+            'xlsx': self._process_excel,
+            'xls': self._process_excel,
             'jpg': self._process_image,
             'jpeg': self._process_image,
             'png': self._process_image
@@ -57,30 +186,53 @@ class DocumentProcessor:
             logger.error(f"Error processing document {file_path}: {e}")
             raise
     
-    async def _process_pdf(self, file_path: str) -> List[Dict[str, Any]]:
-        """Extract transactions from PDF bank statements"""
-        transactions = []
+    async def iter_transactions(self, file_path: str, file_type: str) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield deduplicated transactions in batches
+
+        CSV is streamed from a thread. Excel sheets are read on the worker pool
+        and yielded in CSV_CHUNK_ROWS batches; other formats yield one batch.
+        """
+        file_type = file_type.lower()
+        if file_type not in self.supported_formats:
+            raise ValueError(f"Unsupported file type: {file_type}")
         
+        seen = set()
+        if file_type == 'csv':
+            # Chunks are read and parsed on a thread; the generator keeps memory bounded
+            loop = asyncio.get_running_loop()
+            batches = self._iter_csv(file_path)
+            while True:
+                batch = await loop.run_in_executor(None, next, batches, None)
+                if batch is None:
+                    break
+                batch = self._deduplicate_transactions(batch, seen)
+                if batch:
+                    yield batch
+        elif file_type in ('xlsx', 'xls'):
+            # openpyxl is pure Python and would hold the GIL on a thread, so the sheet is
+            # streamed on the worker pool and comes back whole, as compact tuples
+            rows = await _run_extraction(_extract_excel_rows, file_path)
+            for start in range(0, len(rows), settings.CSV_CHUNK_ROWS):
+                batch = self._transactions_from_rows(rows[start:start + settings.CSV_CHUNK_ROWS])
+                batch = self._deduplicate_transactions(batch, seen)
+                if batch:
+                    yield batch
+        else:
+            batch = self._deduplicate_transactions(await self.supported_formats[file_type](file_path), seen)
+            if batch:
+                yield batch
+    
+    async def _process_pdf(self, file_path: str) -> List[Dict[str, Any]]:
+        """Extract transactions from PDF bank statements on the worker pool"""
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for page_num, page in enumerate(pdf.pages):
-                    logger.info(f"Processing PDF page {page_num + 1}")
-                    
-                    # Extract text from page
-                    text = page.extract_text()
-                    if not text:
-                        continue
-                    
-                    # Try to extract tables
-                    tables = page.extract_tables()
-                    if tables:
-                        for table in tables:
-                            table_transactions = self._parse_table_data(table)
-                            transactions.extend(table_transactions)
-                    
-                    # Also try to extract from text using regex patterns
-                    text_transactions = self._extract_from_text(text)
-                    transactions.extend(text_transactions)
+            page_count, date_format = await _run_extraction(_probe_pdf, file_path)
+            
+            if settings.PDF_WORKERS > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+                transactions = await self._process_pdf_parallel(file_path, page_count, DateParser(date_format))
+            else:
+                logger.info(f"Extracting {page_count} PDF pages on one worker")
+                rows = await _run_extraction(_extract_pdf_pages, file_path, 0, page_count, None)
+                transactions = self._transactions_from_rows(rows)
             
             # Remove duplicates and validate
             transactions = self._deduplicate_transactions(transactions)
@@ -90,41 +242,187 @@ class DocumentProcessor:
             logger.error(f"Error processing PDF {file_path}: {e}")
             raise
     
+    def _extract_page(self, page, date_parser: DateParser, text: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Extract transactions from one pdfplumber page with the strategy its layout calls for"""
+        if text is None:
+            text = page.extract_text()
+        
+        # Cover, summary and legal pages come back without strategies
+        strategies, signature = self.page_classifier.classify(page, text)
+        for strategy in strategies:
+            if strategy == STRATEGY_TABLE:
+                transactions = []
+                for table in page.extract_tables():
+                    transactions.extend(self._parse_table_data(
+                        table, date_parser if date_parser.date_format else None
+                    ))
+            else:
+                transactions = self._extract_from_text(text, date_parser)
+            
+            if transactions:
+                # Replaces a remembered strategy that came up empty
+                self.page_classifier.record(signature, strategy)
+                return transactions
+        
+        # Neither strategy worked, so this layout's remembered strategy is no guide
+        self.page_classifier.forget(signature)
+        return []
+    
+    def _infer_pdf_date_parser(self, pdf, max_pages: int = 3) -> DateParser:
+        """Infer the statement's date format from its first pages with text"""
+        for page in pdf.pages[:max_pages]:
+            date_parser = DateParser.infer_from_text(page.extract_text())
+            if date_parser.date_format:
+                return date_parser
+        return DateParser()
+    
+    async def _process_pdf_parallel(self, file_path: str, page_count: int,
+                                    date_parser: DateParser) -> List[Dict[str, Any]]:
+        """Fan page ranges out to the worker pool, merging results in page order"""
+        chunk_size = max(1, math.ceil(page_count / (settings.PDF_WORKERS * 2)))
+        ranges = [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+        logger.info(f"Extracting {page_count} pages in {len(ranges)} ranges on {settings.PDF_WORKERS} workers")
+        
+        results = await asyncio.gather(*[
+            _run_extraction(_extract_pdf_pages, file_path, start, end, date_parser.date_format)
+            for start, end in ranges
+        ])
+        
+        return self._transactions_from_rows(row for rows in results for row in rows)
+    
+    def _transactions_from_rows(self, rows) -> List[Dict[str, Any]]:
+        """Expand compact worker tuples back into transactions"""
+        transactions = []
+        for transaction_date, description, amount, reference in rows:
+            transaction = {
+                'transaction_date': transaction_date,
+                'description': description,
+                'amount': amount
+            }
+            if reference is not None:
+                transaction['reference_number'] = reference
+            transactions.append(transaction)
+        return transactions
+    
     async def _process_csv(self, file_path: str) -> List[Dict[str, Any]]:
-        """Extract transactions from CSV files"""
+        """Extract transactions from CSV files on a thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, lambda: [transaction for batch in self._iter_csv(file_path) for transaction in batch]
+        )
+    
+    def _iter_csv(self, file_path: str) -> Iterator[List[Dict[str, Any]]]:
+        """Stream CSV files in chunks of parsed transactions"""
         try:
-            # Detect encoding
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
-                detected = chardet.detect(raw_data)
-                encoding = detected['encoding']
-            
-            # Read CSV with detected encoding
-            df = pd.read_csv(file_path, encoding=encoding)
+            encoding = self._detect_encoding(file_path)
             
-            # Try to identify transaction columns
-            transactions = self._parse_dataframe(df)
-            return transactions
+            # Undecodable bytes past the sample are replaced rather than failing the import
+            # Layout is resolved from the first chunk and kept for the whole file
+            layout = None
+            for chunk in pd.read_csv(file_path, encoding=encoding, encoding_errors='replace',
+                                     chunksize=settings.CSV_CHUNK_ROWS):
+                if layout is None:
+                    layout = self._dataframe_layout(chunk)
+                yield self._parse_dataframe(chunk, layout)
             
         except Exception as e:
             logger.error(f"Error processing CSV {file_path}: {e}")
             raise
     
+    def _detect_encoding(self, file_path: str) -> str:
+        """Detect file encoding from a bounded prefix sample"""
+        with open(file_path, 'rb') as f:
+            sample = f.read(settings.ENCODING_SAMPLE_SIZE)
+        
+        encoding = chardet.detect(sample)['encoding']
+        
+        # A plain ASCII prefix says nothing about the rest of the file
+        if not encoding or encoding.lower() == 'ascii':
+            return 'utf-8'
+        return encoding
+    
     async def _process_excel(self, file_path: str) -> List[Dict[str, Any]]:
+        """Extract transactions from Excel files on the worker pool"""
+        return await _run_extraction(_extract_file, file_path, 'xlsx')
+    
+    async def _process_image(self, file_path: str) -> List[Dict[str, Any]]:
+        """Extract transactions from receipt images on the worker pool"""
+        return await _run_extraction(_extract_file, file_path, 'image')
+    
+    def _read_excel(self, file_path: str) -> List[Dict[str, Any]]:
         """Extract transactions from Excel files"""
+        return [transaction for batch in self._iter_excel(file_path) for transaction in batch]
+    
+    def _iter_excel(self, file_path: str) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the first sheet of an Excel workbook in chunks of parsed transactions
+
+        .xlsx rows are read one at a time in openpyxl's read-only mode, so neither
+        the workbook nor the whole sheet as a DataFrame is held in memory. Legacy
+        .xls workbooks can only be loaded whole, by pandas.
+        """
         try:
-            # Read Excel file
-            df = pd.read_excel(file_path)
+            with open(file_path, 'rb') as f:
+                is_xlsx = f.read(len(ZIP_SIGNATURE)) == ZIP_SIGNATURE
             
-            # Parse the dataframe
-            transactions = self._parse_dataframe(df)
-            return transactions
+            if not is_xlsx:
+                sheet = pd.read_excel(file_path, header=None, dtype=object)
+                sheet = sheet.where(sheet.notna(), None)
+                yield from self._iter_sheet_rows(sheet.itertuples(index=False, name=None))
+                return
+            
+            workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                yield from self._iter_sheet_rows(workbook.worksheets[0].iter_rows(values_only=True))
+            finally:
+                workbook.close()
             
         except Exception as e:
             logger.error(f"Error processing Excel {file_path}: {e}")
             raise
     
-    async def _process_image(self, file_path: str) -> List[Dict[str, Any]]:
+    def _iter_sheet_rows(self, rows: Iterator[tuple]) -> Iterator[List[Dict[str, Any]]]:
+        """Parse spreadsheet rows in DataFrame chunks, below the detected header row"""
+        rows = (row for row in rows if any(value is not None for value in row))
+        leading = list(islice(rows, settings.EXCEL_HEADER_SCAN_ROWS))
+        if not leading:
+            return
+        
+        header_index = self._find_header_row(leading)
+        headers = [
+            f"Unnamed: {i}" if value is None else str(value).strip()
+            for i, value in enumerate(leading[header_index])
+        ]
+        width = len(headers)
+        if header_index:
+            logger.info(f"Skipped {header_index} rows above the Excel header row")
+        
+        # Layout is resolved from the first chunk and kept for the whole sheet, as for CSV
+        layout = None
+        data_rows = chain(leading[header_index + 1:], rows)
+        while True:
+            chunk_rows = [tuple(row[:width]) for row in islice(data_rows, settings.CSV_CHUNK_ROWS)]
+            if not chunk_rows:
+                break
+            chunk = pd.DataFrame(chunk_rows, columns=headers)
+            if layout is None:
+                layout = self._dataframe_layout(chunk)
+            yield self._parse_dataframe(chunk, layout)
+    
+    def _find_header_row(self, rows: List[tuple]) -> int:
+        """Index of the first row naming the date, description and amount columns, else 0
+
+        Exports often put the bank name, account and period above the table.
+        """
+        for index, row in enumerate(rows):
+            # Header rows are all text; data rows also hold dates and numbers
+            if not all(isinstance(value, str) for value in row if value is not None):
+                continue
+            column_mapping = self._identify_columns(['' if value is None else value for value in row])
+            if all(key in column_mapping for key in ('date', 'description', 'amount')):
+                return index
+        return 0
+    
+    def _read_image(self, file_path: str) -> List[Dict[str, Any]]:
         """Extract transactions from receipt images using OCR"""
         try:
             # Open image
@@ -141,7 +439,7 @@ class DocumentProcessor:
             logger.error(f"Error processing image {file_path}: {e}")
             raise
     
-    def _parse_table_data(self, table: List[List[str]]) -> List[Dict[str, Any]]:
+    def _parse_table_data(self, table: List[List[str]], date_parser: Optional[DateParser] = None) -> List[Dict[str, Any]]:
         """Parse table data to extract transactions"""
         transactions = []
         
@@ -152,32 +450,181 @@ class DocumentProcessor:
         headers = table[0]
         data_rows = table[1:]
         
-        # Map common column names
-        column_mapping = self._identify_columns(headers)
+        # Known layouts skip column and date format inference
+        layout = self._resolve_layout(
+            headers, lambda index: (row[index] for row in data_rows if len(row) > index), date_parser
+        )
+        column_mapping = layout['column_mapping']
+        date_parser = DateParser(layout['date_format'])
         
         for row in data_rows:
             if len(row) < 3:  # Need at least date, description, amount
                 continue
                 
-            transaction = self._create_transaction_from_row(row, column_mapping)
+            transaction = self._create_transaction_from_row(row, column_mapping, date_parser)
             if transaction:
                 transactions.append(transaction)
         
+        if transactions:
+            amount_index = column_mapping['amount']
+            self._record_layout(headers, layout, [row[amount_index] for row in data_rows if len(row) > amount_index])
+        
         return transactions
     
-    def _parse_dataframe(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
-        """Parse pandas DataFrame to extract transactions"""
-        transactions = []
+    def _parse_dataframe(self, df: pd.DataFrame, layout: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Parse pandas DataFrame to extract transactions, column by column"""
+        if layout is None:
+            layout = self._dataframe_layout(df)
+        column_mapping = layout['column_mapping']
+        if not all(key in column_mapping for key in ['date', 'description', 'amount']):
+            return []
         
-        # Identify columns
-        column_mapping = self._identify_columns(df.columns.tolist())
+        dates = self._parse_date_column(df.iloc[:, column_mapping['date']], DateParser(layout['date_format']))
+        descriptions = df.iloc[:, column_mapping['description']].fillna('').astype(str).str.strip()
+        amount_column = df.iloc[:, column_mapping['amount']]
+        amounts = self._parse_amount_column(amount_column, layout['amount_style'])
         
-        for _, row in df.iterrows():
-            transaction = self._create_transaction_from_row(row.tolist(), column_mapping)
-            if transaction:
-                transactions.append(transaction)
+        # Drop rows missing a required field
+        valid = dates.notna() & (descriptions != '') & amounts.notna()
         
-        return transactions
+        columns = {
+            'transaction_date': dates[valid].dt.to_pydatetime().tolist(),
+            'description': descriptions[valid].tolist(),
+            'amount': amounts[valid].tolist()
+        }
+        if 'reference' in column_mapping:
+            references = df.iloc[:, column_mapping['reference']].fillna('').astype(str).str.strip()
+            columns['reference_number'] = references[valid].tolist()
+        
+        if columns['amount']:
+            self._record_layout(df.columns.tolist(), layout, amount_column)
+        
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+    
+    def _parse_date_column(self, column: pd.Series, date_parser: Optional[DateParser] = None) -> pd.Series:
+        """Parse a date column with one inferred format, falling back per value for stragglers"""
+        if is_datetime64_any_dtype(column):
+            return column
+        
+        dates = pd.Series(pd.NaT, index=column.index, dtype='datetime64[ns]')
+        is_date = self._date_cells(column)
+        if is_date.any():
+            dates[is_date] = pd.to_datetime(column[is_date], errors='coerce').values
+        
+        # Only text cells go through the inferred format; a date cell's str() never matches it
+        is_text = ~is_date & column.notna()
+        values = column[is_text].astype(str).str.strip()
+        if date_parser is None:
+            date_parser = DateParser.infer(values)
+        
+        if date_parser.date_format:
+            dates[is_text] = pd.to_datetime(values, format=date_parser.date_format, errors='coerce').values
+        
+        # Values in a different format than the rest of the column
+        stragglers = is_text & dates.isna()
+        if stragglers.any():
+            dates[stragglers] = pd.to_datetime(
+                column[stragglers].astype(str).str.strip().map(date_parser.parse), errors='coerce'
+            ).values
+        
+        return dates
+    
+    def _date_cells(self, column: pd.Series) -> pd.Series:
+        """Mask of cells already read as dates, as openpyxl does beside text cells like a 'Total' footer"""
+        if infer_dtype(column, skipna=True) in ('string', 'empty'):
+            return pd.Series(False, index=column.index)
+        return column.map(lambda value: isinstance(value, (datetime, date)) and not pd.isna(value))
+    
+    def _dataframe_layout(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Layout of a DataFrame's columns, from the registry or inferred from its values"""
+        return self._resolve_layout(
+            df.columns.tolist(), lambda index: self._date_text(df.iloc[:, index])
+        )
+    
+    def _date_text(self, column: pd.Series) -> pd.Series:
+        """A date column's text cells, the values a date format is inferred from"""
+        column = column.dropna()
+        return column[~self._date_cells(column)].astype(str)
+    
+    def _resolve_layout(self, headers: List[Any], date_values,
+                        date_parser: Optional[DateParser] = None) -> Dict[str, Any]:
+        """Column mapping, date format and amount style for a header row
+
+        Known layouts come from the registry, once their date format is checked
+        against the file's own date values (date_values(index)): common headers
+        are shared by banks that order dates differently. Unknown layouts are
+        inferred with the column heuristics and those date values, unless the
+        document's date format is already known.
+        """
+        template = self.layout_registry.lookup(headers)
+        if template is not None:
+            date_index = template['column_mapping'].get('date')
+            if date_index is None:
+                return template
+            sample = list(islice(date_values(date_index), DATE_SAMPLE_SIZE))
+            if DateParser(template['date_format']).fits(sample):
+                return template
+            
+            date_format = DateParser.infer(sample).date_format
+            logger.info(f"Layout {template['fingerprint']} date format {template['date_format']} "
+                        f"doesn't fit this file, re-inferred {date_format}")
+            template.update(self.layout_registry.record(
+                headers, template['column_mapping'], date_format, template['amount_style']
+            ))
+            return template
+        
+        column_mapping = self._identify_columns(headers)
+        date_format = date_parser.date_format if date_parser else None
+        if date_format is None and 'date' in column_mapping:
+            date_format = DateParser.infer(date_values(column_mapping['date'])).date_format
+        
+        return {
+            'fingerprint': None,
+            'column_mapping': column_mapping,
+            'date_format': date_format,
+            'amount_style': None
+        }
+    
+    def _record_layout(self, headers: List[Any], layout: Dict[str, Any], amount_values):
+        """Register an inferred layout once it has produced transactions"""
+        if layout['fingerprint'] is not None:
+            return
+        
+        layout.update(self.layout_registry.record(
+            headers, layout['column_mapping'], layout['date_format'], self._amount_style(amount_values)
+        ))
+        logger.info(f"Registered statement layout {layout['fingerprint']}: {layout['column_mapping']}")
+    
+    def _amount_style(self, values) -> str:
+        """'numeric' when sampled amounts are plain numbers, 'formatted' when they need cleaning"""
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        if is_numeric_dtype(values):
+            return 'numeric'
+        sample = values.dropna().astype(str).str.strip().head(DATE_SAMPLE_SIZE)
+        return 'numeric' if pd.to_numeric(sample, errors='coerce').notna().all() else 'formatted'
+    
+    def _parse_amount_column(self, column: pd.Series, amount_style: Optional[str] = None) -> pd.Series:
+        """Vectorized amount cleaning, matching _parse_amount"""
+        if is_numeric_dtype(column):
+            amounts = column.astype(float)
+        elif amount_style == 'numeric':
+            # Layout known to hold plain numbers: only values that don't convert get cleaned
+            amounts = pd.to_numeric(column.astype(str).str.strip().where(column.notna()), errors='coerce').astype(float)
+            stragglers = amounts.isna() & column.notna()
+            if stragglers.any():
+                amounts[stragglers] = self._clean_amount_column(column[stragglers])
+        else:
+            amounts = self._clean_amount_column(column)
+        
+        return amounts.where(amounts.abs() != math.inf)
+    
+    def _clean_amount_column(self, column: pd.Series) -> pd.Series:
+        """Strip currency symbols and separators and apply sign notation"""
+        raw = column.astype(str).where(column.notna(), '')
+        negative = raw.str.contains(AMOUNT_NEGATIVE_PATTERN, regex=True)
+        
+        amounts = pd.to_numeric(raw.str.replace(AMOUNT_JUNK_PATTERN, '', regex=True), errors='coerce').astype(float)
+        return amounts.where(~negative, -amounts)
     
     def _identify_columns(self, headers: List[str]) -> Dict[str, int]:
         """Identify transaction columns in headers"""
@@ -204,7 +651,8 @@ class DocumentProcessor:
         
         return column_mapping
     
-    def _create_transaction_from_row(self, row: List[str], column_mapping: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    def _create_transaction_from_row(self, row: List[str], column_mapping: Dict[str, int],
+                                     date_parser: Optional[DateParser] = None) -> Optional[Dict[str, Any]]:
         """Create transaction dictionary from row data"""
         try:
             transaction = {}
@@ -212,7 +660,7 @@ class DocumentProcessor:
             # Extract date
             if 'date' in column_mapping:
                 date_str = str(row[column_mapping['date']])
-                transaction['transaction_date'] = self._parse_date(date_str)
+                transaction['transaction_date'] = self._parse_date(date_str, date_parser)
             
             # Extract description
             if 'description' in column_mapping:
@@ -237,73 +685,60 @@ class DocumentProcessor:
             logger.warning(f"Error creating transaction from row: {e}")
             return None
     
-    def _extract_from_text(self, text: str) -> List[Dict[str, Any]]:
-        """Extract transactions from text using regex patterns"""
+    def _extract_from_text(self, text: str, date_parser: Optional[DateParser] = None) -> List[Dict[str, Any]]:
+        """Extract transactions from statement lines in one pass of the combined line pattern"""
         transactions = []
         
-        # Common transaction patterns
-        patterns = [
-            # Date Description Amount pattern
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+?)\s+([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
-            # Amount Date Description pattern
-            r'([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+)',
-        ]
-        
-        for pattern in patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
-            for match in matches:
-                try:
-                    if len(match.groups()) == 3:
-                        if '$' in match.group(1):
-                            # Amount Date Description
-                            amount = self._parse_amount(match.group(1))
-                            date = self._parse_date(match.group(2))
-                            description = match.group(3).strip()
-                        else:
-                            # Date Description Amount
-                            date = self._parse_date(match.group(1))
-                            description = match.group(2).strip()
-                            amount = self._parse_amount(match.group(3))
-                        
-                        if date and description and amount is not None:
-                            transactions.append({
-                                'transaction_date': date,
-                                'description': description,
-                                'amount': amount
-                            })
-                except Exception as e:
-                    logger.warning(f"Error parsing transaction match: {e}")
-                    continue
-        
-        return transactions
-    
-    def _parse_date(self, date_str: str) -> Optional[datetime]:
-        """Parse various date formats"""
-        date_formats = [
-            '%m/%d/%Y', '%m/%d/%y', '%m-%d-%Y', '%m-%d-%y',
-            '%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y', '%d-%m-%y'
-        ]
+        if date_parser is None:
+            date_parser = DateParser.infer_from_text(text)
         
-        for fmt in date_formats:
+        for match in TRANSACTION_LINE_PATTERN.finditer(text):
             try:
-                return datetime.strptime(date_str.strip(), fmt)
-            except ValueError:
+                layout = match.lastgroup.split('_', 1)[0]
+                date = self._parse_date(match.group(f'{layout}_date'), date_parser)
+                description = match.group(f'{layout}_description').strip()
+                amount = self._parse_amount(match.group(f'{layout}_amount'))
+                
+                if date and description and amount is not None:
+                    transactions.append({
+                        'transaction_date': date,
+                        'description': description,
+                        'amount': amount
+                    })
+            except Exception as e:
+                logger.warning(f"Error parsing transaction match: {e}")
                 continue
         
-        return None
+        return transactions
+    
+    def _parse_date(self, date_str: str, date_parser: Optional[DateParser] = None) -> Optional[datetime]:
+        """Parse a date with the document's inferred format, trying every known format otherwise"""
+        return (date_parser or DateParser()).parse(date_str)
     
     def _parse_amount(self, amount_str: str) -> Optional[float]:
         """Parse amount string to float"""
         try:
-            # Remove currency symbols and commas
-            cleaned = re.sub(r'[$,]', '', amount_str.strip())
-            return float(cleaned)
+            if not amount_str:
+                return None
+            
+            negative = re.search(AMOUNT_NEGATIVE_PATTERN, amount_str) is not None
+            
+            # Remove currency symbols, commas and sign notation
+            amount = float(re.sub(AMOUNT_JUNK_PATTERN, '', amount_str))
+            if not math.isfinite(amount):
+                return None
+            return -amount if negative else amount
         except (ValueError, TypeError):
             return None
     
-    def _deduplicate_transactions(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Remove duplicate transactions"""
-        seen = set()
+    def _deduplicate_transactions(self, transactions: List[Dict[str, Any]],
+                                  seen: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Remove duplicate transactions
+        
+        Pass the same seen set across batches to deduplicate a streamed document.
+        """
+        if seen is None:
+            seen = set()
         unique_transactions = []
         
         for transaction in transactions:
@@ -322,10 +757,11 @@ class DocumentProcessor:
     
     def _calculate_extraction_confidence(self, transactions: List[Dict[str, Any]]) -> float:
         """Calculate confidence score for extraction"""
-        if not transactions:
-            return 0.0
-        
-        # Simple confidence calculation based on data quality
+        total_score, valid_transactions = self.score_transactions(transactions)
+        return self.confidence_from_scores(total_score, valid_transactions, len(transactions))
+    
+    def score_transactions(self, transactions: List[Dict[str, Any]]) -> Tuple[float, int]:
+        """Sum data quality scores, return (total score, number of valid transactions)"""
         valid_transactions = 0
         total_score = 0.0
         
@@ -344,15 +780,18 @@ class DocumentProcessor:
             if score > 0.8:
                 valid_transactions += 1
         
-        # Calculate overall confidence
-        if len(transactions) > 0:
-            confidence = total_score / len(transactions)
-            # Boost confidence if most transactions are valid
-            if valid_transactions / len(transactions) > 0.8:
-                confidence = min(confidence * 1.2, 1.0)
-            return confidence
+        return total_score, valid_transactions
+    
+    def confidence_from_scores(self, total_score: float, valid_transactions: int, count: int) -> float:
+        """Overall extraction confidence from running score totals"""
+        if count == 0:
+            return 0.0
         
-        return 0.0
+        confidence = total_score / count
+        # Boost confidence if most transactions are valid
+        if valid_transactions / count > 0.8:
+            confidence = min(confidence * 1.2, 1.0)
+        return confidence
     
     def _extract_metadata(self, file_path: str, file_type: str, transactions: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Extract metadata from the document"""
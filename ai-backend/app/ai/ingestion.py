@@ -0,0 +1,55 @@
+"""
+Document ingestion limits: bounded admission and concurrency for background processing
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict
+
+
+class IngestionLimiter:
+    """Admits at most max_pending documents and processes max_active of them at a time
+
+    Uploads past max_pending are refused rather than queued behind the extraction
+    pool, so the caller can answer 503 and the client retries later. Counters are
+    only touched from the event loop and need no lock.
+    """
+
+    def __init__(self, max_active: int, max_pending: int):
+        self.max_active = max_active
+        self.max_pending = max(max_pending, max_active)
+        self.pending = 0  # admitted and not yet finished, including active
+        self.active = 0
+        self._slots = None  # created on first use so it binds to the running loop
+
+    def admit(self) -> bool:
+        """Reserve room for one document, False when the queue is full"""
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        return True
+
+    def release(self):
+        """Give back an admitted document's reservation"""
+        self.pending = max(self.pending - 1, 0)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for one of the max_active processing slots"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_active)
+        async with self._slots:
+            self.active += 1
+            try:
+                yield
+            finally:
+                self.active -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Current load for health reporting"""
+        return {
+            "active": self.active,
+            "queued": self.pending - self.active,
+            "max_active": self.max_active,
+            "max_pending": self.max_pending
+        }
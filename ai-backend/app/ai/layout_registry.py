@@ -0,0 +1,133 @@
+"""
+Statement layout registry: learned column mappings and formats keyed by header fingerprint
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from loguru import logger
+
+
+class LayoutRegistry:
+    """Column mappings and formats of previously parsed statement layouts, keyed by header fingerprint"""
+
+    def __init__(self, path: Optional[str] = None, max_templates: int = 1000):
+        self.path = path  # JSON file the registry persists to; in-memory only when None
+        self.max_templates = max_templates
+        self.templates = {}  # fingerprint -> template
+        self._lock = threading.Lock()
+
+        if self.path:
+            self.templates = self._load()
+
+    @staticmethod
+    def normalize_headers(headers: List[Any]) -> List[str]:
+        """Lowercase, whitespace-collapsed header cells; column positions are kept"""
+        return [' '.join(str(header).lower().split()) if header is not None else '' for header in headers]
+
+    @classmethod
+    def fingerprint(cls, headers: List[Any]) -> str:
+        """Stable hash of a normalized header row"""
+        return hashlib.sha256('\x1f'.join(cls.normalize_headers(headers)).encode('utf-8')).hexdigest()[:16]
+
+    def lookup(self, headers: List[Any]) -> Optional[Dict[str, Any]]:
+        """Template recorded for a header row, or None for an unknown layout"""
+        fingerprint = self.fingerprint(headers)
+        with self._lock:
+            template = self.templates.get(fingerprint)
+            if template is None:
+                return None
+            template['hits'] += 1
+            template['last_used'] = datetime.now().isoformat()
+            return dict(template)
+
+    def record(self, headers: List[Any], column_mapping: Dict[str, int],
+               date_format: Optional[str], amount_style: str) -> Dict[str, Any]:
+        """Record the layout of a successful parse and persist the registry"""
+        fingerprint = self.fingerprint(headers)
+        now = datetime.now().isoformat()
+        with self._lock:
+            template = self.templates.get(fingerprint) or {
+                'fingerprint': fingerprint,
+                'headers': self.normalize_headers(headers),
+                'hits': 0,
+                'created_at': now
+            }
+            template.update({
+                'column_mapping': dict(column_mapping),
+                'date_format': date_format,
+                'amount_style': amount_style,
+                'last_used': now
+            })
+            self.templates[fingerprint] = template
+
+            # Keep the most recently used layouts
+            if len(self.templates) > self.max_templates:
+                for stale in sorted(self.templates.values(), key=lambda t: t['last_used'])[:len(self.templates) - self.max_templates]:
+                    del self.templates[stale['fingerprint']]
+            snapshot = dict(template)
+
+        self.save()
+        return snapshot
+
+    def forget(self, fingerprint: str) -> bool:
+        """Drop a template so its layout is inferred again"""
+        with self._lock:
+            removed = self.templates.pop(fingerprint, None) is not None
+        if removed:
+            self.save(merge=False)
+        return removed
+
+    def list_templates(self) -> List[Dict[str, Any]]:
+        """All templates, most used first"""
+        with self._lock:
+            templates = [dict(template) for template in self.templates.values()]
+        return sorted(templates, key=lambda t: t['hits'], reverse=True)
+
+    def save(self, merge: bool = True):
+        """Write the registry to disk atomically
+
+        Other processes sharing the file (PDF page workers) may have recorded
+        layouts since it was loaded, so the file's templates are merged in first.
+        """
+        if not self.path:
+            return
+
+        try:
+            with self._lock:
+                if merge:
+                    for fingerprint, template in self._load().items():
+                        current = self.templates.get(fingerprint)
+                        if current is None:
+                            self.templates[fingerprint] = template
+                        else:
+                            current['hits'] = max(current['hits'], template['hits'])
+                payload = json.dumps(list(self.templates.values()), indent=2)
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(temp_path, self.path)
+
+        except Exception as e:
+            logger.error(f"Error saving layout registry {self.path}: {e}")
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Read templates from disk"""
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                templates = json.load(f)
+            return {template['fingerprint']: template for template in templates}
+
+        except Exception as e:
+            logger.error(f"Error loading layout registry {self.path}: {e}")
+            return {}
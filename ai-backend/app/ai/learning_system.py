@@ -3,14 +3,39 @@ AI Learning System for improving categorization based on user feedback
 """
 
 import re
+import math
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import heapq
 from loguru import logger
 
 from ..config import settings
 
 
+def _hour_mask(hours) -> int:
+    """Bitmask with one bit set per hour of the day"""
+    return sum(1 << hour for hour in hours)
+
+
+# Context buckets in precomputed form: inclusive numeric amount bounds and
+# hour-of-day bitmasks, so context matching is a few numeric comparisons
+AMOUNT_RANGE_BOUNDS = {
+    '0-50': (0.0, 50.0),
+    '50-100': (math.nextafter(50.0, math.inf), 100.0),
+    '100-500': (math.nextafter(100.0, math.inf), 500.0),
+    '500+': (math.nextafter(500.0, math.inf), math.inf)
+}
+UNKNOWN_AMOUNT_BOUNDS = (math.inf, -math.inf)  # matches nothing
+
+TIME_OF_DAY_HOUR_MASKS = {
+    'morning': _hour_mask(range(6, 12)),
+    'afternoon': _hour_mask(range(12, 17)),
+    'evening': _hour_mask(range(17, 22)),
+    'night': _hour_mask([22, 23, 0, 1, 2, 3, 4, 5])
+}
+
+
 class LearningSystem:
     """AI Learning System that improves categorization based on user feedback"""
     
@@ -18,10 +43,14 @@ class LearningSystem:
         self.min_confidence_threshold = settings.MIN_CONFIDENCE_THRESHOLD
         self.max_learning_examples = settings.MAX_LEARNING_EXAMPLES
         self.learning_decay_factor = settings.LEARNING_DECAY_FACTOR
+        self.learning_decay_period = timedelta(days=settings.LEARNING_DECAY_PERIOD_DAYS)
+        self.prune_threshold = settings.LEARNING_PRUNE_THRESHOLD
         
         # Learning patterns cache
         self.pattern_cache = {}
-        self.merchant_patterns = defaultdict(list)
+        # Per-user pattern store: merchant_pattern -> pattern, ordered from least
+        # to most recently corrected so lookup, update and eviction are O(1)
+        self.merchant_patterns = defaultdict(OrderedDict)
         
     async def learn_from_correction(self, 
                                    transaction: Dict[str, Any], 
@@ -73,17 +102,18 @@ class LearningSystem:
         try:
             # This would typically query the database
             # For now, return cached patterns for the user
-            user_patterns = self.merchant_patterns.get(user_id, [])
+            user_patterns = self.merchant_patterns.get(user_id)
+            if not user_patterns:
+                return []
             
-            # Sort by learning weight and recency
-            sorted_patterns = sorted(
-                user_patterns,
-                key=lambda x: (x.get('learning_weight', 0), x.get('last_corrected_at', datetime.min)),
-                reverse=True
+            # Top patterns by decayed learning weight and recency, O(n log limit)
+            now = datetime.now()
+            return heapq.nlargest(
+                limit,
+                user_patterns.values(),
+                key=lambda x: (self._decayed_weight(x, now), x.get('last_corrected_at', datetime.min))
             )
             
-            return sorted_patterns[:limit]
-            
         except Exception as e:
             logger.error(f"Error getting user preferences: {e}")
             return []
@@ -124,7 +154,7 @@ class LearningSystem:
     async def get_learning_analytics(self, user_id: int) -> Dict[str, Any]:
         """Get learning analytics for a user"""
         try:
-            user_patterns = self.merchant_patterns.get(user_id, [])
+            user_patterns = list(self.merchant_patterns.get(user_id, {}).values())
             
             if not user_patterns:
                 return {
@@ -152,6 +182,38 @@ class LearningSystem:
             logger.error(f"Error getting learning analytics: {e}")
             return {}
     
+    async def compact_preferences(self) -> int:
+        """Prune patterns whose decayed learning weight fell below the threshold"""
+        now = datetime.now()
+        pruned = 0
+        
+        for user_id, user_patterns in list(self.merchant_patterns.items()):
+            stale = [
+                merchant_pattern for merchant_pattern, pattern in user_patterns.items()
+                if self._decayed_weight(pattern, now) < self.prune_threshold
+            ]
+            for merchant_pattern in stale:
+                del user_patterns[merchant_pattern]
+            pruned += len(stale)
+            
+            if not user_patterns:
+                del self.merchant_patterns[user_id]
+        
+        if pruned:
+            logger.info(f"Pruned {pruned} decayed learning patterns")
+        
+        return pruned
+    
+    def _decayed_weight(self, pattern: Dict[str, Any], now: Optional[datetime] = None) -> float:
+        """Learning weight decayed by the decay factor once per period since the last correction"""
+        weight = pattern.get('learning_weight', 1.0)
+        last_corrected_at = pattern.get('last_corrected_at')
+        if not last_corrected_at:
+            return weight
+        
+        age = max((now or datetime.now()) - last_corrected_at, timedelta(0))
+        return weight * self.learning_decay_factor ** (age / self.learning_decay_period)
+    
     def _extract_merchant_pattern(self, description: str) -> str:
         """Extract merchant pattern from transaction description"""
         if not description:
@@ -207,13 +269,10 @@ class LearningSystem:
         """Update learning patterns with new correction"""
         user_id = learning_entry['user_id']
         merchant_pattern = learning_entry['merchant_pattern']
+        user_patterns = self.merchant_patterns[user_id]
         
         # Find existing pattern
-        existing_pattern = None
-        for pattern in self.merchant_patterns[user_id]:
-            if pattern.get('merchant_pattern') == merchant_pattern:
-                existing_pattern = pattern
-                break
+        existing_pattern = user_patterns.get(merchant_pattern)
         
         if existing_pattern:
             # Update existing pattern
@@ -229,6 +288,10 @@ class LearningSystem:
                 existing_pattern.get('context_data', {}),
                 learning_entry['context_data']
             )
+            existing_pattern['context_features'] = self._context_features(existing_pattern['context_data'])
+            
+            # Most recently corrected patterns live at the end
+            user_patterns.move_to_end(merchant_pattern)
         else:
             # Create new pattern
             new_pattern = {
@@ -237,19 +300,15 @@ class LearningSystem:
                 'correction_count': 1,
                 'learning_weight': 1.0,
                 'last_corrected_at': datetime.now(),
-                'context_data': learning_entry['context_data']
+                'context_data': learning_entry['context_data'],
+                'context_features': self._context_features(learning_entry['context_data'])
             }
             
-            self.merchant_patterns[user_id].append(new_pattern)
-        
-        # Limit patterns per user
-        if len(self.merchant_patterns[user_id]) > self.max_learning_examples:
-            # Remove oldest patterns
-            sorted_patterns = sorted(
-                self.merchant_patterns[user_id],
-                key=lambda x: x.get('last_corrected_at', datetime.min)
-            )
-            self.merchant_patterns[user_id] = sorted_patterns[-self.max_learning_examples:]
+            user_patterns[merchant_pattern] = new_pattern
+        
+        # Limit patterns per user by evicting the least recently corrected
+        while len(user_patterns) > self.max_learning_examples:
+            user_patterns.popitem(last=False)
     
     def _patterns_match(self, pattern1: str, pattern2: str) -> bool:
         """Check if two merchant patterns match"""
@@ -290,15 +349,15 @@ class LearningSystem:
         preference_scores = {}
         total_weight = 0
         
+        now = datetime.now()
+        transaction_features = self._transaction_features(transaction)
         for pref in preferences:
-            weight = pref.get('learning_weight', 1.0)
+            weight = self._decayed_weight(pref, now)
             category = pref.get('preferred_category', '')
             
             # Apply context matching
-            context_match = self._calculate_context_match(
-                transaction, 
-                pref.get('context_data', {})
-            )
+            context_features = pref.get('context_features') or self._context_features(pref.get('context_data'))
+            context_match = self._calculate_context_match(transaction_features, context_features)
             
             adjusted_weight = weight * context_match
             preference_scores[category] = preference_scores.get(category, 0) + adjusted_weight
@@ -326,69 +385,64 @@ class LearningSystem:
         
         return best_category, final_confidence
     
-    def _calculate_context_match(self, transaction: Dict[str, Any], context_data: Dict[str, Any]) -> float:
-        """Calculate how well transaction context matches preference context"""
+    def _context_features(self, context_data: Optional[Dict[str, Any]]) -> Tuple:
+        """Precompute context data as (amount_lo, amount_hi, day_of_week, hour_mask, total_factors)"""
         if not context_data:
-            return 1.0
+            return (None, None, None, 0, 0)
         
-        match_score = 0.0
+        amount_lo = amount_hi = day_of_week = None
+        hour_mask = 0
         total_factors = 0
         
-        # Amount range match
         if 'amount_range' in context_data:
-            transaction_amount = transaction.get('amount', 0)
-            pref_amount_range = context_data['amount_range']
-            
-            if self._amount_in_range(transaction_amount, pref_amount_range):
-                match_score += 1.0
+            amount_lo, amount_hi = AMOUNT_RANGE_BOUNDS.get(context_data['amount_range'], UNKNOWN_AMOUNT_BOUNDS)
             total_factors += 1
         
-        # Day of week match
         if 'day_of_week' in context_data:
-            transaction_date = transaction.get('transaction_date')
-            if transaction_date and transaction_date.weekday() == context_data['day_of_week']:
-                match_score += 1.0
+            day_of_week = context_data['day_of_week']
             total_factors += 1
         
-        # Time of day match
         if 'time_of_day' in context_data:
-            transaction_date = transaction.get('transaction_date')
-            if transaction_date:
-                hour = transaction_date.hour
-                pref_time = context_data['time_of_day']
-                
-                if self._time_matches(hour, pref_time):
-                    match_score += 1.0
+            hour_mask = TIME_OF_DAY_HOUR_MASKS.get(context_data['time_of_day'], 0)
             total_factors += 1
         
-        return match_score / total_factors if total_factors > 0 else 1.0
+        return (amount_lo, amount_hi, day_of_week, hour_mask, total_factors)
     
-    def _amount_in_range(self, amount: float, amount_range: str) -> bool:
-        """Check if amount falls within specified range"""
+    def _transaction_features(self, transaction: Dict[str, Any]) -> Tuple:
+        """Precompute transaction context as (amount, weekday, hour_bit) once per transaction"""
         try:
-            if amount_range == '0-50':
-                return 0 <= amount <= 50
-            elif amount_range == '50-100':
-                return 50 < amount <= 100
-            elif amount_range == '100-500':
-                return 100 < amount <= 500
-            elif amount_range == '500+':
-                return amount > 500
-        except:
-            pass
-        return False
+            amount = float(transaction.get('amount', 0))
+        except (TypeError, ValueError):
+            amount = math.nan  # compares false against every range
+        
+        transaction_date = transaction.get('transaction_date')
+        if not transaction_date:
+            return (amount, -1, 0)
+        
+        return (amount, transaction_date.weekday(), 1 << transaction_date.hour)
     
-    def _time_matches(self, hour: int, time_of_day: str) -> bool:
-        """Check if hour matches time of day"""
-        if time_of_day == 'morning':
-            return 6 <= hour < 12
-        elif time_of_day == 'afternoon':
-            return 12 <= hour < 17
-        elif time_of_day == 'evening':
-            return 17 <= hour < 22
-        elif time_of_day == 'night':
-            return hour >= 22 or hour < 6
-        return False
+    def _calculate_context_match(self, transaction_features: Tuple, context_features: Tuple) -> float:
+        """Calculate how well transaction context matches preference context"""
+        amount_lo, amount_hi, day_of_week, hour_mask, total_factors = context_features
+        if not total_factors:
+            return 1.0
+        
+        amount, weekday, hour_bit = transaction_features
+        match_score = 0.0
+        
+        # Amount range match
+        if amount_lo is not None and amount_lo <= amount <= amount_hi:
+            match_score += 1.0
+        
+        # Day of week match
+        if day_of_week is not None and weekday == day_of_week:
+            match_score += 1.0
+        
+        # Time of day match
+        if hour_mask & hour_bit:
+            match_score += 1.0
+        
+        return match_score / total_factors
     
     def _merge_context_data(self, existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
         """Merge context data from multiple corrections"""
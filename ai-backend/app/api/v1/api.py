@@ -4,7 +4,7 @@ Main API router for v1 endpoints
 
 from fastapi import APIRouter
 
-from .endpoints import documents, categorize, preferences, analytics
+from .endpoints import documents, categorize, preferences, analytics, layouts
 
 api_router = APIRouter()
 
@@ -12,4 +12,5 @@ api_router = APIRouter()
 api_router.include_router(documents.router, prefix="/documents", tags=["documents"])
 api_router.include_router(categorize.router, prefix="/categorize", tags=["categorize"])
 api_router.include_router(preferences.router, prefix="/preferences", tags=["preferences"])
-api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"]) 
\ No newline at end of file
+api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
+api_router.include_router(layouts.router, prefix="/layouts", tags=["layouts"]) 
\ No newline at end of file
@@ -4,15 +4,19 @@ Document processing endpoints
 
 import os
 import uuid
-from typing import List
+import hashlib
+import aiofiles
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from loguru import logger
 from datetime import datetime
 
 from ....database import get_db
 from ....ai.document_processor import DocumentProcessor
+from ....ai.ingestion import IngestionLimiter
 from ....models.document import Document
 from ....models.transaction import Transaction
 from ....schemas.document import DocumentResponse, DocumentList
@@ -21,6 +25,130 @@ from ....config import settings
 
 router = APIRouter()
 document_processor = DocumentProcessor()
+ingestion = IngestionLimiter(settings.INGESTION_CONCURRENCY, settings.MAX_CONCURRENT_REQUESTS)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes read from the upload stream at a time
+INGESTION_RETRY_AFTER = 30  # seconds clients are asked to wait when the queue is full
+IN_FLIGHT_STATUSES = ("uploaded", "processing")  # documents a background task is working on
+
+# Leading bytes of each binary format family; anything else must look like text (CSV)
+FILE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image'),
+    (b'\xff\xd8\xff', 'image'),
+    (b'PK\x03\x04', 'excel'),  # xlsx
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'excel'),  # xls
+]
+PDF_HEADER_WINDOW = 1024  # readers accept junk before %PDF- within the first kilobyte
+EXTENSION_FAMILIES = {
+    'pdf': 'pdf', 'csv': 'text', 'xlsx': 'excel', 'xls': 'excel',
+    'jpg': 'image', 'jpeg': 'image', 'png': 'image'
+}
+
+
+def _transaction_response(transaction: Transaction) -> TransactionResponse:
+    """API representation of a stored transaction"""
+    return TransactionResponse(
+        id=transaction.id,
+        description=transaction.description,
+        amount=float(transaction.amount),
+        transaction_date=transaction.transaction_date,
+        category=transaction.ai_category or transaction.user_category,
+        confidence=transaction.ai_confidence,
+        merchant_name=transaction.merchant_name,
+        created_at=transaction.created_at
+    )
+
+
+def _sniff_file_type(head: bytes) -> Optional[str]:
+    """Format family from an upload's first bytes, None when unrecognized"""
+    if b'%PDF-' in head[:PDF_HEADER_WINDOW]:
+        return 'pdf'
+    for signature, file_type in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return file_type
+    
+    # UTF-16 text carries NUL bytes but starts with a byte order mark
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')) or b'\x00' not in head:
+        return 'text'
+    return None
+
+
+async def _save_upload(file: UploadFile, file_path: str, file_extension: str) -> Tuple[int, str]:
+    """Stream an upload to disk in chunks, return its size and SHA-256 hex digest
+
+    The size limit is enforced as bytes arrive, so clients that omit or misstate
+    the size can't push past MAX_FILE_SIZE, and the content type is checked
+    against the extension from the first chunk. A rejected upload's partial file
+    is removed.
+    """
+    digest = hashlib.sha256()
+    file_size = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                
+                if file_size == 0:
+                    if _sniff_file_type(chunk) != EXTENSION_FAMILIES.get(file_extension):
+                        raise HTTPException(status_code=400, detail="File content does not match its extension")
+                
+                file_size += len(chunk)
+                if file_size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large")
+                
+                digest.update(chunk)
+                await buffer.write(chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    
+    if file_size == 0:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    return file_size, digest.hexdigest()
+
+
+def _find_duplicate(db: Session, user_id: int, content_hash: str) -> Optional[Document]:
+    """Document from this user with the same content, completed or still being processed
+
+    A completed document is preferred; failed ones never match, so their
+    content can be uploaded again. A document unfinished after
+    DOCUMENT_PROCESSING_TIMEOUT is marked failed and passed over.
+    """
+    while True:
+        document = db.query(Document).filter(
+            Document.user_id == user_id,
+            Document.content_hash == content_hash,
+            Document.status.in_(IN_FLIGHT_STATUSES + ("completed",))
+        ).order_by((Document.status == "completed").desc(), Document.id.desc()).first()
+        if not document or document.status == "completed":
+            return document
+        
+        # Background tasks die with the server; one unfinished for this long never will be
+        started_at = document.processing_started_at or document.created_at
+        if not started_at or (datetime.utcnow() - started_at).total_seconds() < settings.DOCUMENT_PROCESSING_TIMEOUT:
+            return document
+        logger.warning(f"Document {document.id} was left {document.status} since {started_at}, marking it failed")
+        document.status = "failed"
+        document.extraction_errors = "Processing abandoned"
+        db.commit()
+
+
+def _document_transactions(db: Session, document_id: int) -> List[Transaction]:
+    """Transactions extracted from a document"""
+    return db.query(Transaction).filter(Transaction.document_id == document_id).all()
+
+
+def _create_document(db: Session, document: Document) -> Document:
+    """Insert a document record"""
+    db.add(document)
+    db.commit()
+    db.refresh(document)
+    return document
 
 
 @router.post("/upload", response_model=DocumentResponse)
@@ -30,14 +158,23 @@ async def upload_document(
     db: Session = Depends(get_db)
 ):
     """Upload and process a document"""
+    # Refuse work the processing queue can't take before reading the upload
+    if not ingestion.admit():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many documents are being processed, please retry later",
+            headers={"Retry-After": str(INGESTION_RETRY_AFTER)}
+        )
+    
+    queued = False
     try:
         # Validate file
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
         
-        # Check file size
+        # Reject early when the client declared the size; streaming enforces it otherwise
         if file.size and file.size > settings.MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail="File too large")
+            raise HTTPException(status_code=413, detail="File too large")
         
         # Check file extension
         file_extension = os.path.splitext(file.filename)[1].lower().lstrip('.')
@@ -48,29 +185,55 @@ async def upload_document(
         unique_filename = f"{uuid.uuid4()}_{file.filename}"
         file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
         
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        user_id = 1  # TODO: Get from authentication
+        
+        # Save file, checking size, type and hash as it streams to disk
+        file_size, content_hash = await _save_upload(file, file_path, file_extension)
+        
+        # Identical content from this user was already extracted, or is being extracted: reuse it
+        existing = await run_in_threadpool(_find_duplicate, db, user_id, content_hash)
+        if existing:
+            os.remove(file_path)
+            logger.info(f"Duplicate upload of document {existing.id}, skipping processing")
+            # A document still in flight has no transactions yet; clients poll it by ID
+            transactions = None
+            if existing.status == "completed":
+                transactions = [
+                    _transaction_response(transaction)
+                    for transaction in await run_in_threadpool(_document_transactions, db, existing.id)
+                ]
+            return DocumentResponse(
+                id=existing.id,
+                filename=existing.original_filename,
+                status=existing.status,
+                file_size=existing.file_size,
+                file_type=existing.file_type,
+                total_transactions=existing.total_transactions,
+                extraction_confidence=existing.extraction_confidence,
+                processing_started_at=existing.processing_started_at,
+                processing_completed_at=existing.processing_completed_at,
+                created_at=existing.created_at,
+                duplicate=True,
+                transactions=transactions
+            )
         
         # Create document record
         document = Document(
-            user_id=1,  # TODO: Get from authentication
+            user_id=user_id,
             filename=unique_filename,
             original_filename=file.filename,
             file_path=file_path,
-            file_size=len(content),
+            file_size=file_size,
             file_type=file_extension,
             mime_type=file.content_type,
+            content_hash=content_hash,
             status="uploaded"
         )
+        document = await run_in_threadpool(_create_document, db, document)
         
-        db.add(document)
-        db.commit()
-        db.refresh(document)
-        
-        # Process document in background
+        # Process document in background; the task releases the admission
         background_tasks.add_task(process_document_background, document.id, file_path, file_extension)
+        queued = True
         
         return DocumentResponse(
             id=document.id,
@@ -81,9 +244,14 @@ async def upload_document(
             created_at=document.created_at
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error uploading document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not queued:
+            ingestion.release()
 
 
 @router.get("/{document_id}", response_model=DocumentResponse)
@@ -124,19 +292,7 @@ async def get_document_transactions(document_id: int, db: Session = Depends(get_
         # Get transactions
         transactions = db.query(Transaction).filter(Transaction.document_id == document_id).all()
         
-        return [
-            TransactionResponse(
-                id=transaction.id,
-                description=transaction.description,
-                amount=float(transaction.amount),
-                transaction_date=transaction.transaction_date,
-                category=transaction.ai_category or transaction.user_category,
-                confidence=transaction.ai_confidence,
-                merchant_name=transaction.merchant_name,
-                created_at=transaction.created_at
-            )
-            for transaction in transactions
-        ]
+        return [_transaction_response(transaction) for transaction in transactions]
         
     except Exception as e:
         logger.error(f"Error getting transactions for document {document_id}: {e}")
@@ -178,58 +334,103 @@ async def list_documents(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def process_document_background(document_id: int, file_path: str, file_type: str):
-    """Background task to process document"""
-    try:
-        from ....database import SessionLocal
-        
-        db = SessionLocal()
-        
-        # Update document status
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if not document:
-            logger.error(f"Document {document_id} not found for processing")
-            return
-        
+def _start_processing(db: Session, document_id: int) -> Optional[Document]:
+    """Mark a document as processing"""
+    document = db.query(Document).filter(Document.id == document_id).first()
+    if document:
         document.status = "processing"
         document.processing_started_at = datetime.utcnow()
         db.commit()
-        
-        # Process document
-        result = await document_processor.process_document(file_path, file_type)
-        
-        # Save transactions
-        for transaction_data in result["transactions"]:
-            transaction = Transaction(
-                user_id=document.user_id,
-                document_id=document.id,
-                transaction_date=transaction_data.get("transaction_date"),
-                description=transaction_data.get("description", ""),
-                amount=transaction_data.get("amount", 0),
-                extraction_confidence=result["extraction_confidence"],
-                extraction_method=result["processing_method"]
+    return document
+
+
+def _save_transactions(db: Session, document: Document, batch: List[Dict[str, Any]],
+                       confidence: float, method: str):
+    """Persist one batch of extracted transactions"""
+    for transaction_data in batch:
+        transaction = Transaction(
+            user_id=document.user_id,
+            document_id=document.id,
+            transaction_date=transaction_data.get("transaction_date"),
+            description=transaction_data.get("description", ""),
+            amount=transaction_data.get("amount", 0),
+            extraction_confidence=confidence,
+            extraction_method=method
+        )
+        db.add(transaction)
+    
+    db.commit()
+
+
+def _finish_processing(db: Session, document: Document, total_transactions: int, confidence: float):
+    """Mark a document as completed"""
+    document.status = "completed"
+    document.processing_completed_at = datetime.utcnow()
+    document.total_transactions = total_transactions
+    document.extraction_confidence = confidence
+    db.commit()
+
+
+def _fail_processing(db: Session, document: Document, error: str):
+    """Mark a document as failed"""
+    db.rollback()
+    document.status = "failed"
+    document.extraction_errors = error
+    db.commit()
+
+
+async def process_document_background(document_id: int, file_path: str, file_type: str):
+    """Background task to process document
+
+    Extraction runs on the worker pool and database calls on the thread pool, so
+    the event loop keeps serving requests while a document is processed.
+    """
+    from ....database import SessionLocal
+    
+    db = None
+    document = None
+    try:
+        async with ingestion.slot():
+            db = await run_in_threadpool(SessionLocal)
+            
+            # Update document status
+            document = await run_in_threadpool(_start_processing, db, document_id)
+            if not document:
+                logger.error(f"Document {document_id} not found for processing")
+                return
+            
+            # Process document batch by batch so large statements stream through
+            total_transactions = 0
+            total_score, valid_transactions = 0.0, 0
+            
+            async for batch in document_processor.iter_transactions(file_path, file_type):
+                batch_score, batch_valid = document_processor.score_transactions(batch)
+                total_score += batch_score
+                valid_transactions += batch_valid
+                batch_confidence = document_processor.confidence_from_scores(batch_score, batch_valid, len(batch))
+                
+                # Save transactions
+                await run_in_threadpool(_save_transactions, db, document, batch, batch_confidence, file_type.lower())
+                total_transactions += len(batch)
+            
+            # Update document status
+            await run_in_threadpool(
+                _finish_processing, db, document, total_transactions,
+                document_processor.confidence_from_scores(total_score, valid_transactions, total_transactions)
             )
-            db.add(transaction)
-        
-        # Update document status
-        document.status = "completed"
-        document.processing_completed_at = datetime.utcnow()
-        document.total_transactions = result["total_transactions"]
-        document.extraction_confidence = result["extraction_confidence"]
-        
-        db.commit()
-        logger.info(f"Document {document_id} processed successfully: {result['total_transactions']} transactions extracted")
+            logger.info(f"Document {document_id} processed successfully: {total_transactions} transactions extracted")
         
     except Exception as e:
         logger.error(f"Error processing document {document_id}: {e}")
         
         # Update document status to failed
-        try:
-            document.status = "failed"
-            document.extraction_errors = str(e)
-            db.commit()
-        except:
-            pass
+        if document is not None:
+            try:
+                await run_in_threadpool(_fail_processing, db, document, str(e))
+            except Exception as status_error:
+                logger.error(f"Error marking document {document_id} as failed: {status_error}")
         
     finally:
-        db.close() 
\ No newline at end of file
+        if db is not None:
+            await run_in_threadpool(db.close)
+        ingestion.release()
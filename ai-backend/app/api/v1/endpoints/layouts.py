@@ -0,0 +1,24 @@
+"""
+Statement layout registry endpoints
+"""
+
+from fastapi import APIRouter, HTTPException
+
+from .documents import document_processor
+
+router = APIRouter()
+
+
+@router.get("/")
+async def list_layouts():
+    """List statement layouts learned from previous uploads"""
+    templates = document_processor.layout_registry.list_templates()
+    return {"layouts": templates, "total_layouts": len(templates)}
+
+
+@router.delete("/{fingerprint}")
+async def delete_layout(fingerprint: str):
+    """Forget a statement layout so it is inferred again"""
+    if not document_processor.layout_registry.forget(fingerprint):
+        raise HTTPException(status_code=404, detail="Layout not found")
+    return {"message": "Layout removed", "fingerprint": fingerprint}
@@ -32,7 +32,16 @@ class Settings(BaseSettings):
     # File Storage
     UPLOAD_DIR: str = "./uploads"
     MAX_FILE_SIZE: int = 10485760  # 10MB
-    ALLOWED_EXTENSIONS: str = "pdf,csv,xlsx,xls,jpg,jpeg,png"
+    ALLOWED_EXTENSIONS: List[str] = "pdf,csv,xlsx,xls,jpg,jpeg,png"
+    
+    # Document Processing
+    ENCODING_SAMPLE_SIZE: int = 65536  # bytes sampled for encoding detection
+    CSV_CHUNK_ROWS: int = 10000  # rows per streamed CSV and Excel batch
+    EXCEL_HEADER_SCAN_ROWS: int = 20  # leading sheet rows searched for the column header row
+    PDF_WORKERS: int = min(4, os.cpu_count() or 1)  # extraction processes (PDF pages, Excel, OCR)
+    PDF_PARALLEL_MIN_PAGES: int = 8  # smaller PDFs are extracted serially
+    LAYOUT_REGISTRY_PATH: str = "./data/layout_templates.json"  # learned statement layouts
+    DOCUMENT_PROCESSING_TIMEOUT: int = 1800  # seconds before an unfinished document counts as abandoned
     
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -57,10 +66,13 @@ class Settings(BaseSettings):
     MIN_CONFIDENCE_THRESHOLD: float = 0.7
     MAX_LEARNING_EXAMPLES: int = 1000
     LEARNING_DECAY_FACTOR: float = 0.95
+    LEARNING_DECAY_PERIOD_DAYS: int = 7  # decay factor is applied once per period
+    LEARNING_PRUNE_THRESHOLD: float = 0.1
     
     # Performance
     WORKER_PROCESSES: int = 4
-    MAX_CONCURRENT_REQUESTS: int = 100
+    MAX_CONCURRENT_REQUESTS: int = 100  # also bounds documents queued for processing
+    INGESTION_CONCURRENCY: int = min(4, os.cpu_count() or 1)  # documents processed at once
     CACHE_TTL: int = 3600  # 1 hour
     
     @validator("BACKEND_CORS_ORIGINS", pre=True)
@@ -14,6 +14,8 @@ import os
 from .config import settings
 from .database import init_db, check_db_connection, check_redis_connection
 from .api.v1.api import api_router
+from .api.v1.endpoints.documents import ingestion
+from .ai.document_processor import shutdown_extraction_pool
 
 
 # Configure logging
@@ -61,6 +63,7 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down XspensesAI Backend...")
+    shutdown_extraction_pool()
 
 
 # Create FastAPI application
@@ -112,6 +115,7 @@ async def health_check():
             "status": status,
             "database": "connected" if db_healthy else "disconnected",
             "redis": "connected" if redis_healthy else "disconnected",
+            "ingestion": ingestion.stats(),
             "version": settings.VERSION
         }
     except Exception as e:
@@ -6,6 +6,8 @@ from typing import Optional, List
 from datetime import datetime
 from pydantic import BaseModel
 
+from .transaction import TransactionResponse
+
 
 class DocumentResponse(BaseModel):
     id: int
@@ -18,6 +20,8 @@ class DocumentResponse(BaseModel):
     processing_started_at: Optional[datetime] = None
     processing_completed_at: Optional[datetime] = None
     created_at: datetime
+    duplicate: bool = False  # identical content was already processed or is being processed
+    transactions: Optional[List[TransactionResponse]] = None
     
     class Config:
         from_attributes = True
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for XspensesAI Backend hot paths
+
+Usage:
+    python benchmark.py              # run all benchmarks
+    python benchmark.py learning     # run a single benchmark
+"""
+
+import os
+import sys
+import time
+import asyncio
+import resource
+import tempfile
+from datetime import datetime
+
+# Settings require these; benchmarks never reach OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+
+def _timed(func, *args, **kwargs):
+    """Run func and return (result, elapsed seconds)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_learning(patterns_per_user: int = 10000, corrections: int = 20000):
+    """Learned pattern store: update, lookup and eviction at 10k patterns per user"""
+    from app.ai.learning_system import LearningSystem
+
+    print(f"=== LEARNING PATTERNS ({patterns_per_user} patterns/user) ===")
+    learning_system = LearningSystem()
+    learning_system.max_learning_examples = patterns_per_user
+
+    def correction(i):
+        return {
+            'user_id': 1,
+            'merchant_pattern': f"MERCHANT {i}",
+            'preferred_category': "Shopping",
+            'context_data': {'amount_range': '0-50'}
+        }
+
+    async def fill():
+        for i in range(patterns_per_user):
+            await learning_system._update_learning_patterns(correction(i))
+
+    async def churn():
+        # Half new merchants (forces eviction), half repeat corrections
+        for i in range(corrections):
+            merchant = patterns_per_user + i if i % 2 else i % patterns_per_user
+            await learning_system._update_learning_patterns(correction(merchant))
+
+    _, fill_time = _timed(asyncio.run, fill())
+    _, churn_time = _timed(asyncio.run, churn())
+    _, read_time = _timed(asyncio.run, learning_system.get_user_preferences(1))
+
+    print(f"Fill:       {fill_time * 1000:.1f} ms ({fill_time / patterns_per_user * 1e6:.2f} us/correction)")
+    print(f"Churn:      {churn_time * 1000:.1f} ms ({churn_time / corrections * 1e6:.2f} us/correction, with eviction)")
+    print(f"Top 50:     {read_time * 1000:.2f} ms")
+    print(f"Patterns:   {len(learning_system.merchant_patterns[1])}")
+
+
+def benchmark_context_match(candidates: int = 10000):
+    """Weighted prediction over candidate preferences with precomputed context features"""
+    from app.ai.learning_system import LearningSystem
+
+    print(f"=== CONTEXT MATCH ({candidates} candidate preferences) ===")
+    learning_system = LearningSystem()
+    preferences = []
+    for i in range(candidates):
+        context_data = learning_system._extract_context_data({
+            'amount': (i * 37) % 900,
+            'transaction_date': datetime(2024, 1, 1 + i % 28, i % 24)
+        })
+        preferences.append({
+            'preferred_category': "Shopping" if i % 3 else "Food & Dining",
+            'learning_weight': 1.0,
+            'last_corrected_at': datetime.now(),
+            'context_data': context_data,
+            'context_features': learning_system._context_features(context_data)
+        })
+
+    transaction = {'amount': 42.0, 'transaction_date': datetime(2024, 1, 5, 9)}
+    (category, confidence), elapsed = _timed(
+        learning_system._calculate_weighted_prediction, preferences, transaction, "Shopping", 0.6
+    )
+    print(f"Prediction: {category} ({confidence:.2f})")
+    print(f"Elapsed:    {elapsed * 1000:.2f} ms ({elapsed / candidates * 1e6:.3f} us/preference)")
+
+
+def benchmark_csv_stream(rows: int = 200000):
+    """Streamed CSV ingestion: throughput and peak RSS for a large export"""
+    from app.ai.document_processor import DocumentProcessor
+
+    print(f"=== CSV STREAM ({rows} rows) ===")
+    processor = DocumentProcessor()
+
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+        f.write("Date,Description,Amount\n")
+        for i in range(rows):
+            f.write(f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2023,MERCHANT {i % 5000} PURCHASE,{(i * 37) % 90000 / 100:.2f}\n")
+        csv_path = f.name
+
+    async def consume():
+        total = 0
+        async for batch in processor.iter_transactions(csv_path, 'csv'):
+            total += len(batch)
+        return total
+
+    try:
+        total, elapsed = _timed(asyncio.run, consume())
+    finally:
+        os.unlink(csv_path)
+
+    print(f"Transactions: {total}")
+    print(f"Elapsed:      {elapsed:.2f} s ({total / elapsed:.0f} rows/s)")
+    print(f"Peak RSS:     {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+
+def benchmark_dataframe(rows: int = 100000):
+    """Columnar DataFrame conversion against the row-by-row iterrows path"""
+    import pandas as pd
+    from app.ai.document_processor import DocumentProcessor
+
+    print(f"=== DATAFRAME TO TRANSACTIONS ({rows} rows) ===")
+    processor = DocumentProcessor()
+    df = pd.DataFrame({
+        'Posted Date': [f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2023" for i in range(rows)],
+        'Description': [f"POS PURCHASE MERCHANT {i % 5000}" for i in range(rows)],
+        'Amount': [f"${(i * 37) % 90000 / 100:,.2f}" if i % 10 else f"({i % 500}.00)" for i in range(rows)],
+    })
+
+    def row_path():
+        column_mapping = processor._identify_columns(df.columns.tolist())
+        transactions = []
+        for _, row in df.iterrows():
+            transaction = processor._create_transaction_from_row(row.tolist(), column_mapping)
+            if transaction:
+                transactions.append(transaction)
+        return transactions
+
+    columnar, columnar_time = _timed(processor._parse_dataframe, df)
+    legacy, legacy_time = _timed(row_path)
+
+    print(f"iterrows:   {legacy_time * 1000:.0f} ms ({len(legacy)} transactions)")
+    print(f"Columnar:   {columnar_time * 1000:.0f} ms ({len(columnar)} transactions)")
+    print(f"Speedup:    {legacy_time / columnar_time:.1f}x")
+
+
+def benchmark_statement_text(pages: int = 200, lines_per_page: int = 50):
+    """One pass of the combined line pattern against the per-layout pattern scans"""
+    import re
+    from app.ai.document_processor import DocumentProcessor, TRANSACTION_LINE_PATTERN
+
+    print(f"=== STATEMENT TEXT ({pages} pages x {lines_per_page} lines) ===")
+    processor = DocumentProcessor()
+    legacy_patterns = [
+        r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+?)\s+([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)',
+        r'([$]?\d{1,3}(?:,\d{3})*(?:\.\d{2})?)\s+(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+([^$]+)',
+    ]
+
+    corpus = []
+    for page in range(pages):
+        lines = [f"FIRST BANK STATEMENT  Page {page + 1}", "Date        Description                 Amount    Balance"]
+        for i in range(page * lines_per_page, (page + 1) * lines_per_page):
+            date = f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2023"
+            amount = f"{(i * 37) % 90000 / 100:,.2f}"
+            if i % 5 == 0:
+                lines.append(f"${amount} {date} DIRECT DEPOSIT PAYROLL {i % 40}")
+            elif i % 3 == 0:
+                lines.append(f"{date}  POS PURCHASE STORE #{i % 900}  ({amount})  {(i * 91) % 500000 / 100:,.2f}")
+            else:
+                lines.append(f"{date}  CARD PURCHASE MERCHANT {i % 5000}  ${amount}")
+        lines.append("In case of errors or questions about your electronic transfers, call us.")
+        corpus.append("\n".join(lines))
+
+    def legacy_scan():
+        return sum(
+            1 for text in corpus for pattern in legacy_patterns
+            for _ in re.finditer(pattern, text, re.IGNORECASE | re.MULTILINE)
+        )
+
+    def combined_scan():
+        return sum(1 for text in corpus for _ in TRANSACTION_LINE_PATTERN.finditer(text))
+
+    legacy_matches, legacy_time = _timed(legacy_scan)
+    combined_matches, combined_time = _timed(combined_scan)
+    transactions, extract_time = _timed(lambda: [t for text in corpus for t in processor._extract_from_text(text)])
+
+    print(f"Per-layout scans: {legacy_time * 1000:.0f} ms ({legacy_matches} matches)")
+    print(f"Combined pattern: {combined_time * 1000:.0f} ms ({combined_matches} matches)")
+    print(f"Speedup:          {legacy_time / combined_time:.1f}x")
+    print(f"Full extraction:  {extract_time * 1000:.0f} ms ({len(transactions)} transactions)")
+
+
+def benchmark_event_loop(rows: int = 50000, tick: float = 0.01):
+    """Event loop stalls while a workbook is extracted inline versus on the worker pool"""
+    import pandas as pd
+    from app.ai.document_processor import DocumentProcessor, shutdown_extraction_pool
+
+    print(f"=== EVENT LOOP DURING EXTRACTION ({rows} row workbook) ===")
+    processor = DocumentProcessor()
+
+    with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as f:
+        xlsx_path = f.name
+    pd.DataFrame({
+        'Date': [f"{i % 12 + 1:02d}/{i % 28 + 1:02d}/2023" for i in range(rows)],
+        'Description': [f"MERCHANT {i % 5000} PURCHASE" for i in range(rows)],
+        'Amount': [(i * 37) % 90000 / 100 for i in range(rows)],
+    }).to_excel(xlsx_path, index=False)
+
+    async def measure(extract):
+        # A request handler that should wake every `tick` seconds
+        stalls = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(tick)
+                stalls.append(time.perf_counter() - start - tick)
+
+        ticker_task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)  # let the ticker start waiting
+        start = time.perf_counter()
+        transactions = await extract()
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ticker_task
+        return len(transactions), elapsed, max(stalls)
+
+    async def inline():
+        return processor._read_excel(xlsx_path)
+
+    async def pooled():
+        return await processor._process_excel(xlsx_path)
+
+    try:
+        asyncio.run(pooled())  # start the worker pool outside the measurement
+        inline_count, inline_time, inline_stall = asyncio.run(measure(inline))
+        pooled_count, pooled_time, pooled_stall = asyncio.run(measure(pooled))
+    finally:
+        os.unlink(xlsx_path)
+        shutdown_extraction_pool()
+
+    print(f"Inline:      {inline_time:.2f} s, longest loop stall {inline_stall * 1000:.0f} ms ({inline_count} transactions)")
+    print(f"Worker pool: {pooled_time:.2f} s, longest loop stall {pooled_stall * 1000:.0f} ms ({pooled_count} transactions)")
+
+
+BENCHMARKS = {
+    'learning': benchmark_learning,
+    'context': benchmark_context_match,
+    'csv': benchmark_csv_stream,
+    'dataframe': benchmark_dataframe,
+    'text': benchmark_statement_text,
+    'loop': benchmark_event_loop,
+}
+
+
+def main():
+    """Run the requested benchmarks"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (available: {', '.join(BENCHMARKS)})")
+            sys.exit(1)
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()